@@ -1,9 +1,10 @@
 # Add this import for models.Sum usage
-from django.db import models
+from django.db import models, transaction
 # Monkey-patch admin login view to use custom OTP login
 from django.urls import reverse
 from django.http import HttpResponseRedirect
 from django.utils.deprecation import MiddlewareMixin
+from django.contrib.admin.views.main import ChangeList
 from .admin_otp_login import admin_login_with_otp
 from django.contrib import admin as django_admin
 from django.contrib import admin as _adm
@@ -58,7 +59,6 @@ from django.contrib import admin
 from .models import AccessArea, GeofenceSettings
 from django.utils import timezone
 from django.contrib import messages
-from django.core.cache import cache
 from django.http import HttpResponseRedirect
 
 @admin.register(GeofenceSettings)
@@ -130,6 +130,11 @@ from .models import (
     EmployeeUpload,
 )
 
+from .navbar_stats import refresh_navbar_stats
+from .worksheet_rollup import forms_stock_usage, refresh_rollup_cells, rollup_keys_for
+from .attendance_summary import refresh_break_days
+from .payroll import mark_rows_stale, month_commission_due
+
 # Renewal alerts are now handled by context processor in context_processors_renewal.py
 
 
@@ -258,12 +263,25 @@ class ActiveEmployeesVisibilityFilter(admin.SimpleListFilter):
             'display': 'Inactive',
         }
 
+
+class EmployeeChangeList(ChangeList):
+    """Works out the page's commission-due figures together instead of per row."""
+
+    def get_results(self, request):
+        super().get_results(request)
+        now = timezone.now()
+        dues = month_commission_due([employee.pk for employee in self.result_list], now.year, now.month)
+        for employee in self.result_list:
+            employee._commission_due = dues[employee.pk]
+
+
 @admin.register(Employee)
 class EmployeeAdmin(admin.ModelAdmin):
     form = EmployeeAdminForm
     # --- 1. Display and Search Settings ---
     inlines = [SalaryPaymentInline, MonthlyDeductionInline, TrainingBonusInline, PerformanceBonusInline, ExtraDaysBonusInline]
-    list_display = ['profile_pic_thumbnail', 'employee_id', 'name', 'mobile_number', 'department', 'display_status']
+    list_display = ['profile_pic_thumbnail', 'employee_id', 'name', 'mobile_number', 'department', 'display_status',
+                    'commission_due']
     search_fields = ['name', 'mobile_number']
     list_filter = ['department', LockedEmployeesVisibilityFilter, ActiveEmployeesVisibilityFilter]
     change_list_template = "admin/employee_changelist.html"
@@ -386,25 +404,18 @@ class EmployeeAdmin(admin.ModelAdmin):
             f'{total:,.2f}'
         )
 
+    def get_changelist(self, request, **kwargs):
+        return EmployeeChangeList
+
     @admin.display(description='Commission Due (This Month)')
     def commission_due(self, obj):
         if not obj.pk:
             return '-'
-        from django.db.models import Sum
-        from django.utils import timezone
-        from decimal import Decimal
-        now = timezone.now()
-        earnings = obj.get_current_month_earnings(now.year, now.month)
-        total_earned = (
-            (earnings.get('worksheet_commissions') or Decimal('0')) +
-            (earnings.get('application_commissions') or Decimal('0'))
-        )
-        total_paid = obj.salary_payments.filter(
-            date__year=now.year,
-            date__month=now.month,
-            payment_type='commission',
-        ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-        due = total_earned - total_paid
+        due = getattr(obj, '_commission_due', None)
+        if due is None:
+            # The change form: just this employee
+            now = timezone.now()
+            due = month_commission_due([obj.pk], now.year, now.month)[obj.pk]
         color = 'green' if due > 0 else ('gray' if due == 0 else 'red')
         return format_html(
             '<strong style="font-size:1.1em; color:{};">₹{}</strong>',
@@ -490,7 +501,7 @@ class EmployeeAdmin(admin.ModelAdmin):
 
                 if month_str:
                     year, month = map(int, month_str.split('-'))
-                    qs = Worksheet.objects.filter(
+                    qs = WorksheetRollup.objects.filter(
                         employee=employee,
                         date__year=year,
                         date__month=month,
@@ -544,7 +555,7 @@ class EmployeeAdmin(admin.ModelAdmin):
         try:
             year, month = map(int, month_str.split('-'))
             worksheet_totals = (
-                Worksheet.objects.filter(date__year=year, date__month=month)
+                WorksheetRollup.objects.filter(date__year=year, date__month=month)
                 .exclude(employee__worksheet_hidden=True)
                 .values('employee_id')
                 .annotate(total_amount=Sum('amount'))
@@ -595,51 +606,76 @@ class EmployeeAdmin(admin.ModelAdmin):
             total_wage = Decimal('0.00')
             max_daily_wage = Decimal('0.00') # Initialize
             working_day_count = 0
+            all_employee_rows = []
+            all_employees = list(Employee.objects.all())
 
-            if employee_id:
+            if employee_id and employee_id != 'all':
                 try:
                     selected_employee = Employee.objects.get(pk=employee_id)
                 except (Employee.DoesNotExist, ValueError):
                     pass
 
+            def annotate_remarks(employee, daily_summary_dicts):
+                employee_start_time = employee.working_start_time or datetime.strptime("23:59", "%H:%M").time()
+                days_worked = 0
+                late_logins = 0
+                for record_dict in daily_summary_dicts:
+                    login_datetime = record_dict.get('login_time')
+                    record_dict['remark'] = ''
+                    if login_datetime:
+                        login_time_only = login_datetime.time()
+                        if login_time_only > employee_start_time:
+                            record_dict['remark'] = 'Late Login'
+                            late_logins += 1
+                    if record_dict.get('login_time') and record_dict.get('logout_time'):
+                        days_worked += 1
+                return days_worked, late_logins
+
             if selected_employee and month_str:
                 try:
                     year, month = map(int, month_str.split('-'))
                     
                     # 1. CORRECTLY UNPACK THE THREE VALUES
                     daily_summary_dicts, total_wage, max_daily_wage = selected_employee.get_daily_attendance_summary(year, month)
-                    
-                    employee_start_time = selected_employee.working_start_time or datetime.strptime("23:59", "%H:%M").time()
-                    processed_summary = []
-                    for record_dict in daily_summary_dicts:
-                        login_datetime = record_dict.get('login_time')
-                        record_dict['remark'] = ''
-                        if login_datetime:
-                            login_time_only = login_datetime.time()
-                            if login_time_only > employee_start_time:
-                                record_dict['remark'] = 'Late Login'
-                        if record_dict.get('login_time') and record_dict.get('logout_time'):
-                            working_day_count += 1
-                        processed_summary.append(record_dict)
-                    
-                    daily_summary = processed_summary
+                    working_day_count, _ = annotate_remarks(selected_employee, daily_summary_dicts)
+                    daily_summary = daily_summary_dicts
 
                 except ValueError as e:
                     # 2. PROVIDE A HELPFUL ERROR MESSAGE INSTEAD OF FAILING SILENTLY
                     self.message_user(request, f"An error occurred: {e}. Please check the data and try again.", level=messages.ERROR)
                 except Exception as e:
                     self.message_user(request, f"An unexpected error occurred: {e}", level=messages.ERROR)
+            elif employee_id == 'all' and month_str:
+                # Every employee's month from stored daily summaries plus at most two session queries
+                from .attendance_summary import summarized_month_attendance_for_employees
+                try:
+                    year, month = map(int, month_str.split('-'))
+                    summaries = summarized_month_attendance_for_employees(all_employees, year, month)
+                    for emp in all_employees:
+                        daily_summary_dicts, emp_total_wage, emp_daily_wage = summaries[emp.pk]
+                        days_worked, late_logins = annotate_remarks(emp, daily_summary_dicts)
+                        all_employee_rows.append({
+                            'employee': emp,
+                            'working_day_count': days_worked,
+                            'late_login_count': late_logins,
+                            'max_daily_wage': emp_daily_wage,
+                            'total_monthly_wage': emp_total_wage,
+                        })
+                        total_wage += emp_total_wage
+                except ValueError as e:
+                    self.message_user(request, f"An error occurred: {e}. Please check the data and try again.", level=messages.ERROR)
             
             context = {
                 **self.admin_site.each_context(request),
                 'title': 'Monthly Attendance Report',
-                'all_employees': Employee.objects.all(),
+                'all_employees': all_employees,
                 'selected_employee': selected_employee,
                 'selected_month_str': month_str,
                 'daily_summary_records': daily_summary,
                 'total_monthly_wage': total_wage,
                 'working_day_count': working_day_count,
                 'max_daily_wage': max_daily_wage, # Pass the new value to the template
+                'all_employee_rows': all_employee_rows,
             }
             return render(request, 'admin/attendance_report.html', context)
 
@@ -657,6 +693,8 @@ class EmployeeAdmin(admin.ModelAdmin):
         attended_trainings = []
         performance_bonuses = []
         extra_days_bonuses = []
+        all_employee_rows = []
+        payroll_totals = {}
         
         all_employees = Employee.objects.all().order_by('name')
 
@@ -680,11 +718,40 @@ class EmployeeAdmin(admin.ModelAdmin):
             year, month = now.year, now.month
         
         selected_date_object = date(year, month, 1)
-        
-        if employee_id:
+        payroll_snapshot = None
+
+        if request.method == 'POST' and request.POST.get('action') == 'close_month':
+            from django.http import HttpResponseRedirect
+            from .payroll import close_payroll_month
+            try:
+                closed = close_payroll_month(year, month, closed_by=request.user)
+                self.message_user(request, f"Closed {year}-{month:02d}: {closed} payroll snapshot(s) written.")
+            except ValueError as e:
+                self.message_user(request, str(e), level=messages.ERROR)
+            return HttpResponseRedirect(request.get_full_path())
+
+        if employee_id == 'all':
+            # Closed months read their snapshots; the rest use one grouped query per component
+            from .payroll import BONUS_COMPONENTS, month_earnings_for_employees
+            payroll = month_earnings_for_employees(all_employees, year, month)
+            all_employee_rows = [
+                {
+                    'employee': emp,
+                    'snapshot': payroll[emp.pk][1],
+                    'bonuses': sum(payroll[emp.pk][0][name] for name in BONUS_COMPONENTS),
+                    **payroll[emp.pk][0],
+                }
+                for emp in all_employees
+            ]
+            payroll_totals = {
+                key: sum((row[key] for row in all_employee_rows), Decimal('0.00'))
+                for key in ('attendance_salary', 'deduction_amount', 'total_earnings')
+            }
+        elif employee_id:
             try:
                 selected_employee = Employee.objects.get(pk=employee_id)
-                earnings_data = selected_employee.get_current_month_earnings(year, month)
+                from .payroll import get_month_earnings
+                earnings_data, payroll_snapshot = get_month_earnings(selected_employee, year, month)
                 
                 attended_meetings = MeetingAttendance.objects.filter(
                     employee=selected_employee, attended=True,
@@ -706,7 +773,6 @@ class EmployeeAdmin(admin.ModelAdmin):
 
             except Employee.DoesNotExist:
                 pass
-
         # Generate list of years for dropdown (from 2020 to current year + 1)
         current_year = timezone.now().year
         available_years = list(range(2020, current_year + 2))
@@ -726,6 +792,10 @@ class EmployeeAdmin(admin.ModelAdmin):
             'attended_trainings': attended_trainings,
             'performance_bonuses': performance_bonuses,
             'extra_days_bonuses': extra_days_bonuses,
+            'all_employee_rows': all_employee_rows,
+            'payroll_totals': payroll_totals,
+            'payroll_snapshot': payroll_snapshot,
+            'month_can_be_closed': (year, month) < (timezone.localdate().year, timezone.localdate().month),
         }
         return render(request, 'admin/salary_report.html', context)
 
@@ -744,7 +814,22 @@ from django.contrib import admin
 from django.urls import path
 from django.shortcuts import render
 from django.db.models import Sum
-from .models import Worksheet, Employee
+from .models import Worksheet, WorksheetRollup, Employee, PayrollSnapshot
+
+
+@admin.register(PayrollSnapshot)
+class PayrollSnapshotAdmin(admin.ModelAdmin):
+    """Closed-month payroll figures. Written only by closing a month from the salary report."""
+    list_display = ('employee', 'year', 'month', 'version', 'total_earnings', 'closed_at', 'closed_by', 'is_stale')
+    list_filter = ('year', 'month', 'is_stale')
+    search_fields = ['employee__name']
+    readonly_fields = [field.name for field in PayrollSnapshot._meta.fields]
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
 
 
 @admin.register(Worksheet)
@@ -788,7 +873,16 @@ class WorksheetAdmin(ExcludeLockedEmployeesMixin, admin.ModelAdmin):
         """
         Bulk action to approve selected worksheets.
         """
-        updated_count = queryset.update(approved=True)
+        rows = list(queryset.values_list('employee_id', 'date'))
+        employee_ids = {employee_id for employee_id, _ in rows}
+        # queryset.update() sends no post_save, so refresh the rollup, navbar
+        # and closed-month payroll figures here
+        cells = rollup_keys_for(queryset)
+        with transaction.atomic():
+            updated_count = queryset.update(approved=True)
+            refresh_rollup_cells(cells)
+            mark_rows_stale(rows, "Worksheet")
+        refresh_navbar_stats(employee_ids, 'worksheet_commission')
         self.message_user(
             request,
             f"{updated_count} worksheet(s) successfully approved.",
@@ -934,7 +1028,6 @@ class AllowedIPAdmin(admin.ModelAdmin):
             description='GLOBAL_ALLOW_ALL',
             defaults={'ip_address': '0.0.0.0/0', 'is_active': True}
         )
-        cache.clear()
         self.message_user(request, "Success: IP restrictions are globally DISABLED. All IPs are now allowed.", messages.SUCCESS)
         return HttpResponseRedirect("../")
 
@@ -944,20 +1037,14 @@ class AllowedIPAdmin(admin.ModelAdmin):
             description='GLOBAL_BLOCK',
             defaults={'ip_address': '0.0.0.0/0', 'is_active': True}
         )
-        cache.clear() 
         self.message_user(request, "CRITICAL: IP restrictions are globally ENABLED. ALL IPs are now blocked.", messages.ERROR)
         return HttpResponseRedirect("../")
 
     def enforce_ip_list(self, request):
         AllowedIP.objects.filter(description__in=['GLOBAL_ALLOW_ALL', 'GLOBAL_BLOCK']).delete()
-        cache.clear() 
         self.message_user(request, "Success: Global overrides have been removed. Access is now determined by your IP list.", messages.WARNING)
         return HttpResponseRedirect("../")
 
-    def save_model(self, request, obj, form, change):
-        super().save_model(request, obj, form, change)
-        cache.clear()
-    
 
 @admin.register(UploadService)
 class UploadServiceAdmin(admin.ModelAdmin):
@@ -973,6 +1060,7 @@ class EmployeeUploadAdmin(ExcludeLockedEmployeesMixin, admin.ModelAdmin):
     search_fields = ('employee__name', 'service__name', 'description', 'mobile_number')
     readonly_fields = ('uploaded_at',)
     date_hierarchy = 'uploaded_at'
+    list_per_page = 50
     fields = ('employee', 'service', 'description', 'file', 'uploaded_at', 'renewal_date', 'mobile_number')
 
     def short_description(self, obj):
@@ -1124,7 +1212,13 @@ class ApplicationAdmin(admin.ModelAdmin):
     get_service_type_name.admin_order_field = 'service_type__name'
 
     def approve_applications(self, request, queryset):
+        rows = list(
+            ApplicationAssignment.objects.filter(application__in=queryset)
+            .values_list('employee_id', 'application__date_created')
+        )
         queryset.update(approved=True)
+        mark_rows_stale(rows, "Application")
+        refresh_navbar_stats({employee_id for employee_id, _ in rows}, 'application_commission')
         self.message_user(request, "Selected applications have been approved.")
     approve_applications.short_description = "Approve selected applications"
 
@@ -1224,7 +1318,10 @@ class BreakSessionAdmin(admin.ModelAdmin):
         'approved' field to True.
         """
         # Perform the bulk update
+        breaks = list(queryset.values_list('pk', 'employee_id', 'start_time'))
         rows_updated = queryset.update(approved=True)
+        refresh_break_days([pk for pk, _, _ in breaks])
+        mark_rows_stale([(employee_id, start_time) for _, employee_id, start_time in breaks], "Break session")
         
         # Display a success message to the admin user
         self.message_user(request, f'{rows_updated} break session(s) were successfully approved.')
@@ -1392,19 +1489,14 @@ class DepartmentAdmin(admin.ModelAdmin):
             except ValueError:
                 stock_date = timezone.localtime(timezone.now()).date()
             if is_forms_dept:
+                day_usage = forms_stock_usage(stock_date)
                 for st in dept_service_types:
                     stock_obj, _ = DepartmentStock.objects.get_or_create(
                         department=department,
                         service_type=st,
                         defaults={'quantity': 0, 'price': st.amount},
                     )
-                    day_qs = Worksheet.objects.filter(
-                        department_name='Forms',
-                        service=st.name,
-                        date=stock_date,
-                    )
-                    used_count = day_qs.aggregate(total=Sum('stocks_used'))['total'] or 0
-                    total_amount = day_qs.aggregate(total=Sum('amount'))['total'] or 0
+                    used_count, total_amount = day_usage.get(st.name, (0, 0))
                     remaining = max(0, stock_obj.quantity - used_count)
                     price = stock_obj.price
                     total_cost = Decimal(str(stock_obj.quantity)) * price
@@ -1,23 +1,58 @@
 from django.contrib.auth import authenticate, login, get_user_model
 from django.shortcuts import render, redirect
 from django.contrib import messages
+from django.core.cache import cache
 from management.utils import generate_otp, send_otp_whatsapp
 from management.models import UserProfile
 
 
+ADMIN_SESSION_CACHE_KEY = 'admin_active_session_key_{user_id}'
+# The cache is per process; a superseded device is cut off everywhere by
+# deleting its session (see _enforce_admin_single_session), so an entry
+# another worker holds only needs to age out eventually
+ADMIN_SESSION_CACHE_TIMEOUT = 60
+
+
+def cache_admin_session_key(user_id, session_key):
+    """Remember `session_key` as the admin's only valid session ('' means none)."""
+    cache.set(ADMIN_SESSION_CACHE_KEY.format(user_id=user_id), session_key or '', ADMIN_SESSION_CACHE_TIMEOUT)
+
+
+def get_admin_session_key(user_id):
+    """
+    Return the session key of the admin's active session, reading
+    AdminActiveSession only when the cache has no entry for this admin.
+    """
+    from management.models import AdminActiveSession
+    session_key = cache.get(ADMIN_SESSION_CACHE_KEY.format(user_id=user_id))
+    if session_key is None:
+        session_key = (
+            AdminActiveSession.objects.filter(user_id=user_id)
+            .values_list('session_key', flat=True)
+            .first()
+        ) or ''
+        cache_admin_session_key(user_id, session_key)
+    return session_key
+
+
 def _enforce_admin_single_session(user, request):
     """
-    Store the current session key as the only valid session for this admin.
-    The AdminSingleDeviceMiddleware will kick out any other device on their
-    next request by comparing session keys.
+    Store the current session key as the only valid session for this admin
+    and delete the session it replaces. The previous device's next request
+    then loads no session in any worker, whatever that worker's cache still
+    says; in this one AdminSingleDeviceMiddleware also compares session keys.
     """
     from management.models import AdminActiveSession
+    previous_key = AdminActiveSession.objects.filter(user=user).values_list('session_key', flat=True).first()
     # Make sure the session is saved to DB so its key is finalised
     request.session.save()
     AdminActiveSession.objects.update_or_create(
         user=user,
         defaults={'session_key': request.session.session_key},
     )
+    if previous_key and previous_key != request.session.session_key:
+        request.session.delete(previous_key)
+    cache_admin_session_key(user.pk, request.session.session_key)
 
 
 def admin_login_with_otp(request):
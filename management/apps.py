@@ -1,5 +1,38 @@
+import os
+import sys
+
 from django.apps import AppConfig
 
+
+SERVER_PROGRAMS = ('gunicorn', 'uvicorn')
+
+
+def _serves_requests():
+    """
+    True only for server processes: gunicorn/uvicorn workers and
+    ``manage.py runserver``. Everything else (manage.py commands, the test
+    runner, pytest, celery, one-off scripts) must not run the scheduled
+    jobs or flush buffers, possibly against a test database.
+
+    SITARI_RUN_SCHEDULER=1 or 0 overrides the detection, e.g. for a server
+    started some other way.
+    """
+    flag = os.environ.get('SITARI_RUN_SCHEDULER', '').strip().lower()
+    if flag:
+        return flag in ('1', 'true', 'yes', 'on')
+    if not sys.argv:
+        return False
+    program = os.path.basename(sys.argv[0])
+    if program == '__main__.py':
+        # python -m gunicorn / python -m uvicorn
+        program = os.path.basename(os.path.dirname(sys.argv[0]))
+    if program in SERVER_PROGRAMS:
+        return True
+    if program in ('manage.py', 'django-admin'):
+        return len(sys.argv) > 1 and sys.argv[1] == 'runserver'
+    return False
+
+
 class ManagementConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'management'
@@ -10,24 +43,110 @@ class ManagementConfig(AppConfig):
             return
         self.scheduler_started = True
 
+        if _serves_requests():
+            self._start_scheduler()
+        self._connect_signals()
+
+    def _start_scheduler(self):
         from apscheduler.schedulers.background import BackgroundScheduler
+        from datetime import timedelta
+        from django.conf import settings
+        from . import attendance_summary
+        from . import heartbeats
+        from . import renewal_digest
+        from . import request_metrics
         from . import stale_cleanup
+        from . import utils
+        from .scheduler_lock import leader_only
         import atexit
 
+        # Every process runs this scheduler; the leases make each firing run
+        # in only one of them. Daily jobs hold theirs long enough to cover
+        # workers whose clocks fire a little late.
         scheduler = BackgroundScheduler()
         scheduler.add_job(
-            stale_cleanup.close_stale_sessions,
+            leader_only('close_stale_sessions', timedelta(seconds=50))(stale_cleanup.close_stale_sessions),
             'interval',
             minutes=1,  # Run every 1 minute
             id="close_stale_sessions",
             replace_existing=True,
         )
+        scheduler.add_job(
+            leader_only('auto_mark_next_day_availability', timedelta(hours=1))(utils.auto_mark_next_day_availability),
+            'cron',
+            hour=getattr(settings, 'EMPLOYEE_NEXT_DAY_ALERT_END_HOUR', 17),
+            minute=0,
+            timezone=settings.TIME_ZONE,
+            misfire_grace_time=60 * 60,
+            id="auto_mark_next_day_availability",
+            replace_existing=True,
+        )
+        scheduler.add_job(
+            leader_only('refresh_renewal_digest', timedelta(hours=1))(renewal_digest.refresh_renewal_digest),
+            'cron',
+            hour=0,
+            minute=5,
+            timezone=settings.TIME_ZONE,
+            misfire_grace_time=60 * 60,
+            id="refresh_renewal_digest",
+            replace_existing=True,
+        )
+        scheduler.add_job(
+            leader_only('materialize_previous_day', timedelta(hours=1))(attendance_summary.materialize_previous_day),
+            'cron',
+            hour=0,
+            minute=10,
+            timezone=settings.TIME_ZONE,
+            misfire_grace_time=60 * 60,
+            id="materialize_previous_day",
+            replace_existing=True,
+        )
+        # Not leased: each process flushes its own heartbeat buffer
+        scheduler.add_job(
+            heartbeats.flush_heartbeats,
+            'interval',
+            seconds=getattr(settings, 'HEARTBEAT_FLUSH_SECONDS', 30),
+            id="flush_heartbeats",
+            replace_existing=True,
+        )
+        # Not leased: each process flushes its own request metrics buffer
+        scheduler.add_job(
+            request_metrics.recorder.flush,
+            'interval',
+            seconds=getattr(settings, 'REQUEST_METRICS_FLUSH_SECONDS', 10),
+            id="flush_request_metrics",
+            replace_existing=True,
+        )
         scheduler.start()
         atexit.register(lambda: scheduler.shutdown())
+        atexit.register(heartbeats.flush_heartbeats)
+        atexit.register(request_metrics.recorder.flush)
 
+    def _connect_signals(self):
         # Import auditlog signal handlers for IP logging
         import management.auditlog_signals
         import management.auditlog_auth_signals
+        # Bumps the IP allow-list version on AllowedIP saves/deletes
+        import management.ip_restriction
+        # Rebuilds the working-day calendar on Holiday saves/deletes and
+        # drops cached next-day answers on EmployeeNextDayAvailability changes
+        import management.utils
+        # Keeps EmployeeNavbarStats in step with the rows behind each figure
+        import management.navbar_stats
+        # Drops today's renewal digest when an EmployeeUpload changes
+        import management.renewal_digest
+        # Rewrites DailyAttendanceSummary rows as sessions close and breaks change
+        import management.attendance_summary
+        # Keeps the presence registry in step as attendance sessions open and close
+        import management.attendance_registry
+        # Re-aggregates WorksheetRollup cells as worksheet entries change
+        import management.worksheet_rollup
+        # Marks closed-month PayrollSnapshots stale when their input rows change
+        import management.payroll
+        # Installs the FTS5 search indexes and their sync triggers after migrate
+        import management.search
+        # Re-links Customer index rows as tokens, worksheets, uploads, applications and TTD bookings change
+        import management.customers
 
         # Register models with auditlog for tracking
         from auditlog.registry import auditlog
@@ -40,7 +159,12 @@ class ManagementConfig(AppConfig):
         for name, obj in inspect.getmembers(models):
             if inspect.isclass(obj) and issubclass(obj, models.models.Model) and obj.__module__ == models.__name__:
                 model_classes.append(obj)
+        # Derived tables rewritten by the app itself aren't worth an audit trail
+        excluded_models = {models.EmployeeNavbarStats, models.RenewalDigest, models.DailyAttendanceSummary,
+                           models.PayrollSnapshot, models.SchedulerLock, models.WorksheetRollup,
+                           models.Customer, models.CustomerRecord, models.TokenSequence}
         for model in model_classes:
-            auditlog.register(model)
+            if model not in excluded_models:
+                auditlog.register(model)
 
 
@@ -0,0 +1,265 @@
+"""
+Month attendance/wage computation behind Employee.get_daily_attendance_summary.
+
+Sessions and breaks are localised and bucketed by local date in one pass
+and all interval arithmetic runs on integer epoch microseconds, so a month
+costs O(days + sessions) instead of rescanning every session for every day.
+The original per-day implementation lives on in attendance_engine_reference
+as the reference for the parity tests and benchmark_attendance_engine.
+"""
+from calendar import monthrange
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+
+from django.utils import timezone
+
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+ONE_MICROSECOND = timedelta(microseconds=1)
+MICROSECONDS = 10 ** 6
+
+
+def _us(value):
+    return (value - EPOCH) // ONE_MICROSECOND
+
+
+def _seconds(microseconds):
+    # Same float timedelta.total_seconds() returns for this span
+    return microseconds / MICROSECONDS
+
+
+def _work_hours(employee):
+    return employee.working_start_time or time(9, 0), employee.working_end_time or time(17, 0)
+
+
+def _base_daily_wage(employee, days_in_month):
+    if employee.salary and days_in_month > 0:
+        return employee.salary / Decimal(days_in_month)
+    return Decimal('0.00')
+
+
+def _daily_wage(base_daily_wage, total_active_seconds, wage_target_seconds):
+    capped_active_seconds = min(total_active_seconds, wage_target_seconds)
+    daily_wage = Decimal('0.00')
+    if wage_target_seconds > 0:
+        work_ratio = Decimal(capped_active_seconds) / Decimal(wage_target_seconds)
+        daily_wage = base_daily_wage * work_ratio
+        daily_wage = max(Decimal('0.00'), daily_wage)
+    return daily_wage
+
+
+def _break_details(day_breaks):
+    break_details = []
+    for b in day_breaks:
+        duration_str = "Ongoing"
+        if b.end_time:
+            td = b.end_time - b.start_time
+            h, rem = divmod(td.total_seconds(), 3600)
+            m, _ = divmod(rem, 60)
+            duration_str = f"{int(h)}h {int(m)}m"
+        break_details.append({
+            'timings': f"{timezone.localtime(b.start_time).strftime('%I:%M %p')} - {timezone.localtime(b.end_time).strftime('%I:%M %p') if b.end_time else 'Active'}",
+            'reason': b.logout_reason, 'duration': duration_str, 'approved': b.approved
+        })
+    return break_details
+
+
+def _duration_label(total_active_seconds):
+    h, rem = divmod(total_active_seconds, 3600)
+    m, _ = divmod(rem, 60)
+    return f"{int(h)}h {int(m)}m"
+
+
+def bucket_by_local_date(sessions, breaks):
+    """
+    Localise each session and break once and group them by local date as
+    (login_us, logout_us, expires_us, session) / (start_us, end_us, break).
+    """
+    sessions_by_date = {}
+    for s in sessions:
+        sessions_by_date.setdefault(timezone.localtime(s.login_time).date(), []).append((
+            _us(s.login_time),
+            _us(s.logout_time) if s.logout_time else None,
+            _us(s.session_expires_at) if s.session_expires_at else None,
+            s,
+        ))
+    breaks_by_date = {}
+    for b in breaks:
+        breaks_by_date.setdefault(timezone.localtime(b.start_time).date(), []).append((
+            _us(b.start_time),
+            _us(b.end_time) if b.end_time else None,
+            b,
+        ))
+    return sessions_by_date, breaks_by_date
+
+
+def _work_window_us(current_date, start_work_time, end_work_time):
+    return (
+        _us(timezone.make_aware(datetime.combine(current_date, start_work_time))),
+        _us(timezone.make_aware(datetime.combine(current_date, end_work_time))),
+    )
+
+
+def wage_target_seconds(current_date, start_work_time, end_work_time):
+    work_start_us, work_end_us = _work_window_us(current_date, start_work_time, end_work_time)
+    target = _seconds(work_end_us - work_start_us) - (2 * 3600)
+    if target <= 0:
+        target = _seconds(work_end_us - work_start_us)
+    return target
+
+
+def compute_day(current_date, start_work_time, end_work_time, day_sessions, day_breaks):
+    """
+    One day's attendance from that day's bucketed rows: chosen login/logout,
+    merged in-hours work seconds, approved break seconds and the breaks shown.
+    """
+    work_start_us, work_end_us = _work_window_us(current_date, start_work_time, end_work_time)
+
+    day_attendance = [row for row in day_sessions if row[0] < work_end_us]
+
+    login_time = None
+    logout_time = None
+    if day_attendance:
+        after_start = [row for row in day_attendance if row[0] >= work_start_us]
+        login_time = min(after_start or day_attendance, key=lambda row: row[0])[3].login_time
+
+        logouts = [row for row in day_attendance if row[1] is not None and row[1] <= work_end_us]
+        if logouts:
+            logout_time = max(logouts, key=lambda row: row[1])[3].logout_time
+        else:
+            expiries = [row for row in day_attendance if row[2] is not None]
+            if expiries:
+                logout_time = max(expiries, key=lambda row: row[2])[3].session_expires_at
+
+    shown_breaks = [
+        row for row in day_breaks
+        if row[0] < work_end_us and (row[1] if row[1] is not None else work_end_us) > work_start_us
+    ]
+
+    work_seconds = 0
+    approved_break_seconds = 0
+    if day_attendance:
+        intervals = []
+        for login_us, logout_us, expires_us, _ in day_attendance:
+            session_end_us = logout_us if logout_us is not None else (
+                expires_us if expires_us is not None else work_end_us
+            )
+            overlap_start = max(login_us, work_start_us)
+            overlap_end = min(session_end_us, work_end_us)
+            if overlap_end > overlap_start:
+                intervals.append((overlap_start, overlap_end))
+        intervals.sort()
+        merged = []
+        for start, end in intervals:
+            if not merged or start > merged[-1][1]:
+                merged.append([start, end])
+            else:
+                merged[-1][1] = max(merged[-1][1], end)
+        # Summed per interval, in order, to reproduce the legacy float totals exactly
+        work_seconds = sum(_seconds(end - start) for start, end in merged)
+
+        for start_us, end_us, b in shown_breaks:
+            if b.approved and end_us is not None:
+                overlap_start = max(start_us, work_start_us)
+                overlap_end = min(end_us, work_end_us)
+                if overlap_end > overlap_start:
+                    approved_break_seconds += _seconds(overlap_end - overlap_start)
+
+    return {
+        'has_attendance': bool(day_attendance),
+        'login_time': login_time,
+        'logout_time': logout_time,
+        'work_seconds': work_seconds,
+        'approved_break_seconds': approved_break_seconds,
+        'break_sessions': _break_details([row[2] for row in shown_breaks]),
+    }
+
+
+def day_record(day_number, current_date, day, base_daily_wage, target_seconds):
+    """
+    Turn a compute_day() result (or an equivalent stored summary) into the
+    record dict and the unrounded wage for that day.
+    """
+    total_active_seconds = 0
+    if day['has_attendance']:
+        total_active_seconds = day['work_seconds'] + day['approved_break_seconds']
+    daily_wage = _daily_wage(base_daily_wage, total_active_seconds, target_seconds)
+    record = {
+        'sl_no': day_number,
+        'date': current_date,
+        'login_time': timezone.localtime(day['login_time']) if day['login_time'] else None,
+        'logout_time': timezone.localtime(day['logout_time']) if day['logout_time'] else None,
+        'break_sessions': day['break_sessions'],
+        'total_duration': _duration_label(total_active_seconds),
+        'daily_wage': round(daily_wage, 2),
+    }
+    return record, daily_wage
+
+
+def month_attendance(employee, year, month, sessions, breaks, stored_days=None):
+    """
+    Return (daily_records, total_monthly_wage, base_daily_wage) for the
+    month from the employee's already-fetched AttendanceSession and
+    BreakSession rows (same filters and ordering the model method uses).
+    `stored_days` maps dates to precomputed compute_day() results, which
+    are used instead of the rows for those dates.
+    """
+    days_in_month = monthrange(year, month)[1]
+    start_work_time, end_work_time = _work_hours(employee)
+    base_daily_wage = _base_daily_wage(employee, days_in_month)
+    sessions_by_date, breaks_by_date = bucket_by_local_date(sessions, breaks)
+    stored_days = stored_days or {}
+
+    daily_records = []
+    total_monthly_wage = Decimal('0.00')
+    for day_number in range(1, days_in_month + 1):
+        current_date = datetime(year, month, day_number).date()
+        day = stored_days.get(current_date)
+        if day is None:
+            day = compute_day(
+                current_date, start_work_time, end_work_time,
+                sessions_by_date.get(current_date, ()), breaks_by_date.get(current_date, ()),
+            )
+        record, daily_wage = day_record(
+            day_number, current_date, day, base_daily_wage,
+            wage_target_seconds(current_date, start_work_time, end_work_time),
+        )
+        total_monthly_wage += daily_wage
+        daily_records.append(record)
+
+    return daily_records, round(total_monthly_wage, 2), round(base_daily_wage, 2)
+
+
+def month_attendance_for_employees(employees, year, month):
+    """
+    month_attendance for many employees with exactly two queries: every
+    matching AttendanceSession and BreakSession row for the month is fetched
+    once and partitioned by employee in memory.
+    Returns {employee_id: (daily_records, total_monthly_wage, base_daily_wage)}.
+    """
+    from .models import AttendanceSession, BreakSession
+
+    employees = list(employees)
+    employee_ids = [employee.pk for employee in employees]
+    sessions_by_employee = {employee_id: [] for employee_id in employee_ids}
+    breaks_by_employee = {employee_id: [] for employee_id in employee_ids}
+
+    for session in AttendanceSession.objects.filter(
+        employee_id__in=employee_ids,
+        login_time__year=year,
+        login_time__month=month,
+        session_status__in=["active", "refreshed", "ended"]
+    ).order_by('login_time'):
+        sessions_by_employee[session.employee_id].append(session)
+
+    for break_session in BreakSession.objects.filter(
+        employee_id__in=employee_ids, start_time__year=year, start_time__month=month
+    ).order_by('start_time'):
+        breaks_by_employee[break_session.employee_id].append(break_session)
+
+    return {
+        employee.pk: month_attendance(
+            employee, year, month, sessions_by_employee[employee.pk], breaks_by_employee[employee.pk]
+        )
+        for employee in employees
+    }
@@ -0,0 +1,106 @@
+"""
+The original per-day month attendance loop, kept out of attendance_engine
+as the reference the parity tests and benchmark_attendance_engine check
+month_attendance against. Nothing in the request path uses it.
+"""
+from calendar import monthrange
+from datetime import datetime
+from decimal import Decimal
+
+from django.utils import timezone
+
+from .attendance_engine import _base_daily_wage, _break_details, _daily_wage, _duration_label, _work_hours
+
+
+def legacy_month_attendance(employee, year, month, sessions, breaks):
+    """The original day-by-day month_attendance."""
+    days_in_month = monthrange(year, month)[1]
+    daily_records = []
+    total_monthly_wage = Decimal('0.00')
+
+    start_work_time, end_work_time = _work_hours(employee)
+    base_daily_wage = _base_daily_wage(employee, days_in_month)
+
+    for day in range(1, days_in_month + 1):
+        current_date = datetime(year, month, day).date()
+        work_start_datetime = timezone.make_aware(datetime.combine(current_date, start_work_time))
+        work_end_datetime = timezone.make_aware(datetime.combine(current_date, end_work_time))
+
+        day_attendance = [
+            s for s in sessions
+            if timezone.localtime(s.login_time).date() == current_date and s.login_time < work_end_datetime
+        ]
+
+        login_time = None
+        if day_attendance:
+            login_candidates = [s.login_time for s in day_attendance if s.login_time >= work_start_datetime]
+            if login_candidates:
+                login_time = min(login_candidates)
+            else:
+                login_time = min(s.login_time for s in day_attendance)
+
+        logout_time = None
+        if day_attendance:
+            logout_candidates = [s.logout_time for s in day_attendance if s.logout_time and s.logout_time <= work_end_datetime]
+            if logout_candidates:
+                logout_time = max(logout_candidates)
+            else:
+                session_ends = [s.session_expires_at for s in day_attendance if s.session_expires_at]
+                if session_ends:
+                    logout_time = max(session_ends)
+                else:
+                    logout_time = None
+
+        day_breaks = []
+        for b in breaks:
+            if timezone.localtime(b.start_time).date() == current_date:
+                break_end = b.end_time or work_end_datetime
+                if b.start_time < work_end_datetime and break_end > work_start_datetime:
+                    day_breaks.append(b)
+
+        total_active_seconds = 0
+        if day_attendance:
+            intervals = []
+            for s in day_attendance:
+                session_end = s.logout_time or s.session_expires_at or work_end_datetime
+                overlap_start = max(s.login_time, work_start_datetime)
+                overlap_end = min(session_end, work_end_datetime)
+                if overlap_end > overlap_start:
+                    intervals.append((overlap_start, overlap_end))
+            intervals.sort()
+            merged = []
+            for start, end in intervals:
+                if not merged or start > merged[-1][1]:
+                    merged.append([start, end])
+                else:
+                    merged[-1][1] = max(merged[-1][1], end)
+            work_seconds = sum((end - start).total_seconds() for start, end in merged)
+
+            approved_break_seconds = 0
+            for b in day_breaks:
+                if b.approved and b.end_time:
+                    overlap_start = max(b.start_time, work_start_datetime)
+                    overlap_end = min(b.end_time, work_end_datetime)
+                    if overlap_end > overlap_start:
+                        approved_break_seconds += (overlap_end - overlap_start).total_seconds()
+
+            total_active_seconds = work_seconds + approved_break_seconds
+
+        wage_target_seconds = (work_end_datetime - work_start_datetime).total_seconds() - (2 * 3600)
+        if wage_target_seconds <= 0:
+            wage_target_seconds = (work_end_datetime - work_start_datetime).total_seconds()
+
+        daily_wage = _daily_wage(base_daily_wage, total_active_seconds, wage_target_seconds)
+        total_monthly_wage += daily_wage
+
+        daily_records.append({
+            'sl_no': day,
+            'date': current_date,
+            'login_time': timezone.localtime(login_time) if login_time else None,
+            'logout_time': timezone.localtime(logout_time) if logout_time else None,
+            'break_sessions': _break_details(day_breaks),
+            'total_duration': _duration_label(total_active_seconds),
+            'daily_wage': round(daily_wage, 2),
+        })
+
+    return daily_records, round(total_monthly_wage, 2), round(base_daily_wage, 2)
@@ -0,0 +1,132 @@
+import threading
+
+from django.core.cache import cache
+from django.db.models import Min
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+
+ACTIVE_SESSION_CACHE_KEY = 'attendance_active_session_{employee_id}'
+# Kept short so a worker with a stale local cache falls back to the DB soon
+ACTIVE_SESSION_CACHE_TIMEOUT = 300
+NO_ACTIVE_SESSION = 0
+
+# Presence: {employee_id: online since} for every employee with an open session
+PRESENCE_CACHE_KEY = 'attendance_presence'
+PRESENCE_CACHE_TIMEOUT = 60
+_presence_lock = threading.Lock()
+
+
+def _cache_key(employee_id):
+    return ACTIVE_SESSION_CACHE_KEY.format(employee_id=employee_id)
+
+
+def get_active_attendance_session_id(employee_id):
+    """
+    Return the cached id of the employee's open AttendanceSession,
+    NO_ACTIVE_SESSION if none is open, or None when the registry has no entry.
+    """
+    return cache.get(_cache_key(employee_id))
+
+
+def set_active_attendance_session(employee_id, session_id):
+    """Record `session_id` as the employee's only open AttendanceSession."""
+    cache.set(_cache_key(employee_id), session_id or NO_ACTIVE_SESSION, ACTIVE_SESSION_CACHE_TIMEOUT)
+    if session_id:
+        mark_employee_online(employee_id)
+    else:
+        mark_employee_offline(employee_id)
+
+
+def clear_active_attendance_session(employee_id):
+    """Mark the employee as having no open AttendanceSession."""
+    set_active_attendance_session(employee_id, None)
+
+
+def forget_active_attendance_sessions(employee_ids):
+    """Drop registry entries so the next request re-reads the DB."""
+    cache.delete_many([_cache_key(employee_id) for employee_id in set(employee_ids)])
+    cache.delete(PRESENCE_CACHE_KEY)
+
+
+def _load_presence():
+    from .models import AttendanceSession
+
+    rows = (
+        AttendanceSession.objects.filter(logout_time__isnull=True)
+        .order_by()
+        .values('employee_id')
+        .annotate(since=Min('login_time'))
+    )
+    return {row['employee_id']: row['since'] for row in rows}
+
+
+def get_presence():
+    """
+    Return {employee_id: online since} for everyone with an open session.
+    One query per process every PRESENCE_CACHE_TIMEOUT seconds at most;
+    login, logout and ping keep this process's copy current in between.
+    """
+    presence = cache.get(PRESENCE_CACHE_KEY)
+    if presence is None:
+        presence = _load_presence()
+        cache.set(PRESENCE_CACHE_KEY, presence, PRESENCE_CACHE_TIMEOUT)
+    return presence
+
+
+def is_employee_online(employee_id):
+    return employee_id in get_presence()
+
+
+def mark_employee_online(employee_id, since=None):
+    """Add the employee to the presence map, keeping an earlier `since`."""
+    with _presence_lock:
+        presence = cache.get(PRESENCE_CACHE_KEY)
+        if presence is None or employee_id in presence:
+            # Nothing cached yet: the next read loads it from the DB
+            return
+        presence = {**presence, employee_id: since or timezone.now()}
+        cache.set(PRESENCE_CACHE_KEY, presence, PRESENCE_CACHE_TIMEOUT)
+
+
+def mark_employee_offline(employee_id):
+    with _presence_lock:
+        presence = cache.get(PRESENCE_CACHE_KEY)
+        if presence is None or employee_id not in presence:
+            return
+        presence = {key: value for key, value in presence.items() if key != employee_id}
+        cache.set(PRESENCE_CACHE_KEY, presence, PRESENCE_CACHE_TIMEOUT)
+
+
+def _refresh_employee_presence(employee_id):
+    """Re-read one employee's open sessions into the presence map after one of them closed."""
+    from .models import AttendanceSession
+
+    if employee_id not in (cache.get(PRESENCE_CACHE_KEY) or {}):
+        return
+    since = AttendanceSession.objects.filter(
+        employee_id=employee_id, logout_time__isnull=True,
+    ).aggregate(since=Min('login_time'))['since']
+    with _presence_lock:
+        presence = cache.get(PRESENCE_CACHE_KEY)
+        if presence is None:
+            return
+        presence = {key: value for key, value in presence.items() if key != employee_id}
+        if since is not None:
+            # Still online from another device
+            presence[employee_id] = since
+        cache.set(PRESENCE_CACHE_KEY, presence, PRESENCE_CACHE_TIMEOUT)
+
+
+@receiver(post_save, sender='management.AttendanceSession')
+def _attendance_session_presence(sender, instance, **kwargs):
+    if instance.logout_time is None:
+        mark_employee_online(instance.employee_id, instance.login_time)
+    else:
+        _refresh_employee_presence(instance.employee_id)
+
+
+@receiver(post_delete, sender='management.AttendanceSession')
+def _attendance_session_presence_deleted(sender, instance, **kwargs):
+    cache.delete(PRESENCE_CACHE_KEY)
@@ -0,0 +1,306 @@
+"""
+Materialized per-day attendance in DailyAttendanceSummary.
+
+A day is (re)computed with attendance_engine.compute_day whenever one of
+its sessions closes or one of its breaks ends or is approved, and
+materialize_previous_day sweeps every employee's yesterday each night.
+Month views then read stored rows for past days and only fetch raw
+sessions for the days still open (today, or days without a current row).
+
+Days with a session or break still open are never stored: their figures
+keep moving until it closes, which writes the row.
+"""
+from calendar import monthrange
+from datetime import datetime, time, timedelta
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .attendance_engine import (
+    _base_daily_wage, _work_hours, bucket_by_local_date, compute_day, day_record, month_attendance,
+    wage_target_seconds,
+)
+from .models import AttendanceSession, BreakSession, DailyAttendanceSummary, Employee
+
+
+# Same statuses Employee.get_daily_attendance_summary has always counted
+COUNTED_SESSION_STATUSES = ["active", "refreshed", "ended"]
+SUMMARY_UPDATE_FIELDS = [
+    'has_attendance', 'first_login', 'last_logout', 'work_seconds', 'approved_break_seconds',
+    'break_sessions', 'daily_wage', 'salary', 'working_start_time', 'working_end_time', 'computed_at',
+]
+
+
+def _today():
+    return timezone.localtime(timezone.now()).date()
+
+
+def _local_midnight(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+def _local_date(value):
+    return timezone.localtime(value).date()
+
+
+def _dates(start_date, end_date):
+    day = start_date
+    while day <= end_date:
+        yield day
+        day += timedelta(days=1)
+
+
+def materialize_attendance_days(employee_ids, start_date, end_date):
+    """
+    Recompute and store DailyAttendanceSummary rows for the employees over
+    start_date..end_date (inclusive, future days skipped). Days with an open
+    session or break lose their row instead. Returns the rows written.
+    """
+    end_date = min(end_date, _today())
+    if start_date > end_date:
+        return 0
+    employees = list(Employee.objects.filter(pk__in=set(employee_ids)))
+    if not employees:
+        return 0
+    employee_ids = [employee.pk for employee in employees]
+    window = {'gte': _local_midnight(start_date), 'lt': _local_midnight(end_date + timedelta(days=1))}
+
+    sessions_by_employee = {employee_id: [] for employee_id in employee_ids}
+    for session in AttendanceSession.objects.filter(
+        employee_id__in=employee_ids,
+        login_time__gte=window['gte'],
+        login_time__lt=window['lt'],
+        session_status__in=COUNTED_SESSION_STATUSES,
+    ).order_by('login_time'):
+        sessions_by_employee[session.employee_id].append(session)
+    breaks_by_employee = {employee_id: [] for employee_id in employee_ids}
+    for break_session in BreakSession.objects.filter(
+        employee_id__in=employee_ids, start_time__gte=window['gte'], start_time__lt=window['lt'],
+    ).order_by('start_time'):
+        breaks_by_employee[break_session.employee_id].append(break_session)
+
+    now = timezone.now()
+    rows = []
+    open_days = []
+    for employee in employees:
+        start_work_time, end_work_time = _work_hours(employee)
+        sessions_by_date, breaks_by_date = bucket_by_local_date(
+            sessions_by_employee[employee.pk], breaks_by_employee[employee.pk]
+        )
+        for current_date in _dates(start_date, end_date):
+            day_sessions = sessions_by_date.get(current_date, ())
+            day_breaks = breaks_by_date.get(current_date, ())
+            if any(row[1] is None for row in day_sessions) or any(row[1] is None for row in day_breaks):
+                open_days.append((employee.pk, current_date))
+                continue
+            day = compute_day(current_date, start_work_time, end_work_time, day_sessions, day_breaks)
+            _, daily_wage = day_record(
+                current_date.day, current_date, day,
+                _base_daily_wage(employee, monthrange(current_date.year, current_date.month)[1]),
+                wage_target_seconds(current_date, start_work_time, end_work_time),
+            )
+            rows.append(DailyAttendanceSummary(
+                employee_id=employee.pk,
+                date=current_date,
+                has_attendance=day['has_attendance'],
+                first_login=day['login_time'],
+                last_logout=day['logout_time'],
+                work_seconds=day['work_seconds'],
+                approved_break_seconds=day['approved_break_seconds'],
+                break_sessions=day['break_sessions'],
+                daily_wage=round(daily_wage, 2),
+                salary=employee.salary,
+                working_start_time=employee.working_start_time,
+                working_end_time=employee.working_end_time,
+                computed_at=now,
+            ))
+
+    # bulk_create/delete keep this derived table out of the auditlog
+    if rows:
+        DailyAttendanceSummary.objects.bulk_create(
+            rows,
+            update_conflicts=True,
+            unique_fields=['employee', 'date'],
+            update_fields=SUMMARY_UPDATE_FIELDS,
+        )
+    for employee_id, current_date in open_days:
+        DailyAttendanceSummary.objects.filter(employee_id=employee_id, date=current_date).delete()
+    return len(rows)
+
+
+def refresh_attendance_days(employee_days):
+    """
+    Re-materialize an iterable of (employee_id, date) pairs, e.g. after a
+    queryset.update() that bypassed the signals below.
+    """
+    dates_by_employee = {}
+    for employee_id, day in employee_days:
+        dates_by_employee.setdefault(employee_id, set()).add(day)
+    for employee_id, days in dates_by_employee.items():
+        materialize_attendance_days([employee_id], min(days), max(days))
+
+
+def refresh_break_days(break_ids):
+    refresh_attendance_days(
+        (employee_id, _local_date(start_time))
+        for employee_id, start_time in BreakSession.objects.filter(pk__in=break_ids).values_list(
+            'employee_id', 'start_time'
+        )
+    )
+
+
+def refresh_session_days(session_ids):
+    refresh_attendance_days(
+        (employee_id, _local_date(login_time))
+        for employee_id, login_time in AttendanceSession.objects.filter(pk__in=session_ids).values_list(
+            'employee_id', 'login_time'
+        )
+    )
+
+
+def materialize_previous_day(batch_size=200):
+    """Scheduler entry point: store yesterday for every employee."""
+    yesterday = _today() - timedelta(days=1)
+    employee_ids = list(Employee.objects.order_by('pk').values_list('pk', flat=True))
+    for offset in range(0, len(employee_ids), batch_size):
+        materialize_attendance_days(employee_ids[offset:offset + batch_size], yesterday, yesterday)
+
+
+def _stored_day(summary):
+    return {
+        'has_attendance': summary.has_attendance,
+        'login_time': summary.first_login,
+        'logout_time': summary.last_logout,
+        'work_seconds': summary.work_seconds,
+        'approved_break_seconds': summary.approved_break_seconds,
+        'break_sessions': summary.break_sessions,
+    }
+
+
+def summarized_month_attendance_for_employees(employees, year, month):
+    """
+    Same result as attendance_engine.month_attendance_for_employees, reading
+    DailyAttendanceSummary rows for past days. Raw sessions and breaks are
+    only fetched from each month's earliest day without a usable row, so a
+    fully materialized past month costs one query and the current month
+    scans only today's rows.
+    Returns {employee_id: (daily_records, total_monthly_wage, base_daily_wage)}.
+    """
+    employees = list(employees)
+    employee_ids = [employee.pk for employee in employees]
+    first_day = datetime(year, month, 1).date()
+    last_day = datetime(year, month, monthrange(year, month)[1]).date()
+    last_stored_day = min(last_day, _today() - timedelta(days=1))
+
+    employees_by_id = {employee.pk: employee for employee in employees}
+    stored = {employee_id: {} for employee_id in employee_ids}
+    if first_day <= last_stored_day:
+        for summary in DailyAttendanceSummary.objects.filter(
+            employee_id__in=employee_ids, date__gte=first_day, date__lte=last_stored_day
+        ):
+            if summary.matches(employees_by_id[summary.employee_id]):
+                stored[summary.employee_id][summary.date] = _stored_day(summary)
+
+    live_from = {}
+    for employee_id in employee_ids:
+        missing = next((day for day in _dates(first_day, last_day) if day not in stored[employee_id]), None)
+        if missing is not None:
+            live_from[employee_id] = missing
+
+    sessions_by_employee = {employee_id: [] for employee_id in employee_ids}
+    breaks_by_employee = {employee_id: [] for employee_id in employee_ids}
+    if live_from:
+        since = _local_midnight(min(live_from.values()))
+        for session in AttendanceSession.objects.filter(
+            employee_id__in=list(live_from),
+            login_time__year=year,
+            login_time__month=month,
+            login_time__gte=since,
+            session_status__in=COUNTED_SESSION_STATUSES,
+        ).order_by('login_time'):
+            sessions_by_employee[session.employee_id].append(session)
+        for break_session in BreakSession.objects.filter(
+            employee_id__in=list(live_from), start_time__year=year, start_time__month=month, start_time__gte=since,
+        ).order_by('start_time'):
+            breaks_by_employee[break_session.employee_id].append(break_session)
+
+    return {
+        employee.pk: month_attendance(
+            employee, year, month, sessions_by_employee[employee.pk], breaks_by_employee[employee.pk],
+            stored_days=stored[employee.pk],
+        )
+        for employee in employees
+    }
+
+
+def _forget_day(employee_id, day):
+    DailyAttendanceSummary.objects.filter(employee_id=employee_id, date=day).delete()
+
+
+def get_day_attendance(employee, day):
+    """
+    One day of Employee.get_daily_attendance_summary without the rest of
+    the month: (record, base_daily_wage), where record is the dict the
+    month summary has for `day`. A stored past day costs one query, any
+    other day one query each for its sessions and breaks.
+    """
+    start_work_time, end_work_time = _work_hours(employee)
+    base_daily_wage = _base_daily_wage(employee, monthrange(day.year, day.month)[1])
+
+    summary = None
+    if day < _today():
+        summary = DailyAttendanceSummary.objects.filter(employee_id=employee.pk, date=day).first()
+    if summary is not None and summary.matches(employee):
+        computed = _stored_day(summary)
+    else:
+        window = {'gte': _local_midnight(day), 'lt': _local_midnight(day + timedelta(days=1))}
+        sessions_by_date, breaks_by_date = bucket_by_local_date(
+            AttendanceSession.objects.filter(
+                employee_id=employee.pk,
+                login_time__gte=window['gte'],
+                login_time__lt=window['lt'],
+                session_status__in=COUNTED_SESSION_STATUSES,
+            ).order_by('login_time'),
+            BreakSession.objects.filter(
+                employee_id=employee.pk, start_time__gte=window['gte'], start_time__lt=window['lt'],
+            ).order_by('start_time'),
+        )
+        computed = compute_day(
+            day, start_work_time, end_work_time, sessions_by_date.get(day, ()), breaks_by_date.get(day, ()),
+        )
+    record, _ = day_record(
+        day.day, day, computed, base_daily_wage, wage_target_seconds(day, start_work_time, end_work_time),
+    )
+    return record, round(base_daily_wage, 2)
+
+
+@receiver(post_save, sender='management.AttendanceSession')
+def _attendance_session_saved(sender, instance, created, **kwargs):
+    day = _local_date(instance.login_time)
+    if instance.logout_time is not None:
+        materialize_attendance_days([instance.employee_id], day, day)
+    elif created:
+        _forget_day(instance.employee_id, day)
+
+
+@receiver(post_save, sender='management.BreakSession')
+def _break_session_saved(sender, instance, created, **kwargs):
+    day = _local_date(instance.start_time)
+    if instance.end_time is not None:
+        materialize_attendance_days([instance.employee_id], day, day)
+    elif created:
+        _forget_day(instance.employee_id, day)
+
+
+# Deletes only drop the row (the day is computed live until the next
+# close rewrites it): recomputing here would recreate rows mid-cascade
+# when the employee itself is being deleted.
+@receiver(post_delete, sender='management.AttendanceSession')
+def _attendance_session_deleted(sender, instance, **kwargs):
+    _forget_day(instance.employee_id, _local_date(instance.login_time))
+
+
+@receiver(post_delete, sender='management.BreakSession')
+def _break_session_deleted(sender, instance, **kwargs):
+    _forget_day(instance.employee_id, _local_date(instance.start_time))
@@ -1,27 +1,64 @@
-from django.db.models import Sum
 from django.utils import timezone
 
-from .models import Department, Employee, EmployeeTarget, UserNotificationStatus, Worksheet, SalaryPayment
+from .employee_context import get_employee_context
+from .models import UserNotificationStatus
+from .navbar_stats import get_navbar_stats
+from .template_context import lazy_context
 from .utils import format_hour_label, get_employee_next_day_alert_state
 
+NOTIFICATION_KEYS = ('unread_notification_count', 'is_department_head', 'has_token_naming_access')
+NEXT_DAY_ALERT_KEYS = (
+    'employee_next_day_alert_pending',
+    'employee_next_day_alert_response',
+    'employee_next_day_alert_target_date',
+    'employee_next_day_alert_start_label',
+    'employee_next_day_alert_end_label',
+    'employee_next_day_alert_start_hour',
+    'employee_next_day_alert_end_hour',
+    'employee_next_day_alert_ms_until_auto_no',
+    'employee_next_day_alert_auto_marked',
+)
+DAILY_STATS_KEYS = (
+    'navbar_daily_target',
+    'navbar_daily_collected',
+    'navbar_daily_balance',
+    'navbar_daily_commission',
+    'navbar_department_balance',
+)
+
+
 def notifications_context(request):
     """
     Makes the unread notification count and department-head flag available to all templates.
     """
-    if request.session.get('employee_id'):
-        employee_id = request.session.get('employee_id')
-        count = UserNotificationStatus.objects.filter(employee_id=employee_id, is_read=False).count()
-        is_department_head = Department.objects.filter(department_head__employee_id=employee_id).exists()
-        has_token_naming_access = Employee.objects.filter(employee_id=employee_id, token_naming_access=True).exists()
+    return lazy_context(request, _notifications_values, NOTIFICATION_KEYS)
+
+
+def employee_next_day_alert_context(request):
+    return lazy_context(request, _employee_next_day_alert_values, NEXT_DAY_ALERT_KEYS)
+
+
+def employee_daily_stats_context(request):
+    """
+    Provides today's target, total worksheet amount collected, balance,
+    and this month's commission due (earned minus paid) for the navbar.
+    """
+    return lazy_context(request, _employee_daily_stats_values, DAILY_STATS_KEYS)
+
+
+def _notifications_values(request):
+    employee_context = get_employee_context(request)
+    if employee_context and employee_context.employee:
+        count = UserNotificationStatus.objects.filter(employee_id=employee_context.employee_id, is_read=False).count()
         return {
             'unread_notification_count': count,
-            'is_department_head': is_department_head,
-            'has_token_naming_access': has_token_naming_access,
+            'is_department_head': employee_context.is_department_head,
+            'has_token_naming_access': employee_context.has_token_naming_access,
         }
     return {'unread_notification_count': 0, 'is_department_head': False, 'has_token_naming_access': False}
 
 
-def employee_next_day_alert_context(request):
+def _employee_next_day_alert_values(request):
     employee_id = request.session.get('employee_id')
     if not employee_id:
         return {
@@ -31,7 +68,7 @@ def employee_next_day_alert_context(request):
 
     state = getattr(request, 'employee_next_day_alert_state', None)
     if state is None:
-        employee = Employee.objects.filter(employee_id=employee_id).first()
+        employee = get_employee_context(request).employee
         state = get_employee_next_day_alert_state(employee) if employee else None
 
     if not state:
@@ -57,14 +94,11 @@ def employee_next_day_alert_context(request):
     }
 
 
-def employee_daily_stats_context(request):
-    """
-    Provides today's target, total worksheet amount collected, balance,
-    and this month's commission due (earned minus paid) for the navbar.
-    """
+def _employee_daily_stats_values(request):
     from decimal import Decimal
-    employee_id = request.session.get('employee_id')
-    if not employee_id:
+    employee_context = get_employee_context(request)
+    employee = employee_context.employee if employee_context else None
+    if not employee:
         return {
             'navbar_daily_target': None,
             'navbar_daily_collected': None,
@@ -73,42 +107,18 @@ def employee_daily_stats_context(request):
             'navbar_department_balance': None,
         }
 
-    today = timezone.localtime(timezone.now()).date()
-
-    target_obj = EmployeeTarget.objects.filter(employee__employee_id=employee_id, date=today).first()
-    target = (target_obj.target_amount + target_obj.carry_forward) if target_obj else None
-
-    collected = Worksheet.objects.filter(
-        employee__employee_id=employee_id, date=today
-    ).aggregate(total=Sum('amount'))['total'] or 0
-
+    stats = get_navbar_stats(employee, employee_context.headed_department_id)
+    target = stats.daily_target
+    collected = stats.daily_collected
     balance = (target - collected) if target is not None else None
 
     # Commission due = total commission earned this month - total commission paid this month
-    try:
-        employee = Employee.objects.get(employee_id=employee_id)
-        earnings = employee.get_current_month_earnings(today.year, today.month)
-        commission_earned = (
-            (earnings.get('worksheet_commissions') or Decimal('0')) +
-            (earnings.get('application_commissions') or Decimal('0'))
-        )
-    except Employee.DoesNotExist:
-        commission_earned = Decimal('0')
-
-    commission_paid = SalaryPayment.objects.filter(
-        employee__employee_id=employee_id,
-        payment_type='commission',
-        date__year=today.year,
-        date__month=today.month,
-    ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
-
-    commission_due = commission_earned - Decimal(str(commission_paid))
-
-    headed_department = Department.objects.filter(department_head__employee_id=employee_id).first()
-    if headed_department:
-        department_balance = headed_department.topups.aggregate(total=Sum('amount'))['total'] or Decimal('0')
-    else:
-        department_balance = None
+    commission_due = (
+        (stats.worksheet_commission or Decimal('0')) +
+        (stats.application_commission or Decimal('0')) -
+        Decimal(str(stats.commission_paid))
+    )
+    department_balance = stats.department_balance
 
     return {
         'navbar_daily_target': target,
@@ -1,5 +1,6 @@
 from datetime import date
-from .models import EmployeeUpload
+from .renewal_digest import get_renewal_digest
+from .template_context import lazy_context
 
 def renewal_alerts_processor(request):
     """
@@ -7,16 +8,21 @@ def renewal_alerts_processor(request):
     """
     # Only add context for admin index page
     if hasattr(request, 'path') and request.path == '/admin/':
-        today = date.today()
-        expired_uploads = EmployeeUpload.objects.filter(
-            renewal_date__lte=today,
-            renewal_date__isnull=False
-        ).select_related('employee', 'service').order_by('renewal_date')
-        
-        return {
-            'expired_uploads': expired_uploads,
-            'expired_count': expired_uploads.count(),
-            'show_renewal_alert': expired_uploads.exists(),
-            'today': today,
-        }
-    return {}
\ No newline at end of file
+        return lazy_context(
+            request,
+            _renewal_alerts,
+            ('renewal_digest', 'expired_count', 'due_soon_count', 'show_renewal_alert', 'today'),
+        )
+    return {}
+
+
+def _renewal_alerts(request):
+    today = date.today()
+    digest = get_renewal_digest(today)
+    return {
+        'renewal_digest': digest,
+        'expired_count': digest.expired_count,
+        'due_soon_count': digest.due_soon_count,
+        'show_renewal_alert': bool(digest.expired_count or digest.due_soon_count),
+        'today': today,
+    }
@@ -0,0 +1,236 @@
+"""
+Customer master index: every record that carries a customer's mobile
+number is linked, through CustomerRecord, to one Customer row keyed by the
+normalized number.
+
+Tokens, worksheet entries (customer and login mobile), employee uploads,
+applications and TTD bookings each store the number as typed, so a
+customer's history used to mean an unindexed scan per table. The
+receivers below re-link a record whenever it is saved or deleted and
+re-aggregate the counts, name and first/last seen dates of the customers
+it touched; customer_history() then needs one indexed link lookup and
+one primary-key lookup per source. rebuild_customer_index() recomputes
+everything from scratch.
+"""
+import re
+from collections import defaultdict
+from datetime import datetime, time
+
+from django.db import transaction
+from django.db.models import Count, Max, Min, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import (
+    Application, Customer, CustomerRecord, EmployeeUpload, TTDGroupMember, TTDIndividualDarshan, Token, Worksheet,
+)
+from .transactions import write_transaction
+
+
+# source: (model, mobile fields, name field, seen-at field)
+SOURCES = {
+    CustomerRecord.SOURCE_TOKEN: (Token, ('cell_no',), 'customer_name', 'created_at'),
+    CustomerRecord.SOURCE_WORKSHEET: (Worksheet, ('customer_mobile', 'login_mobile_no'), 'customer_name', 'created_at'),
+    CustomerRecord.SOURCE_UPLOAD: (EmployeeUpload, ('mobile_number',), None, 'uploaded_at'),
+    CustomerRecord.SOURCE_APPLICATION: (Application, ('customer_mobile_number',), 'customer_name', 'date_created'),
+    CustomerRecord.SOURCE_TTD_DARSHAN: (TTDIndividualDarshan, ('mobile_number',), 'name', 'created_at'),
+    CustomerRecord.SOURCE_TTD_MEMBER: (TTDGroupMember, ('mobile_number',), 'name', 'group__created_at'),
+}
+COUNT_FIELDS = {
+    CustomerRecord.SOURCE_TOKEN: 'token_count',
+    CustomerRecord.SOURCE_WORKSHEET: 'worksheet_count',
+    CustomerRecord.SOURCE_UPLOAD: 'upload_count',
+    CustomerRecord.SOURCE_APPLICATION: 'application_count',
+    CustomerRecord.SOURCE_TTD_DARSHAN: 'ttd_count',
+    CustomerRecord.SOURCE_TTD_MEMBER: 'ttd_count',
+}
+_SOURCE_BY_MODEL = {model: source for source, (model, _, _, _) in SOURCES.items()}
+# Country code / trunk prefixes dropped in front of a 10-digit number
+_MOBILE_PREFIXES = ('0', '91', '091', '0091')
+
+
+def normalize_mobile(value):
+    """The 10-digit number in `value` ('+91 98480-22338' -> '9848022338'), or None if it isn't one."""
+    digits = re.sub(r'\D', '', value or '')
+    if len(digits) > 10 and digits[:-10] in _MOBILE_PREFIXES:
+        digits = digits[-10:]
+    return digits if len(digits) == 10 else None
+
+
+def _seen_at(value):
+    # Worksheet.created_at is nullable on old rows; fall back to the entry's date
+    if value is None:
+        return timezone.now()
+    if not isinstance(value, datetime):
+        return timezone.make_aware(datetime.combine(value, time.min))
+    return value
+
+
+def _record_values(source, instance):
+    """({mobile: name}, seen_at) for one source record."""
+    _, mobile_fields, name_field, seen_field = SOURCES[source]
+    name = (getattr(instance, name_field) or '') if name_field else ''
+    if source == CustomerRecord.SOURCE_TTD_MEMBER:
+        seen = instance.group.created_at
+    else:
+        seen = getattr(instance, seen_field)
+        if seen is None and source == CustomerRecord.SOURCE_WORKSHEET:
+            seen = instance.date
+    mobiles = {normalize_mobile(getattr(instance, field)) for field in mobile_fields} - {None}
+    return {mobile: name for mobile in mobiles}, _seen_at(seen)
+
+
+def refresh_customers(customer_ids):
+    """Re-aggregate each customer's counts, name and first/last seen from its links; drop unlinked ones."""
+    customer_ids = set(customer_ids)
+    if not customer_ids:
+        return
+    totals = {pk: {'first_seen': None, 'last_seen': None, **dict.fromkeys(COUNT_FIELDS.values(), 0)}
+              for pk in customer_ids}
+    rows = (
+        CustomerRecord.objects.filter(customer_id__in=customer_ids)
+        .values('customer_id', 'source')
+        .annotate(records=Count('pk'), first=Min('seen_at'), last=Max('seen_at'))
+        .order_by()
+    )
+    for row in rows:
+        values = totals[row['customer_id']]
+        values[COUNT_FIELDS[row['source']]] += row['records']
+        values['first_seen'] = min(filter(None, (values['first_seen'], row['first'])))
+        values['last_seen'] = max(filter(None, (values['last_seen'], row['last'])))
+
+    latest_name = Subquery(
+        CustomerRecord.objects.filter(customer=OuterRef('pk')).exclude(name='')
+        .order_by('-seen_at', '-pk').values('name')[:1]
+    )
+    with write_transaction():
+        unlinked = [pk for pk, values in totals.items() if values['first_seen'] is None]
+        if unlinked:
+            Customer.objects.filter(pk__in=unlinked).delete()
+        for pk, values in totals.items():
+            if values['first_seen'] is not None:
+                Customer.objects.filter(pk=pk).update(name=Coalesce(latest_name, Value('')), **values)
+
+
+def link_record(source, instance):
+    """Point `instance`'s links at the customers its mobile fields name now."""
+    wanted, seen_at = _record_values(source, instance)
+    with write_transaction():
+        links = {
+            mobile: (pk, customer_id)
+            for pk, customer_id, mobile in CustomerRecord.objects.filter(source=source, object_id=instance.pk)
+            .values_list('pk', 'customer_id', 'customer__mobile')
+        }
+        touched = {customer_id for _, customer_id in links.values()}
+        stale = [pk for mobile, (pk, _) in links.items() if mobile not in wanted]
+        if stale:
+            CustomerRecord.objects.filter(pk__in=stale).delete()
+        for mobile, name in wanted.items():
+            if mobile in links:
+                CustomerRecord.objects.filter(pk=links[mobile][0]).update(name=name, seen_at=seen_at)
+                continue
+            customer, _ = Customer.objects.get_or_create(mobile=mobile)
+            CustomerRecord.objects.create(
+                customer=customer, source=source, object_id=instance.pk, name=name, seen_at=seen_at,
+            )
+            touched.add(customer.pk)
+        refresh_customers(touched)
+
+
+def unlink_record(source, object_id):
+    with write_transaction():
+        links = CustomerRecord.objects.filter(source=source, object_id=object_id)
+        touched = set(links.values_list('customer_id', flat=True))
+        if touched:
+            links.delete()
+            refresh_customers(touched)
+
+
+def customer_history(mobile):
+    """
+    (customer, {source: [records, newest first]}) for the customer with
+    `mobile` in any format, or (None, {}) when no record carries it.
+    """
+    mobile = normalize_mobile(mobile)
+    customer = Customer.objects.filter(mobile=mobile).first() if mobile else None
+    if not customer:
+        return None, {}
+
+    object_ids = defaultdict(list)
+    for source, object_id in customer.records.values_list('source', 'object_id'):
+        object_ids[source].append(object_id)
+    history = {}
+    for source, ids in object_ids.items():
+        model, _, _, seen_field = SOURCES[source]
+        records = model.objects.filter(pk__in=ids)
+        if source == CustomerRecord.SOURCE_TTD_MEMBER:
+            records = records.select_related('group')
+        history[source] = list(records.order_by(f'-{seen_field}', '-pk'))
+    return customer, history
+
+
+def rebuild_customer_index(batch_size=1000):
+    """Recompute every Customer and CustomerRecord row from the source tables; returns the customer count."""
+    customers = {}
+    links = []
+    for source, (model, mobile_fields, name_field, seen_field) in SOURCES.items():
+        fields = ['pk', *mobile_fields, seen_field] + ([name_field] if name_field else [])
+        if source == CustomerRecord.SOURCE_WORKSHEET:
+            fields.append('date')
+        for row in model.objects.order_by().values(*fields).iterator():
+            seen = row[seen_field]
+            if seen is None and source == CustomerRecord.SOURCE_WORKSHEET:
+                seen = row['date']
+            seen = _seen_at(seen)
+            name = (row[name_field] or '') if name_field else ''
+            for mobile in {normalize_mobile(row[field]) for field in mobile_fields} - {None}:
+                customer = customers.setdefault(mobile, {
+                    'mobile': mobile, 'name': '', 'first_seen': seen, 'last_seen': seen, 'name_seen': None,
+                    **dict.fromkeys(COUNT_FIELDS.values(), 0),
+                })
+                customer[COUNT_FIELDS[source]] += 1
+                customer['first_seen'] = min(customer['first_seen'], seen)
+                customer['last_seen'] = max(customer['last_seen'], seen)
+                if name and (customer['name_seen'] is None or seen >= customer['name_seen']):
+                    customer['name'], customer['name_seen'] = name, seen
+                links.append((mobile, source, row['pk'], name, seen))
+
+    with transaction.atomic():
+        Customer.objects.all().delete()
+        Customer.objects.bulk_create(
+            (Customer(**{key: value for key, value in values.items() if key != 'name_seen'})
+             for values in customers.values()),
+            batch_size=batch_size,
+        )
+        customer_ids = dict(Customer.objects.values_list('mobile', 'pk'))
+        CustomerRecord.objects.bulk_create(
+            (
+                CustomerRecord(customer_id=customer_ids[mobile], source=source, object_id=object_id,
+                               name=name, seen_at=seen)
+                for mobile, source, object_id, name, seen in links
+            ),
+            batch_size=batch_size,
+        )
+    return len(customers)
+
+
+@receiver(post_save, sender='management.Token')
+@receiver(post_save, sender='management.Worksheet')
+@receiver(post_save, sender='management.EmployeeUpload')
+@receiver(post_save, sender='management.Application')
+@receiver(post_save, sender='management.TTDIndividualDarshan')
+@receiver(post_save, sender='management.TTDGroupMember')
+def _customer_record_saved(sender, instance, **kwargs):
+    link_record(_SOURCE_BY_MODEL[sender], instance)
+
+
+@receiver(post_delete, sender='management.Token')
+@receiver(post_delete, sender='management.Worksheet')
+@receiver(post_delete, sender='management.EmployeeUpload')
+@receiver(post_delete, sender='management.Application')
+@receiver(post_delete, sender='management.TTDIndividualDarshan')
+@receiver(post_delete, sender='management.TTDGroupMember')
+def _customer_record_deleted(sender, instance, **kwargs):
+    unlink_record(_SOURCE_BY_MODEL[sender], instance.pk)
@@ -0,0 +1,74 @@
+from django.db.models import OuterRef, Subquery
+from django.utils.functional import cached_property
+
+from .models import Department, Employee
+
+
+REQUEST_ATTR = '_employee_context'
+
+
+class EmployeeContext:
+    """
+    The logged-in employee for one request, shared by the middleware,
+    context processors and views. The employee row, its department and the
+    headed-department id are fetched together in a single query the first
+    time any of them is read.
+    """
+
+    def __init__(self, employee_id):
+        self.employee_id = employee_id
+
+    @cached_property
+    def employee(self):
+        headed_department = Department.objects.filter(
+            department_head_id=OuterRef('pk')
+        ).order_by('pk').values('pk')[:1]
+        return (
+            Employee.objects.select_related('department')
+            .annotate(headed_department_pk=Subquery(headed_department))
+            .filter(employee_id=self.employee_id)
+            .first()
+        )
+
+    @property
+    def department(self):
+        return self.employee.department if self.employee else None
+
+    @property
+    def headed_department_id(self):
+        return self.employee.headed_department_pk if self.employee else None
+
+    @property
+    def is_department_head(self):
+        return self.headed_department_id is not None
+
+    @property
+    def has_token_naming_access(self):
+        return bool(self.employee and self.employee.token_naming_access)
+
+    @property
+    def has_token_entry_access(self):
+        return bool(self.employee and self.employee.token_entry_access)
+
+
+def get_employee_context(request):
+    """
+    Return the EmployeeContext for the employee in the session, or None.
+    The context is stored on the request and rebuilt if the session switches
+    to a different employee (login) mid-request.
+    """
+    session = getattr(request, 'session', None)
+    employee_id = session.get('employee_id') if session is not None else None
+    if not employee_id:
+        return None
+    context = getattr(request, REQUEST_ATTR, None)
+    if context is None or context.employee_id != employee_id:
+        context = EmployeeContext(employee_id)
+        setattr(request, REQUEST_ATTR, context)
+    return context
+
+
+def get_request_employee(request):
+    """Shortcut returning the session employee (or None) via the request context."""
+    context = get_employee_context(request)
+    return context.employee if context else None
@@ -0,0 +1,92 @@
+"""
+Write-behind buffer for attendance heartbeats.
+
+attendance_ping and refresh_session used to UPDATE their AttendanceSession
+row on every call, once a minute per open tab, and on SQLite those writes
+queue behind the same lock as worksheet and token writes. They now record
+into this process's buffer, which flushes every HEARTBEAT_FLUSH_SECONDS as
+one UPDATE ... SET col = CASE id WHEN ... END per column.
+
+Each worker has its own buffer, so the rows can lag by up to one flush
+interval; stale-session detection (15 minutes) flushes this process's
+buffer first and treats anything still buffered as alive.
+"""
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Case, F, Value, When
+
+from .models import AttendanceSession
+
+logger = logging.getLogger(__name__)
+
+HEARTBEAT_FIELDS = ('last_ping', 'session_expires_at', 'refreshed_at', 'session_status')
+
+
+def _flush_seconds():
+    return getattr(settings, 'HEARTBEAT_FLUSH_SECONDS', 30)
+
+
+class HeartbeatBuffer:
+    """In-process {session_id: {field: latest value}}, flushed as one batched UPDATE."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._last_flush = time.monotonic()
+
+    def record(self, session_id, **values):
+        with self._lock:
+            self._pending.setdefault(session_id, {}).update(values)
+            due = time.monotonic() - self._last_flush >= _flush_seconds()
+        if due:
+            self.flush()
+
+    def pending(self):
+        with self._lock:
+            return {session_id: dict(values) for session_id, values in self._pending.items()}
+
+    def flush(self):
+        """Write every buffered heartbeat in one UPDATE; returns the rows updated."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+        updates = {}
+        for field in HEARTBEAT_FIELDS:
+            whens = [
+                When(pk=session_id, then=Value(values[field]))
+                for session_id, values in pending.items() if field in values
+            ]
+            if whens:
+                output_field = AttendanceSession._meta.get_field(field)
+                updates[field] = Case(*whens, default=F(field), output_field=output_field)
+        try:
+            # Closed sessions keep their final values
+            return AttendanceSession.objects.filter(pk__in=list(pending), logout_time__isnull=True).update(**updates)
+        except DatabaseError:
+            logger.exception('Could not flush %d attendance heartbeats', len(pending))
+            with self._lock:
+                for session_id, values in pending.items():
+                    self._pending[session_id] = {**values, **self._pending.get(session_id, {})}
+            return 0
+
+
+heartbeats = HeartbeatBuffer()
+
+
+def record_ping(session_id, now):
+    heartbeats.record(session_id, last_ping=now)
+
+
+def record_refresh(session_id, now, expires_at):
+    heartbeats.record(session_id, session_expires_at=expires_at, refreshed_at=now, session_status='refreshed')
+
+
+def flush_heartbeats():
+    """Scheduler entry point; runs in every process since each has its own buffer."""
+    return heartbeats.flush()
@@ -1,10 +1,156 @@
 from django.http import HttpResponseForbidden
 from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.shortcuts import render
+import ipaddress
 import logging
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
+GLOBAL_RULE_DESCRIPTIONS = ('GLOBAL_ALLOW_ALL', 'GLOBAL_BLOCK')
+IP_RULES_VERSION_KEY = 'ip_restriction_rules_version'
+# The version lives in the (per-process) default cache, so also rebuild
+# after this many seconds to pick up changes saved by other workers.
+IP_RULES_MAX_AGE = 300
+
+
+class AllowedIPIndex:
+    """
+    Compiled form of the active AllowedIP rows.
+
+    Exact addresses and whole-octet prefixes ('10.0.', '192.168.1.0/24') are
+    stored as masked integers grouped by prefix length, so a lookup costs one
+    set probe per distinct prefix length instead of one comparison per rule.
+    Prefixes that don't end on an octet boundary (e.g. '192.168.1') keep the
+    old str.startswith meaning via a set of raw string prefixes.
+    """
+
+    def __init__(self, global_block=False, global_allow=False):
+        self.global_block = global_block
+        self.global_allow = global_allow
+        self.exact_addresses = set()
+        self.raw_prefixes = set()
+        # {ip version: {prefix length: {network address as int}}}
+        self.networks = {4: {}, 6: {}}
+
+    @classmethod
+    def from_rules(cls, rules, global_block=False, global_allow=False):
+        index = cls(global_block=global_block, global_allow=global_allow)
+        for ip_address, subnet_prefix in rules:
+            index.add_address(ip_address)
+            if subnet_prefix:
+                index.add_prefix(subnet_prefix)
+        return index
+
+    def _add_network(self, network):
+        masked = int(network.network_address)
+        self.networks[network.version].setdefault(network.prefixlen, set()).add(masked)
+
+    def add_address(self, ip_address):
+        if not ip_address:
+            return
+        self.exact_addresses.add(ip_address)
+        try:
+            self._add_network(ipaddress.ip_network(ipaddress.ip_address(ip_address)))
+        except ValueError:
+            pass
+
+    def add_prefix(self, prefix):
+        prefix = prefix.strip()
+        if '/' in prefix:
+            try:
+                self._add_network(ipaddress.ip_network(prefix, strict=False))
+                return
+            except ValueError:
+                pass
+        octets = prefix[:-1].split('.') if prefix.endswith('.') else []
+        if 0 < len(octets) < 4 and all(o.isdigit() and int(o) <= 255 and str(int(o)) == o for o in octets):
+            padded = '.'.join(octets + ['0'] * (4 - len(octets)))
+            self._add_network(ipaddress.ip_network(f"{padded}/{8 * len(octets)}"))
+            return
+        self.raw_prefixes.add(prefix)
+
+    def contains(self, ip):
+        if not ip:
+            return False
+        if ip in self.exact_addresses:
+            return True
+        try:
+            address = ipaddress.ip_address(ip)
+        except ValueError:
+            address = None
+        if address is not None:
+            value = int(address)
+            bits = address.max_prefixlen
+            for prefixlen, masked_networks in self.networks[address.version].items():
+                shift = bits - prefixlen
+                if (value >> shift) << shift in masked_networks:
+                    return True
+        if self.raw_prefixes:
+            return any(ip[:end] in self.raw_prefixes for end in range(1, len(ip) + 1))
+        return False
+
+    def is_allowed(self, ip):
+        if self.global_block:
+            return False
+        if self.global_allow:
+            return True
+        return self.contains(ip)
+
+
+_compiled_index = None
+_compiled_lock = threading.Lock()
+
+
+def get_ip_rules_version():
+    return cache.get_or_set(IP_RULES_VERSION_KEY, time.time_ns, None)
+
+
+def bump_ip_rules_version():
+    """Invalidate the compiled allow-list in this process and the shared cache."""
+    global _compiled_index
+    cache.set(IP_RULES_VERSION_KEY, time.time_ns(), None)
+    _compiled_index = None
+
+
+def build_allowed_ip_index():
+    from management.models import AllowedIP
+
+    active = AllowedIP.objects.filter(is_active=True)
+    global_descriptions = set(
+        active.filter(description__in=GLOBAL_RULE_DESCRIPTIONS).values_list('description', flat=True)
+    )
+    rules = active.exclude(description__in=GLOBAL_RULE_DESCRIPTIONS).values_list('ip_address', 'subnet_prefix')
+    return AllowedIPIndex.from_rules(
+        rules,
+        global_block='GLOBAL_BLOCK' in global_descriptions,
+        global_allow='GLOBAL_ALLOW_ALL' in global_descriptions,
+    )
+
+
+def get_allowed_ip_index():
+    """Return the compiled allow-list, rebuilding it when the rules version changes."""
+    global _compiled_index
+    version = get_ip_rules_version()
+    compiled = _compiled_index
+    if compiled is None or compiled[0] != version or time.monotonic() - compiled[1] > IP_RULES_MAX_AGE:
+        with _compiled_lock:
+            compiled = _compiled_index
+            if compiled is None or compiled[0] != version or time.monotonic() - compiled[1] > IP_RULES_MAX_AGE:
+                compiled = (version, time.monotonic(), build_allowed_ip_index())
+                _compiled_index = compiled
+    return compiled[2]
+
+
+@receiver(post_save, sender='management.AllowedIP')
+@receiver(post_delete, sender='management.AllowedIP')
+def _allowed_ip_changed(sender, **kwargs):
+    bump_ip_rules_version()
+
+
 class RestrictIPMiddleware:
     def __init__(self, get_response):
         self.get_response = get_response
@@ -19,7 +165,7 @@ class RestrictIPMiddleware:
             return self.get_response(request)
 
         ip = get_client_ip(request)
-        
+
         # Check if IP is allowed
         if not self.is_ip_allowed(ip):
             logger.warning(f"Access denied for IP: {ip}")
@@ -40,50 +186,8 @@ class RestrictIPMiddleware:
         return response
 
     def is_ip_allowed(self, ip):
-        from management.models import AllowedIP
-        from django.core.cache import cache
-
-        # --- 1. Check for the global 'Block All' rule FIRST ---
-        global_block_key = "ip_restriction_global_block_status"
-        is_globally_blocked = cache.get(global_block_key)
-        if is_globally_blocked is None:
-            # Look for the specific description
-            is_globally_blocked = AllowedIP.objects.filter(description='GLOBAL_BLOCK', is_active=True).exists()
-            cache.set(global_block_key, is_globally_blocked, 300)
-        
-        if is_globally_blocked:
-            return False # If this rule exists, block everyone.
-
-        # --- 2. If not blocked, check for the global 'Allow All' rule ---
-        global_allow_key = "ip_restriction_global_allow_status"
-        is_globally_allowed = cache.get(global_allow_key)
-        if is_globally_allowed is None:
-            # Look for the specific description
-            is_globally_allowed = AllowedIP.objects.filter(description='GLOBAL_ALLOW_ALL', is_active=True).exists()
-            cache.set(global_allow_key, is_globally_allowed, 300)
-        
-        if is_globally_allowed:
-            return True # If this rule exists, allow everyone.
-
-        # --- 3. If no global rules, fall back to checking the IP list ---
-        cache_key = f"allowed_ips_check_{ip}"
-        cached_result = cache.get(cache_key)
-        if cached_result is not None:
-            return cached_result
-        
-        # Exclude global rules from the specific IP check
-        allowed_ips = AllowedIP.objects.filter(is_active=True)\
-            .exclude(description__in=['GLOBAL_ALLOW_ALL', 'GLOBAL_BLOCK'])\
-            .values_list('ip_address', 'subnet_prefix')
-        
-        is_allowed = False
-        for allowed_ip, subnet_prefix in allowed_ips:
-            if ip == allowed_ip or (subnet_prefix and ip.startswith(subnet_prefix)):
-                is_allowed = True
-                break
-                
-        cache.set(cache_key, is_allowed, 300)
-        return is_allowed
+        # 'Block All' wins over 'Allow All', which wins over the IP list
+        return get_allowed_ip_index().is_allowed(ip)
 
 
 
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from management.utils import auto_mark_next_day_availability
+
+
+class Command(BaseCommand):
+    help = "Mark 'No' for unlocked employees who have not answered the next-day availability alert after its end hour"
+
+    def handle(self, *args, **options):
+        marked = auto_mark_next_day_availability()
+        self.stdout.write(self.style.SUCCESS(f"Auto-marked {marked} employee(s) as not coming"))
@@ -0,0 +1,59 @@
+from datetime import date, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min
+from django.utils import timezone
+
+from management.attendance_summary import materialize_attendance_days
+from management.models import AttendanceSession, Employee
+
+
+class Command(BaseCommand):
+    help = "Build DailyAttendanceSummary rows for past days, a chunk of employees and days at a time"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day (YYYY-MM-DD); defaults to the earliest session')
+        parser.add_argument('--end', help='Last day (YYYY-MM-DD); defaults to yesterday')
+        parser.add_argument('--employee', type=int, action='append', dest='employees',
+                            help='Only this employee id (repeatable)')
+        parser.add_argument('--chunk-days', type=int, default=31)
+        parser.add_argument('--batch-size', type=int, default=50, help='Employees per chunk')
+
+    def _date(self, value, name):
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise CommandError(f"--{name} must be YYYY-MM-DD, got {value!r}")
+
+    def handle(self, *args, **options):
+        today = timezone.localtime(timezone.now()).date()
+        end = self._date(options['end'], 'end') if options['end'] else today - timedelta(days=1)
+        if options['start']:
+            start = self._date(options['start'], 'start')
+        else:
+            first_login = AttendanceSession.objects.aggregate(first=Min('login_time'))['first']
+            if first_login is None:
+                self.stdout.write("No attendance sessions to summarise")
+                return
+            start = timezone.localtime(first_login).date()
+        if start > end:
+            raise CommandError(f"--start {start} is after --end {end}")
+
+        employees = Employee.objects.order_by('pk')
+        if options['employees']:
+            employees = employees.filter(pk__in=options['employees'])
+        employee_ids = list(employees.values_list('pk', flat=True))
+        chunk_days = max(options['chunk_days'], 1)
+        batch_size = max(options['batch_size'], 1)
+
+        written = 0
+        for offset in range(0, len(employee_ids), batch_size):
+            batch = employee_ids[offset:offset + batch_size]
+            chunk_start = start
+            while chunk_start <= end:
+                chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end)
+                written += materialize_attendance_days(batch, chunk_start, chunk_end)
+                chunk_start = chunk_end + timedelta(days=1)
+            self.stdout.write(f"Employees {offset + 1}-{offset + len(batch)} of {len(employee_ids)} done")
+
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} daily attendance summaries for {start} to {end}"))
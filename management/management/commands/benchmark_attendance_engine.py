@@ -0,0 +1,74 @@
+import random
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from management.attendance_engine import month_attendance
+from management.attendance_engine_reference import legacy_month_attendance
+from management.models import AttendanceSession, BreakSession, Employee
+
+
+class Command(BaseCommand):
+    help = "Benchmark the month attendance engine against the legacy per-day loop on a synthetic month"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, default=2025)
+        parser.add_argument('--month', type=int, default=7)
+        parser.add_argument('--sessions-per-day', type=int, default=24,
+                            help='Refresh-split sessions generated per working day')
+        parser.add_argument('--breaks-per-day', type=int, default=3)
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        year, month = options['year'], options['month']
+        employee = Employee(name='Benchmark', salary=Decimal('18000.00'))
+
+        sessions, breaks = [], []
+        day = datetime(year, month, 1)
+        while day.month == month:
+            if day.weekday() != 6:
+                # A working day split into short sessions by page refreshes,
+                # with small gaps, overlaps and the odd session left open
+                cursor = timezone.make_aware(day.replace(hour=8, minute=rng.randint(30, 59)))
+                for _ in range(options['sessions_per_day']):
+                    length = timedelta(minutes=rng.randint(5, 25))
+                    closed = rng.random() > 0.1
+                    sessions.append(AttendanceSession(
+                        login_time=cursor,
+                        logout_time=cursor + length if closed else None,
+                        session_expires_at=cursor + length + timedelta(minutes=15),
+                        session_status='refreshed' if closed else 'active',
+                    ))
+                    cursor += length + timedelta(minutes=rng.randint(-3, 6))
+                for _ in range(options['breaks_per_day']):
+                    start = timezone.make_aware(day.replace(hour=rng.randint(9, 16), minute=rng.randint(0, 59)))
+                    breaks.append(BreakSession(
+                        start_time=start,
+                        end_time=start + timedelta(minutes=rng.randint(5, 40)) if rng.random() > 0.1 else None,
+                        logout_reason='Tea break',
+                        approved=rng.random() > 0.3,
+                    ))
+            day += timedelta(days=1)
+        sessions.sort(key=lambda s: s.login_time)
+        breaks.sort(key=lambda b: b.start_time)
+
+        timings = {}
+        results = {}
+        for name, engine in (('engine', month_attendance), ('legacy', legacy_month_attendance)):
+            started = time.perf_counter()
+            for _ in range(options['repeat']):
+                results[name] = engine(employee, year, month, sessions, breaks)
+            timings[name] = (time.perf_counter() - started) / options['repeat']
+
+        self.stdout.write(f"Sessions: {len(sessions)}  Breaks: {len(breaks)}  Month wage: {results['engine'][1]}")
+        self.stdout.write(f"Engine:  {timings['engine'] * 1000:.2f} ms per month")
+        self.stdout.write(f"Legacy:  {timings['legacy'] * 1000:.2f} ms per month")
+        if results['engine'] == results['legacy']:
+            self.stdout.write(self.style.SUCCESS("Engine and legacy results are identical"))
+        else:
+            self.stdout.write(self.style.ERROR("Engine and legacy results differ"))
@@ -0,0 +1,137 @@
+import os
+import random
+import sqlite3
+import statistics
+import tempfile
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+
+SCHEMA = """
+CREATE TABLE session (id INTEGER PRIMARY KEY, last_ping REAL, logout_time REAL);
+CREATE TABLE worksheet (id INTEGER PRIMARY KEY AUTOINCREMENT, employee INTEGER, created REAL);
+"""
+
+
+def _connect(path):
+    # Django's SQLite backend defaults: 5 s busy timeout, autocommit
+    return sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+
+
+class Command(BaseCommand):
+    help = ("Load-test SQLite write-lock contention from attendance heartbeats: per-ping UPDATEs "
+            "against the write-behind buffer's batched CASE flush, measured on concurrent worksheet inserts")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tabs', type=int, default=200, help='Open attendance tabs pinging')
+        parser.add_argument('--ping-interval', type=float, default=0.05,
+                            help='Seconds between pings per tab (time is compressed, 60 s in production)')
+        parser.add_argument('--flush-interval', type=float, default=0.5, help='Buffer flush interval in seconds')
+        parser.add_argument('--writers', type=int, default=4, help='Threads inserting worksheet rows')
+        parser.add_argument('--seconds', type=float, default=3.0)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        for mode in ('direct', 'buffered'):
+            with tempfile.TemporaryDirectory() as tmp:
+                result = self._run(os.path.join(tmp, 'bench.sqlite3'), mode, options)
+            self.stdout.write(
+                f"{mode:>8}: heartbeat writes {result['heartbeat_writes']:>6}  "
+                f"worksheet inserts {result['inserts']:>5}  "
+                f"p50 {result['p50'] * 1000:7.2f} ms  p95 {result['p95'] * 1000:7.2f} ms  "
+                f"max {result['max'] * 1000:7.2f} ms  busy errors {result['busy']}"
+            )
+
+    def _run(self, path, mode, options):
+        setup = _connect(path)
+        setup.executescript(SCHEMA)
+        setup.executemany('INSERT INTO session (id, last_ping) VALUES (?, ?)',
+                          [(i, time.time()) for i in range(1, options['tabs'] + 1)])
+        setup.close()
+
+        stop = threading.Event()
+        lock = threading.Lock()
+        pending = {}
+        counters = {'heartbeat_writes': 0, 'busy': 0}
+        latencies = []
+
+        def count(key):
+            with lock:
+                counters[key] += 1
+
+        def tab(session_id, rng):
+            conn = _connect(path)
+            time.sleep(rng.random() * options['ping_interval'])
+            while not stop.is_set():
+                now = time.time()
+                if mode == 'direct':
+                    try:
+                        conn.execute('UPDATE session SET last_ping = ? WHERE id = ? AND logout_time IS NULL',
+                                     (now, session_id))
+                        count('heartbeat_writes')
+                    except sqlite3.OperationalError:
+                        count('busy')
+                else:
+                    with lock:
+                        pending[session_id] = now
+                time.sleep(options['ping_interval'])
+            conn.close()
+
+        def flusher():
+            conn = _connect(path)
+            while not stop.wait(options['flush_interval']):
+                with lock:
+                    batch = dict(pending)
+                    pending.clear()
+                if not batch:
+                    continue
+                case = ' '.join('WHEN ? THEN ?' for _ in batch)
+                params = [v for item in batch.items() for v in item]
+                ids = list(batch)
+                sql = (f"UPDATE session SET last_ping = CASE id {case} ELSE last_ping END "
+                       f"WHERE id IN ({','.join('?' * len(ids))}) AND logout_time IS NULL")
+                try:
+                    conn.execute(sql, params + ids)
+                    count('heartbeat_writes')
+                except sqlite3.OperationalError:
+                    count('busy')
+            conn.close()
+
+        def writer(employee):
+            conn = _connect(path)
+            while not stop.is_set():
+                started = time.perf_counter()
+                try:
+                    conn.execute('INSERT INTO worksheet (employee, created) VALUES (?, ?)', (employee, time.time()))
+                except sqlite3.OperationalError:
+                    count('busy')
+                    continue
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                time.sleep(0.005)
+            conn.close()
+
+        rng = random.Random(options['seed'])
+        threads = [threading.Thread(target=tab, args=(i, random.Random(rng.random())))
+                   for i in range(1, options['tabs'] + 1)]
+        threads += [threading.Thread(target=writer, args=(i,)) for i in range(options['writers'])]
+        if mode == 'buffered':
+            threads.append(threading.Thread(target=flusher))
+        for thread in threads:
+            thread.start()
+        time.sleep(options['seconds'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        latencies.sort()
+        return {
+            **counters,
+            'inserts': len(latencies),
+            'p50': statistics.median(latencies) if latencies else 0.0,
+            'p95': latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0,
+            'max': latencies[-1] if latencies else 0.0,
+        }
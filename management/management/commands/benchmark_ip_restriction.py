@@ -0,0 +1,79 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from management.ip_restriction import AllowedIPIndex
+
+
+def _legacy_is_allowed(ip, rules):
+    # The per-rule scan RestrictIPMiddleware used before the compiled index
+    for allowed_ip, subnet_prefix in rules:
+        if ip == allowed_ip or (subnet_prefix and ip.startswith(subnet_prefix)):
+            return True
+    return False
+
+
+class Command(BaseCommand):
+    help = "Benchmark AllowedIPIndex lookups against the old linear AllowedIP scan using synthetic rules"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rules', type=int, default=5000, help='Number of synthetic AllowedIP rules')
+        parser.add_argument('--addresses', type=int, default=20000, help='Number of client addresses to look up')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+
+        def random_ip():
+            return '.'.join(str(rng.randint(0, 255)) for _ in range(4))
+
+        rules = []
+        for i in range(options['rules']):
+            kind = i % 4
+            if kind == 0:
+                rules.append((random_ip(), None))
+            elif kind == 1:
+                rules.append((random_ip(), '.'.join(str(rng.randint(0, 255)) for _ in range(3)) + '.'))
+            elif kind == 2:
+                rules.append((random_ip(), '.'.join(str(rng.randint(0, 255)) for _ in range(2)) + '.'))
+            else:
+                # Not on an octet boundary, exercises the raw string-prefix path
+                rules.append((random_ip(), f"{rng.randint(1, 223)}.{rng.randint(0, 25)}"))
+
+        # Half the addresses are drawn from the rules so both outcomes are measured
+        addresses = []
+        for i in range(options['addresses']):
+            if i % 2:
+                addresses.append(random_ip())
+            else:
+                allowed_ip, prefix = rules[rng.randrange(len(rules))]
+                if prefix and prefix.endswith('.'):
+                    octets = prefix.rstrip('.').split('.')
+                    octets += [str(rng.randint(0, 255)) for _ in range(4 - len(octets))]
+                    addresses.append('.'.join(octets))
+                else:
+                    addresses.append(allowed_ip)
+
+        started = time.perf_counter()
+        index = AllowedIPIndex.from_rules(rules)
+        build_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        indexed = [index.contains(ip) for ip in addresses]
+        index_seconds = time.perf_counter() - started
+
+        started = time.perf_counter()
+        legacy = [_legacy_is_allowed(ip, rules) for ip in addresses]
+        legacy_seconds = time.perf_counter() - started
+
+        mismatches = sum(1 for a, b in zip(indexed, legacy) if a != b)
+        count = len(addresses)
+        self.stdout.write(f"Rules: {len(rules)}  Addresses: {count}  Allowed: {sum(indexed)}")
+        self.stdout.write(f"Index build:   {build_seconds * 1000:.1f} ms")
+        self.stdout.write(f"Indexed scan:  {index_seconds * 1000:.1f} ms total, {index_seconds / count * 1e6:.2f} us/lookup")
+        self.stdout.write(f"Linear scan:   {legacy_seconds * 1000:.1f} ms total, {legacy_seconds / count * 1e6:.2f} us/lookup")
+        if mismatches:
+            self.stdout.write(self.style.ERROR(f"{mismatches} lookups disagree with the linear scan"))
+        else:
+            self.stdout.write(self.style.SUCCESS("Indexed and linear results agree"))
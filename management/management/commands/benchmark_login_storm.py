@@ -0,0 +1,132 @@
+import math
+import multiprocessing
+import os
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest.mock import patch
+
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.sessions.backends.db import SessionStore
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections, transaction
+from django.test import RequestFactory
+from django.utils import timezone
+
+from management import views
+from management.models import AttendanceSession, BreakSession, Employee
+
+
+def _login_worker(mode, employee_id, barrier, results):
+    # Forked after the parent closed its connection, so this opens its own
+    employee = Employee.objects.get(pk=employee_id)
+    request = RequestFactory().post('/login/')
+    request.session = SessionStore()
+    request.user = AnonymousUser()
+    if mode == 'deferred':
+        # Plain atomic(): BEGIN DEFERRED, upgraded to the write lock at the first UPDATE
+        patch.object(views, 'write_transaction', transaction.atomic).start()
+    barrier.wait()
+    started = time.perf_counter()
+    try:
+        views._complete_employee_login(request, employee)
+        # SessionMiddleware's save once the view returns
+        request.session.save()
+    except OperationalError:
+        results.put(None)
+    else:
+        results.put(time.perf_counter() - started)
+    finally:
+        connections.close_all()
+
+
+class Command(BaseCommand):
+    help = ("Benchmark a shift-start login storm on SQLite through the real employee login path: "
+            "a deferred login transaction against the shipped one that takes the write lock at BEGIN")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--logins', type=int, default=50, help='Employees logging in at the same moment')
+        parser.add_argument('--open-sessions', type=int, default=3,
+                            help='Open sessions each employee has left over from other devices/refreshes')
+
+    def handle(self, *args, **options):
+        connection = connections[DEFAULT_DB_ALIAS]
+        if connection.vendor != 'sqlite':
+            raise CommandError('The login storm benchmark only applies to the SQLite backend.')
+        # Separate processes, like gunicorn workers, so the GIL doesn't
+        # stretch how long a login holds the write lock
+        context = multiprocessing.get_context('fork')
+        database = connection.settings_dict['NAME']
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                # Migrate a scratch database once and give each mode a copy of it
+                migrated = os.path.join(tmp, 'migrated.sqlite3')
+                self._use_database(migrated)
+                call_command('migrate', verbosity=0, interactive=False)
+                for mode in ('deferred', 'immediate'):
+                    path = os.path.join(tmp, f'{mode}.sqlite3')
+                    connections.close_all()
+                    shutil.copyfile(migrated, path)
+                    self._use_database(path)
+                    result = self._run(context, mode, options)
+                    self.stdout.write(
+                        f"{mode:>9}: {result['ok']}/{options['logins']} logins in {result['wall'] * 1000:7.1f} ms  "
+                        f"p50 {result['p50'] * 1000:7.1f} ms  p95 {result['p95'] * 1000:7.1f} ms  "
+                        f"max {result['max'] * 1000:7.1f} ms  locked errors {result['busy']}  "
+                        f"open sessions left {result['open']}"
+                    )
+        finally:
+            self._use_database(database)
+
+    def _use_database(self, name):
+        connections.close_all()
+        connections[DEFAULT_DB_ALIAS].settings_dict['NAME'] = name
+
+    def _run(self, context, mode, options):
+        logins = options['logins']
+        earlier = timezone.now() - timedelta(hours=3)
+        employees = Employee.objects.bulk_create([
+            Employee(name=f'Storm {i}', mobile_number=f'9{i:09d}', salary=Decimal('12000.00'),
+                     joining_date=date(2024, 1, 1))
+            for i in range(1, logins + 1)
+        ])
+        AttendanceSession.objects.bulk_create([
+            AttendanceSession(employee=employee, login_time=earlier + timedelta(minutes=i))
+            for employee in employees for i in range(options['open_sessions'])
+        ])
+        BreakSession.objects.bulk_create([
+            BreakSession(employee=employee, start_time=earlier + timedelta(hours=1)) for employee in employees
+        ])
+        # Long-running workers have the content type cached already
+        ContentType.objects.get_for_model(Employee)
+        connections.close_all()
+
+        barrier = context.Barrier(logins)
+        results = context.Queue()
+        workers = [
+            context.Process(target=_login_worker, args=(mode, employee.pk, barrier, results))
+            for employee in employees
+        ]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        outcomes = [results.get() for _ in workers]
+        wall = time.perf_counter() - started
+        for worker in workers:
+            worker.join()
+
+        latencies = sorted(latency for latency in outcomes if latency is not None)
+        return {
+            'ok': len(latencies),
+            'busy': len(outcomes) - len(latencies),
+            'wall': wall,
+            'open': AttendanceSession.objects.filter(logout_time__isnull=True).count(),
+            'p50': statistics.median(latencies) if latencies else 0.0,
+            'p95': latencies[max(math.ceil(len(latencies) * 0.95) - 1, 0)] if latencies else 0.0,
+            'max': latencies[-1] if latencies else 0.0,
+        }
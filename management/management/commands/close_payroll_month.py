@@ -0,0 +1,33 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from management.payroll import close_payroll_month, verify_payroll_month
+
+
+class Command(BaseCommand):
+    help = "Freeze a finished month's payroll into PayrollSnapshot rows (defaults to last month)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int)
+        parser.add_argument('--month', type=int)
+        parser.add_argument('--verify', action='store_true',
+                            help="Only re-hash the month's inputs and mark changed snapshots stale")
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        if options['year'] and options['month']:
+            year, month = options['year'], options['month']
+        elif options['year'] or options['month']:
+            raise CommandError("Pass both --year and --month, or neither for last month")
+        else:
+            year, month = (today.year, today.month - 1) if today.month > 1 else (today.year - 1, 12)
+
+        if options['verify']:
+            marked = verify_payroll_month(year, month)
+            self.stdout.write(self.style.SUCCESS(f"{year}-{month:02d}: {marked} snapshot(s) marked stale"))
+            return
+        try:
+            written = close_payroll_month(year, month)
+        except ValueError as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f"Closed {year}-{month:02d}: {written} snapshot(s) written"))
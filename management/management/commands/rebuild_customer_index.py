@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from management.customers import rebuild_customer_index
+
+
+class Command(BaseCommand):
+    help = "Recompute the Customer index and its record links from tokens, worksheets, uploads, applications and TTD bookings"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        written = rebuild_customer_index(batch_size=max(options['batch_size'], 1))
+        self.stdout.write(self.style.SUCCESS(f"Indexed {written} customers"))
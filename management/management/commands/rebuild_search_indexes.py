@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from management.search import SEARCH_INDEXES, install_search_indexes, rebuild_search_index, search_available
+
+
+class Command(BaseCommand):
+    help = "Install any missing FTS5 search indexes and re-read the token, worksheet and upload text into them"
+
+    def add_arguments(self, parser):
+        parser.add_argument('indexes', nargs='*', help=f"Indexes to rebuild ({', '.join(SEARCH_INDEXES)}); defaults to all")
+
+    def handle(self, *args, **options):
+        unknown = set(options['indexes']) - set(SEARCH_INDEXES)
+        if unknown:
+            raise CommandError(f"Unknown search index: {', '.join(sorted(unknown))}")
+
+        install_search_indexes()
+        if not search_available():
+            raise CommandError("This database can't hold FTS5 trigram indexes; searches use LIKE scans")
+        for index in options['indexes'] or SEARCH_INDEXES:
+            rebuild_search_index(index)
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt the {index} search index"))
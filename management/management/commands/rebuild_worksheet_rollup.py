@@ -0,0 +1,30 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from management.worksheet_rollup import rebuild_worksheet_rollup
+
+
+class Command(BaseCommand):
+    help = "Recompute WorksheetRollup rows from the worksheet entries, for every day or a date range"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day (YYYY-MM-DD); defaults to the earliest entry')
+        parser.add_argument('--end', help='Last day (YYYY-MM-DD); defaults to the latest entry')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def _date(self, value, name):
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            raise CommandError(f"--{name} must be YYYY-MM-DD, got {value!r}")
+
+    def handle(self, *args, **options):
+        start = self._date(options['start'], 'start') if options['start'] else None
+        end = self._date(options['end'], 'end') if options['end'] else None
+        if start and end and start > end:
+            raise CommandError(f"--start {start} is after --end {end}")
+
+        written = rebuild_worksheet_rollup(start, end, batch_size=max(options['batch_size'], 1))
+        span = f"{start or 'the start'} to {end or 'the end'}"
+        self.stdout.write(self.style.SUCCESS(f"Wrote {written} worksheet rollup rows for {span}"))
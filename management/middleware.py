@@ -3,6 +3,14 @@ from django.http import JsonResponse
 from django.utils.deprecation import MiddlewareMixin
 from django.shortcuts import redirect
 from django.urls import reverse
+from management.attendance_registry import (
+    NO_ACTIVE_SESSION,
+    clear_active_attendance_session,
+    get_active_attendance_session_id,
+    set_active_attendance_session,
+)
+from management.attendance_summary import refresh_session_days
+from management.employee_context import get_request_employee
 from management.models import AttendanceSession, Employee
 from management.utils import get_employee_next_day_alert_state
 from django.utils import timezone
@@ -11,7 +19,8 @@ from django.utils import timezone
 class AdminSingleDeviceMiddleware(MiddlewareMixin):
     """
     On every request to /admin/ or /admin-dashboard/, checks whether the
-    logged-in admin's session key matches the one stored in AdminActiveSession.
+    logged-in admin's session key matches the one stored in AdminActiveSession
+    (read through the cache, see get_admin_session_key).
     If it doesn't (i.e. another device logged in after this one), the session
     is flushed and the user is redirected to the login page.
     """
@@ -28,9 +37,9 @@ class AdminSingleDeviceMiddleware(MiddlewareMixin):
         user_id = request.session.get('_auth_user_id')
         if not user_id:
             return None
-        from management.models import AdminActiveSession
-        record = AdminActiveSession.objects.filter(user_id=user_id).first()
-        if record and record.session_key != request.session.session_key:
+        from management.admin_otp_login import get_admin_session_key
+        active_session_key = get_admin_session_key(user_id)
+        if active_session_key and active_session_key != request.session.session_key:
             request.session.flush()
             return redirect('/admin/login/?next=' + path)
         return None
@@ -97,32 +106,39 @@ class SingleDeviceSessionMiddleware(MiddlewareMixin):
         path = request.path
         if any(path.startswith(p) for p in [reverse('login'), reverse('logout'), '/employee/refresh_session/']):
             return None
-        try:
-            employee = Employee.objects.get(employee_id=employee_id)
-        except Employee.DoesNotExist:
+        # Fast path: the registry already agrees with this browser session
+        current_session_id = request.session.get('attendance_session_id')
+        registered_id = get_active_attendance_session_id(employee_id)
+        if registered_id is not None and registered_id in (NO_ACTIVE_SESSION, current_session_id):
             return None
         # Only one active session allowed
-        open_sessions = AttendanceSession.objects.filter(employee=employee, logout_time__isnull=True, session_closed=False).order_by('-login_time')
-        if open_sessions.count() > 1:
+        open_sessions = list(
+            AttendanceSession.objects.filter(employee_id=employee_id, logout_time__isnull=True, session_closed=False).order_by('-login_time')
+        )
+        if len(open_sessions) > 1:
             now = timezone.now()
             latest_session = open_sessions[0]
-            closed_any = False
-            for s in open_sessions[1:]:
-                s.logout_time = now
-                s.logout_reason = "Auto-logout: Multiple sessions detected"
-                s.session_closed = True
-                s.session_status = "ended"
-                s.save(update_fields=["logout_time", "logout_reason", "session_closed", "session_status"])
-                if request.session.get('attendance_session_id') == s.id:
-                    request.session.flush()
-                    closed_any = True
+            stale_ids = [s.id for s in open_sessions[1:]]
+            AttendanceSession.objects.filter(id__in=stale_ids).update(
+                logout_time=now,
+                logout_reason="Auto-logout: Multiple sessions detected",
+                session_closed=True,
+                session_status="ended",
+            )
+            refresh_session_days(stale_ids)
+            set_active_attendance_session(employee_id, latest_session.id)
             # If this request was for a closed session, redirect to login
-            if closed_any:
+            if current_session_id in stale_ids:
+                request.session.flush()
                 return redirect(reverse('login'))
             # Otherwise, set the session id to the latest
             request.session['attendance_session_id'] = latest_session.id
-        elif open_sessions.count() == 1:
-            request.session['attendance_session_id'] = open_sessions[0].id
+        elif open_sessions:
+            set_active_attendance_session(employee_id, open_sessions[0].id)
+            if current_session_id != open_sessions[0].id:
+                request.session['attendance_session_id'] = open_sessions[0].id
+        else:
+            clear_active_attendance_session(employee_id)
         return None
 
 
@@ -148,15 +164,19 @@ class EmployeeNextDayAvailabilityMiddleware(MiddlewareMixin):
         if any(path.startswith(prefix) for prefix in exempt_prefixes):
             return None
 
-        try:
-            employee = Employee.objects.get(employee_id=employee_id)
-        except Employee.DoesNotExist:
+        # Only writes can be blocked; for reads the context processor looks
+        # the state up if the rendered template shows the alert.
+        if request.method not in ('POST', 'PUT', 'PATCH', 'DELETE'):
+            return None
+
+        employee = get_request_employee(request)
+        if employee is None:
             return None
 
         state = get_employee_next_day_alert_state(employee)
         request.employee_next_day_alert_state = state
 
-        if request.method in ('POST', 'PUT', 'PATCH', 'DELETE') and state['pending']:
+        if state['pending']:
             message = 'Please answer the tomorrow availability alert before using other features.'
             if request.headers.get('x-requested-with') == 'XMLHttpRequest':
                 return JsonResponse({'status': 'blocked', 'message': message}, status=403)
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:56
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0102_salarypayment_remarks'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EmployeeNavbarStats',
+            fields=[
+                ('employee', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='navbar_stats', serialize=False, to='management.employee')),
+                ('stats_date', models.DateField()),
+                ('daily_target', models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True)),
+                ('daily_collected', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('worksheet_commission', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('application_commission', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('commission_paid', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('department_balance', models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True)),
+                ('refreshed_at', models.DateTimeField()),
+                ('balance_department', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='management.department')),
+            ],
+            options={
+                'verbose_name': 'Employee Navbar Stats',
+                'verbose_name_plural': 'Employee Navbar Stats',
+            },
+        ),
+    ]
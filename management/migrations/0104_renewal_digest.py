@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0103_employeenavbarstats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RenewalDigest',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest_date', models.DateField(unique=True)),
+                ('expired_count', models.PositiveIntegerField(default=0)),
+                ('due_soon_count', models.PositiveIntegerField(default=0)),
+                ('service_counts', models.JSONField(default=list)),
+                ('expired_items', models.JSONField(default=list)),
+                ('due_soon_items', models.JSONField(default=list)),
+                ('generated_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'ordering': ['-digest_date'],
+            },
+        ),
+        migrations.AlterField(
+            model_name='employeeupload',
+            name='renewal_date',
+            field=models.DateField(blank=True, db_index=True, help_text='Date when this upload needs to be renewed', null=True),
+        ),
+    ]
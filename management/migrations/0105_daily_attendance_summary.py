@@ -0,0 +1,38 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:08
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0104_renewal_digest'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyAttendanceSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('has_attendance', models.BooleanField(default=False)),
+                ('first_login', models.DateTimeField(blank=True, null=True)),
+                ('last_logout', models.DateTimeField(blank=True, null=True)),
+                ('work_seconds', models.FloatField(default=0)),
+                ('approved_break_seconds', models.FloatField(default=0)),
+                ('break_sessions', models.JSONField(default=list)),
+                ('daily_wage', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('salary', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True)),
+                ('working_start_time', models.TimeField(blank=True, null=True)),
+                ('working_end_time', models.TimeField(blank=True, null=True)),
+                ('computed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_attendance_summaries', to='management.employee')),
+            ],
+            options={
+                'ordering': ['employee', 'date'],
+                'unique_together': {('employee', 'date')},
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:15
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0105_daily_attendance_summary'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PayrollSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField()),
+                ('month', models.PositiveSmallIntegerField()),
+                ('version', models.PositiveIntegerField(default=1)),
+                ('inputs_hash', models.CharField(max_length=64)),
+                ('attendance_salary', models.DecimalField(decimal_places=4, default=0, max_digits=14)),
+                ('application_commissions', models.DecimalField(decimal_places=4, default=0, max_digits=14)),
+                ('worksheet_commissions', models.DecimalField(decimal_places=4, default=0, max_digits=14)),
+                ('meetings_bonus', models.DecimalField(decimal_places=4, default=0, max_digits=14)),
+                ('trainings_bonus', models.DecimalField(decimal_places=4, default=0, max_digits=14)),
+                ('performance_bonus', models.DecimalField(decimal_places=4, default=0, max_digits=14)),
+                ('extra_days_bonus', models.DecimalField(decimal_places=4, default=0, max_digits=14)),
+                ('deduction_amount', models.DecimalField(decimal_places=4, default=0, max_digits=14)),
+                ('total_earnings', models.DecimalField(decimal_places=4, default=0, max_digits=14)),
+                ('closed_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('is_stale', models.BooleanField(default=False)),
+                ('stale_reason', models.CharField(blank=True, max_length=255)),
+                ('stale_since', models.DateTimeField(blank=True, null=True)),
+                ('closed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payroll_snapshots', to='management.employee')),
+            ],
+            options={
+                'ordering': ['-year', '-month', 'employee'],
+                'unique_together': {('employee', 'year', 'month')},
+            },
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:29
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q, Sum
+
+
+def build_rollup(apps, schema_editor):
+    worksheet_model = apps.get_model('management', 'Worksheet')
+    rollup_model = apps.get_model('management', 'WorksheetRollup')
+    totals = ('amount', 'payment', 'approved_amount', 'stocks_used', 'entry_count')
+    cells = {}
+    rows = (
+        worksheet_model.objects.order_by()
+        .values('employee_id', 'department_name', 'service', 'date')
+        .annotate(
+            sum_amount=Sum('amount'),
+            sum_payment=Sum('payment'),
+            sum_approved_amount=Sum('amount', filter=Q(approved=True)),
+            sum_stocks_used=Sum('stocks_used'),
+            sum_entry_count=Count('pk'),
+        )
+    )
+    for row in rows.iterator():
+        key = (row['employee_id'], row['department_name'], row['service'] or '', row['date'])
+        cell = cells.setdefault(key, dict.fromkeys(totals, 0))
+        for name in totals:
+            cell[name] += row[f'sum_{name}'] or 0
+    rollup_model.objects.bulk_create(
+        (
+            rollup_model(employee_id=employee_id, department_name=department_name, service=service, date=day, **values)
+            for (employee_id, department_name, service, day), values in cells.items()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0107_scheduler_lock'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WorksheetRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('department_name', models.CharField(max_length=50)),
+                ('service', models.CharField(blank=True, default='', max_length=200)),
+                ('date', models.DateField()),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('payment', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('approved_amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('stocks_used', models.PositiveIntegerField(default=0)),
+                ('entry_count', models.PositiveIntegerField(default=0)),
+                ('employee', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='worksheet_rollups', to='management.employee')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'employee'], name='management__date_5f3b63_idx')],
+                'unique_together': {('employee', 'department_name', 'service', 'date')},
+            },
+        ),
+        migrations.RunPython(build_rollup, migrations.RunPython.noop),
+    ]
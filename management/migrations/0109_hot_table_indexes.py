@@ -0,0 +1,70 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0108_worksheet_rollup'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='attendancesession',
+            name='employee',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='attendance_sessions', to='management.employee'),
+        ),
+        migrations.AlterField(
+            model_name='breaksession',
+            name='employee',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='break_sessions', to='management.employee'),
+        ),
+        migrations.AlterField(
+            model_name='tokenchatmessage',
+            name='token',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='chat_messages', to='management.token'),
+        ),
+        migrations.AlterField(
+            model_name='worksheet',
+            name='employee',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='worksheet_entries', to='management.employee'),
+        ),
+        migrations.AddIndex(
+            model_name='attendancesession',
+            index=models.Index(fields=['employee', 'login_time'], name='attendance_employee_login_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attendancesession',
+            index=models.Index(condition=models.Q(('logout_time__isnull', True)), fields=['employee', 'login_time'], name='attendance_open_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='breaksession',
+            index=models.Index(fields=['employee', 'start_time'], name='break_employee_start_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='employeetarget',
+            index=models.Index(fields=['date'], name='employeetarget_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tokenchatmessage',
+            index=models.Index(fields=['token', 'sender', 'created_at'], name='tokenchat_token_sender_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='usernotificationstatus',
+            index=models.Index(condition=models.Q(('is_read', False)), fields=['employee'], name='notification_unread_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='worksheet',
+            index=models.Index(fields=['employee', 'date'], name='worksheet_employee_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='worksheet',
+            index=models.Index(fields=['department_name', 'date'], name='worksheet_department_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='worksheet',
+            index=models.Index(condition=models.Q(('token_no__isnull', False)), fields=['token_no'], name='worksheet_token_no_idx'),
+        ),
+    ]
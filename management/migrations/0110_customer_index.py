@@ -0,0 +1,107 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:39
+
+import re
+from datetime import datetime, time
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def _normalize_mobile(value):
+    digits = re.sub(r'\D', '', value or '')
+    if len(digits) > 10 and digits[:-10] in ('0', '91', '091', '0091'):
+        digits = digits[-10:]
+    return digits if len(digits) == 10 else None
+
+
+def build_customer_index(apps, schema_editor):
+    customer_model = apps.get_model('management', 'Customer')
+    record_model = apps.get_model('management', 'CustomerRecord')
+    # source: (model, mobile fields, name field, seen-at field, count field)
+    sources = {
+        'token': ('Token', ('cell_no',), 'customer_name', 'created_at', 'token_count'),
+        'worksheet': ('Worksheet', ('customer_mobile', 'login_mobile_no'), 'customer_name', 'created_at', 'worksheet_count'),
+        'upload': ('EmployeeUpload', ('mobile_number',), None, 'uploaded_at', 'upload_count'),
+        'application': ('Application', ('customer_mobile_number',), 'customer_name', 'date_created', 'application_count'),
+        'ttd_darshan': ('TTDIndividualDarshan', ('mobile_number',), 'name', 'created_at', 'ttd_count'),
+        'ttd_member': ('TTDGroupMember', ('mobile_number',), 'name', 'group__created_at', 'ttd_count'),
+    }
+    counts = ('token_count', 'worksheet_count', 'upload_count', 'application_count', 'ttd_count')
+    customers = {}
+    links = []
+    for source, (model_name, mobile_fields, name_field, seen_field, count_field) in sources.items():
+        fields = ['pk', *mobile_fields, seen_field] + ([name_field] if name_field else [])
+        if source == 'worksheet':
+            fields.append('date')
+        for row in apps.get_model('management', model_name).objects.order_by().values(*fields).iterator():
+            seen = row[seen_field] or row.get('date') or timezone.now()
+            if not isinstance(seen, datetime):
+                seen = timezone.make_aware(datetime.combine(seen, time.min))
+            name = (row[name_field] or '') if name_field else ''
+            for mobile in {_normalize_mobile(row[field]) for field in mobile_fields} - {None}:
+                customer = customers.setdefault(mobile, {
+                    'mobile': mobile, 'name': '', 'first_seen': seen, 'last_seen': seen, 'name_seen': None,
+                    **dict.fromkeys(counts, 0),
+                })
+                customer[count_field] += 1
+                customer['first_seen'] = min(customer['first_seen'], seen)
+                customer['last_seen'] = max(customer['last_seen'], seen)
+                if name and (customer['name_seen'] is None or seen >= customer['name_seen']):
+                    customer['name'], customer['name_seen'] = name, seen
+                links.append((mobile, source, row['pk'], name, seen))
+
+    customer_model.objects.bulk_create(
+        (customer_model(**{key: value for key, value in values.items() if key != 'name_seen'})
+         for values in customers.values()),
+        batch_size=1000,
+    )
+    customer_ids = dict(customer_model.objects.values_list('mobile', 'pk'))
+    record_model.objects.bulk_create(
+        (
+            record_model(customer_id=customer_ids[mobile], source=source, object_id=object_id, name=name, seen_at=seen)
+            for mobile, source, object_id, name, seen in links
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0109_hot_table_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Customer',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('mobile', models.CharField(max_length=10, unique=True)),
+                ('name', models.CharField(blank=True, default='', max_length=255)),
+                ('first_seen', models.DateTimeField(blank=True, null=True)),
+                ('last_seen', models.DateTimeField(blank=True, null=True)),
+                ('token_count', models.PositiveIntegerField(default=0)),
+                ('worksheet_count', models.PositiveIntegerField(default=0)),
+                ('upload_count', models.PositiveIntegerField(default=0)),
+                ('application_count', models.PositiveIntegerField(default=0)),
+                ('ttd_count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CustomerRecord',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('token', 'Token'), ('worksheet', 'Worksheet entry'), ('upload', 'Employee upload'), ('application', 'Application'), ('ttd_darshan', 'TTD individual darshan'), ('ttd_member', 'TTD group member')], max_length=20)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('name', models.CharField(blank=True, default='', max_length=255)),
+                ('seen_at', models.DateTimeField()),
+                ('customer', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='records', to='management.customer')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['source', 'object_id'], name='customerrecord_source_idx')],
+                'unique_together': {('customer', 'source', 'object_id')},
+            },
+        ),
+        migrations.RunPython(build_customer_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('management', '0111_token_sequence'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='token',
+            name='token_no',
+            field=models.CharField(blank=True, help_text='9-digit token number in yymmddNNN format; allocated on first save when left blank', max_length=9, unique=True),
+        ),
+    ]
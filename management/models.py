@@ -1,6 +1,8 @@
-from django.db import models
+from django.db import DEFAULT_DB_ALIAS, connections, models, transaction
 from django.contrib.auth.models import User
 
+from .transactions import write_transaction
+
 # --- UserProfile for Admin/Staff OTP Login ---
 class UserProfile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
@@ -182,13 +184,14 @@ class EmployeeTarget(models.Model):
     class Meta:
         unique_together = ('employee', 'date')
         ordering = ['-date', 'employee__name']
+        indexes = [models.Index(fields=['date'], name='employeetarget_date_idx')]
 
     def __str__(self):
         return f"Target for {self.employee.name} on {self.date}: ₹{self.target_amount}"
 
 
 class Holiday(models.Model):
-    """Admin-declared holidays. next_working_day() skips these dates."""
+    """Admin-declared holidays. next_working_day() skips these dates (via the cached WorkingDayCalendar)."""
     date = models.DateField(unique=True)
     reason = models.CharField(max_length=200, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -303,8 +306,9 @@ class Employee(models.Model):
     )
 
     def is_active(self):
-        # Assuming you have an AttendanceSession model with a 'logout_time'
-        return self.attendance_sessions.filter(logout_time__isnull=True).exists()
+        """Whether the employee has an open AttendanceSession, from the presence registry."""
+        from .attendance_registry import is_employee_online
+        return is_employee_online(self.employee_id)
 
     def __str__(self):
         return f"{self.employee_id} - {self.name}{' 🟢 Active' if self.is_active() else ''}"
@@ -329,145 +333,18 @@ class Employee(models.Model):
         """
         Generates a day-by-day attendance summary with earliest login, latest logout, and break sessions.
         """
-        from .models import AttendanceSession, BreakSession
-        from django.utils import timezone
-        from calendar import monthrange
-        from datetime import datetime, time, timedelta
-        from decimal import Decimal
+        from .attendance_summary import summarized_month_attendance_for_employees
 
-        days_in_month = monthrange(year, month)[1]
-        daily_records = []
-        total_monthly_wage = Decimal('0.00')
+        return summarized_month_attendance_for_employees([self], year, month)[self.pk]
 
-        start_work_time = self.working_start_time or time(9, 0)
-        end_work_time = self.working_end_time or time(17, 0)
-        
-        base_daily_wage = self.salary / Decimal(days_in_month) if self.salary and days_in_month > 0 else Decimal('0.00')
+    def get_day_attendance(self, day):
+        """
+        Returns (record, max_daily_wage) for one date, where record matches
+        that day's entry in get_daily_attendance_summary.
+        """
+        from .attendance_summary import get_day_attendance
 
-        all_attendance_sessions = list(AttendanceSession.objects.filter(
-            employee=self,
-            login_time__year=year,
-            login_time__month=month,
-            session_status__in=["active", "refreshed", "ended"]
-        ).order_by('login_time'))
-
-        all_break_sessions = list(BreakSession.objects.filter(
-            employee=self, start_time__year=year, start_time__month=month
-        ).order_by('start_time'))
-
-        for day in range(1, days_in_month + 1):
-            current_date = datetime(year, month, day).date()
-            work_start_datetime = timezone.make_aware(datetime.combine(current_date, start_work_time))
-            work_end_datetime = timezone.make_aware(datetime.combine(current_date, end_work_time))
-
-            # Attendance sessions for the day within working hours
-            day_attendance = [
-                s for s in all_attendance_sessions
-                if timezone.localtime(s.login_time).date() == current_date and s.login_time < work_end_datetime
-            ]
-
-            # Find earliest login after working start time
-            login_time = None
-            if day_attendance:
-                login_candidates = [s.login_time for s in day_attendance if s.login_time >= work_start_datetime]
-                if login_candidates:
-                    login_time = min(login_candidates)
-                else:
-                    login_time = min(s.login_time for s in day_attendance)
-
-            # Find latest logout before working end time
-            logout_time = None
-            if day_attendance:
-                logout_candidates = [s.logout_time for s in day_attendance if s.logout_time and s.logout_time <= work_end_datetime]
-                if logout_candidates:
-                    logout_time = max(logout_candidates)
-                else:
-                    # If no session has logout_time, use latest session_expires_at or working end
-                    session_ends = [s.session_expires_at for s in day_attendance if s.session_expires_at]
-                    if session_ends:
-                        logout_time = max(session_ends)
-                    else:
-                        logout_time = None
-
-            # Break sessions for the day
-            day_breaks = []
-            for b in all_break_sessions:
-                if timezone.localtime(b.start_time).date() == current_date:
-                    break_end = b.end_time or work_end_datetime
-                    if b.start_time < work_end_datetime and break_end > work_start_datetime:
-                        day_breaks.append(b)
-
-            # Calculate total active seconds (same as before)
-            total_active_seconds = 0
-            if day_attendance:
-                intervals = []
-                for s in day_attendance:
-                    session_end = s.logout_time or s.session_expires_at or work_end_datetime
-                    overlap_start = max(s.login_time, work_start_datetime)
-                    overlap_end = min(session_end, work_end_datetime)
-                    if overlap_end > overlap_start:
-                        intervals.append((overlap_start, overlap_end))
-                intervals.sort()
-                merged = []
-                for start, end in intervals:
-                    if not merged or start > merged[-1][1]:
-                        merged.append([start, end])
-                    else:
-                        merged[-1][1] = max(merged[-1][1], end)
-                work_seconds = sum((end - start).total_seconds() for start, end in merged)
-
-                approved_break_seconds = 0
-                for b in day_breaks:
-                    if b.approved and b.end_time:
-                        overlap_start = max(b.start_time, work_start_datetime)
-                        overlap_end = min(b.end_time, work_end_datetime)
-                        if overlap_end > overlap_start:
-                            approved_break_seconds += (overlap_end - overlap_start).total_seconds()
-
-                total_active_seconds = work_seconds + approved_break_seconds
-
-            wage_target_seconds = (work_end_datetime - work_start_datetime).total_seconds() - (2 * 3600)
-            if wage_target_seconds <= 0:
-                wage_target_seconds = (work_end_datetime - work_start_datetime).total_seconds()
-
-            capped_active_seconds = min(total_active_seconds, wage_target_seconds)
-            daily_wage = Decimal('0.00')
-            if wage_target_seconds > 0:
-                work_ratio = Decimal(capped_active_seconds) / Decimal(wage_target_seconds)
-                daily_wage = base_daily_wage * work_ratio
-                daily_wage = max(Decimal('0.00'), daily_wage)
-
-            total_monthly_wage += daily_wage
-
-            # Formatting for break sessions
-            break_details = []
-            for b in day_breaks:
-                duration_str = "Ongoing"
-                if b.end_time:
-                    td = b.end_time - b.start_time
-                    h, rem = divmod(td.total_seconds(), 3600)
-                    m, _ = divmod(rem, 60)
-                    duration_str = f"{int(h)}h {int(m)}m"
-                break_details.append({
-                    'timings': f"{timezone.localtime(b.start_time).strftime('%I:%M %p')} - {timezone.localtime(b.end_time).strftime('%I:%M %p') if b.end_time else 'Active'}",
-                    'reason': b.logout_reason, 'duration': duration_str, 'approved': b.approved
-                })
-
-            h, rem = divmod(total_active_seconds, 3600)
-            m, _ = divmod(rem, 60)
-            total_duration_str = f"{int(h)}h {int(m)}m"
-
-            daily_records.append({
-                'sl_no': day,
-                'date': current_date,
-                'login_time': timezone.localtime(login_time) if login_time else None,
-                'logout_time': timezone.localtime(logout_time) if logout_time else None,
-                'break_sessions': break_details,
-                'total_duration': total_duration_str,
-                'daily_wage': round(daily_wage, 2),
-            })
-
-        return daily_records, round(total_monthly_wage, 2), round(base_daily_wage, 2)
+        return get_day_attendance(self, day)
 
 
 
@@ -479,6 +356,47 @@ class Employee(models.Model):
 
 # In models.py, inside the Employee class
 
+    def get_application_commission(self, year, month):
+        """Commission from approved applications created in the given month."""
+        from django.db.models import Sum
+        from decimal import Decimal
+
+        return ApplicationAssignment.objects.filter(
+            employee=self,
+            application__approved=True,
+            application__date_created__year=year,
+            application__date_created__month=month
+        ).aggregate(total=Sum('commission_amount'))['total'] or Decimal('0.00')
+
+    def get_worksheet_commission(self, year, month):
+        """
+        5% of approved worksheet amounts for the month. Xerox only earns it
+        on the part of each day's total above 500.
+        """
+        from django.db.models import Sum
+        from decimal import Decimal
+        from collections import defaultdict
+
+        total_worksheet_commission = Decimal('0.00')
+        monthly_rollups = self.worksheet_rollups.filter(
+            date__year=year,
+            date__month=month,
+        )
+
+        is_xerox_dept = self.department and self.department.name == 'Xerox'
+        if is_xerox_dept:
+            daily_totals = defaultdict(Decimal)
+            for day, amount in monthly_rollups.values_list('date', 'approved_amount'):
+                daily_totals[day] += amount
+
+            for total_amount in daily_totals.values():
+                if total_amount > 500:
+                    total_worksheet_commission += (total_amount - 500) * Decimal('0.05')
+        else:
+            total_monthly_amount = monthly_rollups.aggregate(total=Sum('approved_amount'))['total'] or Decimal('0.00')
+            total_worksheet_commission = total_monthly_amount * Decimal('0.05')
+        return total_worksheet_commission
+
     def get_current_month_earnings(self, year=None, month=None):
         """
         Calculates all earnings and deductions for a given month/year.
@@ -505,33 +423,10 @@ class Employee(models.Model):
         _, attendance_salary,_ = self.get_daily_attendance_summary(year, month)
 
         # 2. Calculate Application Commissions (Logic remains the same)
-        application_commissions = ApplicationAssignment.objects.filter(
-            employee=self,
-            application__approved=True,
-            application__date_created__year=year,
-            application__date_created__month=month
-        ).aggregate(total=Sum('commission_amount'))['total'] or Decimal('0.00')
+        application_commissions = self.get_application_commission(year, month)
 
         # 3. Calculate Worksheet Commissions (Logic remains the same)
-        total_worksheet_commission = Decimal('0.00')
-        monthly_worksheets = self.worksheet_entries.filter(
-            date__year=year,
-            date__month=month,
-            approved=True
-        )
-        
-        is_xerox_dept = self.department and self.department.name == 'Xerox'
-        if is_xerox_dept:
-            daily_totals = defaultdict(Decimal)
-            for entry in monthly_worksheets:
-                daily_totals[entry.date] += entry.amount
-            
-            for total_amount in daily_totals.values():
-                if total_amount > 500:
-                    total_worksheet_commission += (total_amount - 500) * Decimal('0.05')
-        else:
-            total_monthly_amount = monthly_worksheets.aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
-            total_worksheet_commission = total_monthly_amount * Decimal('0.05')
+        total_worksheet_commission = self.get_worksheet_commission(year, month)
 
         # --- UPDATED BONUS CALCULATION LOGIC ---
         # 4. Calculate total bonuses by summing amounts from the new event-based models
@@ -589,7 +484,8 @@ class Employee(models.Model):
 
 class AttendanceSession(models.Model):
     uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
-    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='attendance_sessions')
+    # Indexed through attendance_employee_login_idx
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='attendance_sessions', db_index=False)
     login_time = models.DateTimeField()
     logout_time = models.DateTimeField(null=True, blank=True)
     logout_reason = models.CharField(max_length=250, blank=True)
@@ -602,6 +498,14 @@ class AttendanceSession(models.Model):
     class Meta:
         verbose_name_plural = 'Attendance Sessions'
         ordering = ['-login_time']
+        indexes = [
+            models.Index(fields=['employee', 'login_time'], name='attendance_employee_login_idx'),
+            # Open sessions only: login, middleware, ping, presence and stale cleanup
+            models.Index(
+                fields=['employee', 'login_time'], name='attendance_open_idx',
+                condition=models.Q(logout_time__isnull=True),
+            ),
+        ]
 
     def duration(self):
         end_time = self.logout_time or timezone.now()
@@ -614,13 +518,17 @@ class AttendanceSession(models.Model):
 
 class BreakSession(models.Model):
     uuid = models.UUIDField(default=uuid.uuid4, editable=False, unique=True)
-    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='break_sessions')
+    # Indexed through break_employee_start_idx
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='break_sessions', db_index=False)
     start_time = models.DateTimeField()
     end_time = models.DateTimeField(null=True, blank=True)
     logout_reason = models.CharField(max_length=250)
     approved = models.BooleanField(default=False)
     ended_by_login = models.BooleanField(default=False)
 
+    class Meta:
+        indexes = [models.Index(fields=['employee', 'start_time'], name='break_employee_start_idx')]
+
     def duration(self):
         if self.end_time:
             return self.end_time - self.start_time
@@ -677,9 +585,9 @@ class GlobalIPSettings(models.Model):
         # Ensure only one instance of this model ever exists
         self.pk = 1
         super().save(*args, **kwargs)
-        # Clear the IP cache whenever this setting is saved
-        from django.core.cache import cache
-        cache.clear()
+        # Rebuild the compiled IP allow-list whenever this setting is saved
+        from .ip_restriction import bump_ip_rules_version
+        bump_ip_rules_version()
 
     class Meta:
         verbose_name_plural = "Global IP Settings"
@@ -729,36 +637,50 @@ class ServiceType(models.Model):
         return self.name
 
 
-def generate_token_no():
-    """Generate token number in yymmddNNN format with a daily reset counter."""
-    date_prefix = timezone.localdate().strftime('%y%m%d')
-
-    last_today_token = (
-        Token.objects.filter(token_no__startswith=date_prefix)
-        .order_by('-token_no')
-        .values_list('token_no', flat=True)
-        .first()
-    )
+class TokenSequence(models.Model):
+    """
+    The last token number handed out on each day. generate_token_no()
+    bumps it with one upsert, so allocating a token is a single write and
+    two counters can't draw the same number.
+    """
+    date = models.DateField(unique=True)
+    last_value = models.PositiveIntegerField(default=0)
 
-    sequence = 1
-    if last_today_token and len(last_today_token) == 9 and last_today_token[6:].isdigit():
-        sequence = int(last_today_token[6:]) + 1
+    def __str__(self):
+        return f"Tokens on {self.date}: {self.last_value}"
 
-    while sequence <= 999:
-        token_no = f"{date_prefix}{sequence:03d}"
-        if not Token.objects.filter(token_no=token_no).exists():
-            return token_no
-        sequence += 1
 
-    raise ValueError('Daily token limit reached for today (999).')
+def generate_token_no(using=DEFAULT_DB_ALIAS):
+    """Generate token number in yymmddNNN format with a daily reset counter."""
+    connection = connections[using]
+    today = timezone.localdate()
+    date_prefix = today.strftime('%y%m%d')
+    sequence_table = connection.ops.quote_name(TokenSequence._meta.db_table)
+    token_table = connection.ops.quote_name(Token._meta.db_table)
+    # The day's first allocation starts after any token already issued
+    # today (tokens from before this table existed); later ones just add 1.
+    # The upsert is the block's first statement, so it takes SQLite's write
+    # lock straight away and concurrent counters queue on the busy timeout.
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.execute(
+            f"INSERT INTO {sequence_table} (date, last_value) VALUES (%s, COALESCE(CAST(SUBSTR("
+            f"(SELECT MAX(token_no) FROM {token_table} WHERE token_no BETWEEN %s AND %s), 7) AS INTEGER), 0) + 1) "
+            f"ON CONFLICT (date) DO UPDATE SET last_value = {sequence_table}.last_value + 1 RETURNING last_value",
+            [connection.ops.adapt_datefield_value(today), f'{date_prefix}000', f'{date_prefix}999'],
+        )
+        (sequence,) = cursor.fetchone()
+        if sequence > 999:
+            # Rolls the increment back with the transaction
+            raise ValueError('Daily token limit reached for today (999).')
+    return f"{date_prefix}{sequence:03d}"
 
 
 class Token(models.Model):
     token_no = models.CharField(
         max_length=9,
         unique=True,
-        default=generate_token_no,
-        help_text='9-digit token number in yymmddNNN format',
+        blank=True,
+        help_text='9-digit token number in yymmddNNN format; allocated on first save when left blank',
     )
     created_at = models.DateTimeField(auto_now_add=True, help_text='Auto-generated date and time')
     customer_name = models.CharField(max_length=255, help_text='Name of the customer')
@@ -790,6 +712,15 @@ class Token(models.Model):
     def __str__(self):
         return f"Token {self.token_no} - {self.customer_name}"
 
+    # Allocated here rather than as the field default, so building a Token
+    # (an unbound form, an invalid POST) draws no number, and a failed
+    # insert rolls the sequence back with it
+    def save(self, *args, **kwargs):
+        with transaction.atomic():
+            if not self.token_no:
+                self.token_no = generate_token_no()
+            super().save(*args, **kwargs)
+
 
 def token_chat_attachment_upload_to(instance, filename):
     token_no = instance.token.token_no if instance and instance.token_id else 'unknown_token'
@@ -808,7 +739,8 @@ class TokenChatMessage(models.Model):
         (SENDER_ADMIN, 'Admin'),
     )
 
-    token = models.ForeignKey(Token, on_delete=models.CASCADE, related_name='chat_messages')
+    # Indexed through tokenchat_token_sender_idx
+    token = models.ForeignKey(Token, on_delete=models.CASCADE, related_name='chat_messages', db_index=False)
     sender = models.CharField(max_length=20, choices=SENDER_CHOICES)
     message = models.TextField()
     attachment = models.FileField(upload_to=token_chat_attachment_upload_to, null=True, blank=True)
@@ -818,6 +750,7 @@ class TokenChatMessage(models.Model):
         ordering = ['created_at']
         verbose_name = 'Token Chat Message'
         verbose_name_plural = 'Token Chat Messages'
+        indexes = [models.Index(fields=['token', 'sender', 'created_at'], name='tokenchat_token_sender_idx')]
 
     def __str__(self):
         return f"{self.token.token_no} [{self.sender}] {self.created_at:%Y-%m-%d %H:%M}"
@@ -958,7 +891,8 @@ class Commission(models.Model):
 
 class Worksheet(models.Model):
     # Common fields
-    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='worksheet_entries')
+    # Indexed through worksheet_employee_date_idx
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='worksheet_entries', db_index=False)
     date = models.DateField(default=timezone.now)
     created_at = models.DateTimeField(auto_now_add=True, null=True, blank=True)  # Timestamp for entry creation
     payment = models.DecimalField(max_digits=10, decimal_places=2, default=0)
@@ -990,11 +924,55 @@ class Worksheet(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['employee', 'date'], name='worksheet_employee_date_idx'),
+            models.Index(fields=['department_name', 'date'], name='worksheet_department_date_idx'),
+            models.Index(
+                fields=['token_no'], name='worksheet_token_no_idx', condition=models.Q(token_no__isnull=False),
+            ),
+        ]
 
     def __str__(self):
         approval_status = "Approved" if self.approved else "Pending"
         return f"Entry by {self.employee.name} on {self.date} for {self.department_name} ({approval_status})"
 
+    # Saved and deleted inside a transaction so the WorksheetRollup cells the
+    # signals rewrite commit together with the entry; the signals read the
+    # stored row before writing, so the write lock is taken at BEGIN
+    def save(self, *args, **kwargs):
+        with write_transaction():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with write_transaction():
+            return super().delete(*args, **kwargs)
+
+
+class WorksheetRollup(models.Model):
+    """
+    Worksheet totals per employee, department, service and day, kept in
+    step by management.worksheet_rollup as entries are saved and deleted
+    so reports sum a few rollup rows instead of every entry. Entries with
+    no service roll up under service ''.
+    """
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name='worksheet_rollups')
+    department_name = models.CharField(max_length=50)
+    service = models.CharField(max_length=200, blank=True, default='')
+    date = models.DateField()
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    payment = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    # Commission is only paid on approved entries
+    approved_amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    stocks_used = models.PositiveIntegerField(default=0)
+    entry_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ('employee', 'department_name', 'service', 'date')
+        indexes = [models.Index(fields=['date', 'employee'])]
+
+    def __str__(self):
+        return f"{self.employee_id} {self.department_name}/{self.service or '-'} on {self.date}: {self.amount}"
+
 
 class Notification(models.Model):
     """
@@ -1023,6 +1001,10 @@ class UserNotificationStatus(models.Model):
     class Meta:
         # Ensures an employee can't have multiple statuses for the same notification
         unique_together = ('employee', 'notification')
+        indexes = [
+            # The navbar's unread count
+            models.Index(fields=['employee'], name='notification_unread_idx', condition=models.Q(is_read=False)),
+        ]
 
     def __str__(self):
         status = 'Read' if self.is_read else 'Unread'
@@ -1083,7 +1065,7 @@ class EmployeeUpload(models.Model):
     description = models.TextField(help_text="A brief description of the uploaded file.")
     file = models.FileField(upload_to='employee_uploads/%Y/%m/%d/')
     uploaded_at = models.DateTimeField(auto_now_add=True)
-    renewal_date = models.DateField(null=True, blank=True, help_text="Date when this upload needs to be renewed")
+    renewal_date = models.DateField(null=True, blank=True, db_index=True, help_text="Date when this upload needs to be renewed")
     mobile_number = models.CharField(max_length=15, null=True, blank=True, help_text="Mobile number related to this upload")
 
     class Meta:
@@ -1099,6 +1081,138 @@ class EmployeeUpload(models.Model):
         return f"File from {self.employee.name} for {service_name}"
 
 
+class RenewalDigest(models.Model):
+    """
+    Daily summary of EmployeeUpload renewals for the admin index: counts per
+    service and the most overdue / soonest due uploads. Built by
+    management.renewal_digest and dropped whenever an upload changes.
+    """
+    digest_date = models.DateField(unique=True)
+    expired_count = models.PositiveIntegerField(default=0)
+    due_soon_count = models.PositiveIntegerField(default=0)
+    # [{'service': name, 'expired': n, 'due_soon': n}, ...]
+    service_counts = models.JSONField(default=list)
+    # [{'id', 'employee', 'service', 'description', 'mobile_number', 'renewal_date'}, ...]
+    expired_items = models.JSONField(default=list)
+    due_soon_items = models.JSONField(default=list)
+    generated_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        ordering = ['-digest_date']
+
+    def __str__(self):
+        return f"Renewal digest for {self.digest_date}: {self.expired_count} expired"
+
+    @staticmethod
+    def _with_dates(items):
+        from datetime import date as date_cls
+        return [dict(item, renewal_date=date_cls.fromisoformat(item['renewal_date'])) for item in items]
+
+    def expired_uploads(self):
+        return self._with_dates(self.expired_items)
+
+    def due_soon_uploads(self):
+        return self._with_dates(self.due_soon_items)
+
+
+class SchedulerLock(models.Model):
+    """
+    Cross-process lease for a scheduled job. Every web worker runs the
+    APScheduler jobs; only the one that takes the expired lease runs the
+    job for that interval (see management.scheduler_lock).
+    """
+    name = models.CharField(max_length=100, unique=True)
+    owner = models.CharField(max_length=255)
+    acquired_at = models.DateTimeField()
+    expires_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"{self.name} held by {self.owner} until {self.expires_at}"
+
+
+class PayrollSnapshot(models.Model):
+    """
+    An employee's get_current_month_earnings breakdown frozen when the month
+    was closed. inputs_hash fingerprints the rows it was computed from;
+    later edits to those rows mark the snapshot stale instead of changing
+    it, and closing the month again writes a new version.
+    """
+    EARNINGS_FIELDS = (
+        'attendance_salary', 'application_commissions', 'worksheet_commissions', 'meetings_bonus',
+        'trainings_bonus', 'performance_bonus', 'extra_days_bonus', 'deduction_amount', 'total_earnings',
+    )
+
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name="payroll_snapshots")
+    year = models.PositiveSmallIntegerField()
+    month = models.PositiveSmallIntegerField()
+    version = models.PositiveIntegerField(default=1)
+    inputs_hash = models.CharField(max_length=64)
+    # Four places: worksheet commission is 5% of two-place amounts
+    attendance_salary = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+    application_commissions = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+    worksheet_commissions = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+    meetings_bonus = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+    trainings_bonus = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+    performance_bonus = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+    extra_days_bonus = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+    deduction_amount = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+    total_earnings = models.DecimalField(max_digits=14, decimal_places=4, default=0)
+    closed_at = models.DateTimeField(default=timezone.now)
+    closed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name="+")
+    is_stale = models.BooleanField(default=False)
+    stale_reason = models.CharField(max_length=255, blank=True)
+    stale_since = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('employee', 'year', 'month')
+        ordering = ['-year', '-month', 'employee']
+
+    def __str__(self):
+        return f"{self.employee.name} payroll {self.year}-{self.month:02d} v{self.version}"
+
+    def earnings(self):
+        return {name: getattr(self, name) for name in self.EARNINGS_FIELDS}
+
+
+class DailyAttendanceSummary(models.Model):
+    """
+    One employee's computed attendance for one closed day, written by
+    management.attendance_summary when sessions close or breaks change so
+    month views don't rescan raw sessions for past days. Rows are only
+    trusted while the employee's salary and working hours match the
+    snapshot they were computed with.
+    """
+    employee = models.ForeignKey(Employee, on_delete=models.CASCADE, related_name="daily_attendance_summaries")
+    date = models.DateField()
+    has_attendance = models.BooleanField(default=False)
+    first_login = models.DateTimeField(null=True, blank=True)
+    last_logout = models.DateTimeField(null=True, blank=True)
+    # Merged in-hours session time and approved break time, in seconds
+    work_seconds = models.FloatField(default=0)
+    approved_break_seconds = models.FloatField(default=0)
+    # [{'timings', 'reason', 'duration', 'approved'}, ...] as shown in the report
+    break_sessions = models.JSONField(default=list)
+    daily_wage = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    salary = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True)
+    working_start_time = models.TimeField(null=True, blank=True)
+    working_end_time = models.TimeField(null=True, blank=True)
+    computed_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        unique_together = ('employee', 'date')
+        ordering = ['employee', 'date']
+
+    def __str__(self):
+        return f"{self.employee.name} attendance on {self.date}"
+
+    def matches(self, employee):
+        return (
+            self.salary == employee.salary
+            and self.working_start_time == employee.working_start_time
+            and self.working_end_time == employee.working_end_time
+        )
+
+
 
 
 class EmployeeLinkAssignment(models.Model):
@@ -1395,3 +1509,83 @@ class TTDIndividualDarshan(models.Model):
 
     def __str__(self):
         return f"{self.name} – Darshan on {self.planned_date} at {self.slot_time}"
+
+
+class EmployeeNavbarStats(models.Model):
+    """
+    Today's target/collection and this month's commission figures shown in
+    the employee navbar. Kept up to date by management.navbar_stats from
+    Worksheet, SalaryPayment, EmployeeTarget, DepartmentTopUp and
+    ApplicationAssignment changes; rebuilt on a new day or when too old.
+    """
+    employee = models.OneToOneField('Employee', on_delete=models.CASCADE, primary_key=True, related_name='navbar_stats')
+    stats_date = models.DateField()
+    daily_target = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True)
+    daily_collected = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    worksheet_commission = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    application_commission = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    commission_paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    balance_department = models.ForeignKey('Department', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    department_balance = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    refreshed_at = models.DateTimeField()
+
+    class Meta:
+        verbose_name = 'Employee Navbar Stats'
+        verbose_name_plural = 'Employee Navbar Stats'
+
+    def __str__(self):
+        return f"Navbar stats for employee {self.employee_id} on {self.stats_date}"
+
+
+class Customer(models.Model):
+    """
+    One row per customer, keyed by normalized 10-digit mobile number, so
+    counter staff can pull a repeat customer's history without scanning
+    every table that records a phone number. Maintained by
+    management.customers from the CustomerRecord links below.
+    """
+    mobile = models.CharField(max_length=10, unique=True)
+    # Name on the most recent linked record
+    name = models.CharField(max_length=255, blank=True, default='')
+    first_seen = models.DateTimeField(null=True, blank=True)
+    last_seen = models.DateTimeField(null=True, blank=True)
+    token_count = models.PositiveIntegerField(default=0)
+    worksheet_count = models.PositiveIntegerField(default=0)
+    upload_count = models.PositiveIntegerField(default=0)
+    application_count = models.PositiveIntegerField(default=0)
+    ttd_count = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.name or 'Customer'} ({self.mobile})"
+
+
+class CustomerRecord(models.Model):
+    """Links a Customer to one token, worksheet entry, upload, application or TTD booking."""
+    SOURCE_TOKEN = 'token'
+    SOURCE_WORKSHEET = 'worksheet'
+    SOURCE_UPLOAD = 'upload'
+    SOURCE_APPLICATION = 'application'
+    SOURCE_TTD_DARSHAN = 'ttd_darshan'
+    SOURCE_TTD_MEMBER = 'ttd_member'
+    SOURCE_CHOICES = [
+        (SOURCE_TOKEN, 'Token'),
+        (SOURCE_WORKSHEET, 'Worksheet entry'),
+        (SOURCE_UPLOAD, 'Employee upload'),
+        (SOURCE_APPLICATION, 'Application'),
+        (SOURCE_TTD_DARSHAN, 'TTD individual darshan'),
+        (SOURCE_TTD_MEMBER, 'TTD group member'),
+    ]
+
+    # Indexed through unique_together
+    customer = models.ForeignKey(Customer, on_delete=models.CASCADE, related_name='records', db_index=False)
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    name = models.CharField(max_length=255, blank=True, default='')
+    seen_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('customer', 'source', 'object_id')
+        indexes = [models.Index(fields=['source', 'object_id'], name='customerrecord_source_idx')]
+
+    def __str__(self):
+        return f"{self.source} #{self.object_id} for {self.customer_id}"
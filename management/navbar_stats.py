@@ -0,0 +1,200 @@
+"""
+Per-employee navbar figures (today's target/collection, this month's
+commission due, department balance) kept in EmployeeNavbarStats.
+
+A change to a source row refreshes only the figures it feeds, for the
+employees it belongs to. Rows from an earlier day, or older than
+NAVBAR_STATS_MAX_AGE (which covers queryset.update() paths that skip
+signals), are recomputed in full on the next read.
+"""
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+from django.db.models import Sum
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import (
+    ApplicationAssignment, DepartmentTopUp, Employee, EmployeeNavbarStats, EmployeeTarget,
+    SalaryPayment,
+)
+# Imported first so its Worksheet receivers update the rollup before ours read it
+from .worksheet_rollup import rollup_totals
+
+
+NAVBAR_STATS_MAX_AGE = timedelta(minutes=10)
+
+
+def _today():
+    return timezone.localtime(timezone.now()).date()
+
+
+def _as_date(value):
+    # DateFields defaulting to timezone.now hold a datetime until reloaded
+    if isinstance(value, datetime):
+        return timezone.localtime(value).date()
+    return value
+
+
+def _daily_target(employee_id, day):
+    target = EmployeeTarget.objects.filter(employee_id=employee_id, date=day).first()
+    return (target.target_amount + target.carry_forward) if target else None
+
+
+def _daily_collected(employee_id, day):
+    return rollup_totals(employee_id=employee_id, date=day)['amount'] or Decimal('0')
+
+
+def _commission_paid(employee_id, day):
+    return SalaryPayment.objects.filter(
+        employee_id=employee_id,
+        payment_type='commission',
+        date__year=day.year,
+        date__month=day.month,
+    ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
+
+
+def _department_balance(department_id):
+    if not department_id:
+        return None
+    return DepartmentTopUp.objects.filter(
+        department_id=department_id
+    ).aggregate(total=Sum('amount'))['total'] or Decimal('0')
+
+
+def _employee(employee_id):
+    return Employee.objects.select_related('department').get(pk=employee_id)
+
+
+# Figure name -> function(employee_id, stats) returning its fresh value
+COMPONENTS = {
+    'daily_target': lambda employee_id, stats: _daily_target(employee_id, stats.stats_date),
+    'daily_collected': lambda employee_id, stats: _daily_collected(employee_id, stats.stats_date),
+    'worksheet_commission': lambda employee_id, stats: _employee(employee_id).get_worksheet_commission(
+        stats.stats_date.year, stats.stats_date.month
+    ),
+    'application_commission': lambda employee_id, stats: _employee(employee_id).get_application_commission(
+        stats.stats_date.year, stats.stats_date.month
+    ),
+    'commission_paid': lambda employee_id, stats: _commission_paid(employee_id, stats.stats_date),
+    'department_balance': lambda employee_id, stats: _department_balance(stats.balance_department_id),
+}
+
+
+def recompute_navbar_stats(employee, headed_department_id=None, day=None):
+    """Rebuild every figure for `employee` and store them."""
+    day = day or _today()
+    stats = EmployeeNavbarStats(
+        employee=employee,
+        stats_date=day,
+        daily_target=_daily_target(employee.pk, day),
+        daily_collected=_daily_collected(employee.pk, day),
+        worksheet_commission=employee.get_worksheet_commission(day.year, day.month),
+        application_commission=employee.get_application_commission(day.year, day.month),
+        commission_paid=_commission_paid(employee.pk, day),
+        balance_department_id=headed_department_id,
+        department_balance=_department_balance(headed_department_id),
+        refreshed_at=timezone.now(),
+    )
+    values = {field.attname: getattr(stats, field.attname) for field in EmployeeNavbarStats._meta.concrete_fields}
+    values.pop('employee_id')
+    # .update()/.create() rather than save() so auditlog doesn't log every refresh
+    if not EmployeeNavbarStats.objects.filter(employee_id=employee.pk).update(**values):
+        EmployeeNavbarStats.objects.create(employee_id=employee.pk, **values)
+    return stats
+
+
+def refresh_navbar_stats(employee_ids, *components, day=None):
+    """
+    Recompute only `components` for the given employees' current rows.
+    Rows for another day are skipped; the next read rebuilds them anyway.
+    `day` limits the refresh to rows whose stats_date is in that day's month.
+    """
+    today = _today()
+    if day is not None and (day.year, day.month) != (today.year, today.month):
+        return
+    rows = EmployeeNavbarStats.objects.filter(employee_id__in=set(employee_ids), stats_date=today)
+    for stats in rows:
+        values = {name: COMPONENTS[name](stats.employee_id, stats) for name in components}
+        EmployeeNavbarStats.objects.filter(pk=stats.pk).update(**values)
+
+
+def get_navbar_stats(employee, headed_department_id=None):
+    """
+    Return the employee's EmployeeNavbarStats for today, recomputing it when
+    missing, from an earlier day, too old, or tracking a department the
+    employee no longer heads.
+    """
+    stats = EmployeeNavbarStats.objects.filter(employee_id=employee.pk).first()
+    if (
+        stats is None
+        or stats.stats_date != _today()
+        or stats.balance_department_id != headed_department_id
+        or timezone.now() - stats.refreshed_at > NAVBAR_STATS_MAX_AGE
+    ):
+        stats = recompute_navbar_stats(employee, headed_department_id)
+    return stats
+
+
+def _worksheet_entry_changed(employee_id, day):
+    day = _as_date(day)
+    components = ['worksheet_commission']
+    if day == _today():
+        components.append('daily_collected')
+    refresh_navbar_stats([employee_id], *components, day=day)
+
+
+@receiver(pre_save, sender='management.Worksheet')
+def _worksheet_saving(sender, instance, raw=False, **kwargs):
+    # An edit can move the entry to another employee or day; both need a refresh
+    instance._navbar_previous = None
+    if instance.pk and not raw:
+        instance._navbar_previous = sender.objects.filter(pk=instance.pk).values_list('employee_id', 'date').first()
+
+
+@receiver(post_save, sender='management.Worksheet')
+def _worksheet_saved(sender, instance, **kwargs):
+    _worksheet_entry_changed(instance.employee_id, instance.date)
+    previous = getattr(instance, '_navbar_previous', None)
+    if previous and previous != (instance.employee_id, _as_date(instance.date)):
+        _worksheet_entry_changed(*previous)
+
+
+@receiver(post_delete, sender='management.Worksheet')
+def _worksheet_deleted(sender, instance, **kwargs):
+    _worksheet_entry_changed(instance.employee_id, instance.date)
+
+
+@receiver(post_save, sender='management.EmployeeTarget')
+@receiver(post_delete, sender='management.EmployeeTarget')
+def _target_changed(sender, instance, **kwargs):
+    if _as_date(instance.date) == _today():
+        refresh_navbar_stats([instance.employee_id], 'daily_target')
+
+
+@receiver(post_save, sender='management.SalaryPayment')
+@receiver(post_delete, sender='management.SalaryPayment')
+def _salary_payment_changed(sender, instance, **kwargs):
+    refresh_navbar_stats([instance.employee_id], 'commission_paid', day=_as_date(instance.date))
+
+
+@receiver(post_save, sender='management.ApplicationAssignment')
+@receiver(post_delete, sender='management.ApplicationAssignment')
+def _application_assignment_changed(sender, instance, **kwargs):
+    refresh_navbar_stats([instance.employee_id], 'application_commission')
+
+
+@receiver(post_save, sender='management.Application')
+def _application_changed(sender, instance, **kwargs):
+    employee_ids = ApplicationAssignment.objects.filter(application=instance).values_list('employee_id', flat=True)
+    refresh_navbar_stats(employee_ids, 'application_commission')
+
+
+@receiver(post_save, sender='management.DepartmentTopUp')
+@receiver(post_delete, sender='management.DepartmentTopUp')
+def _department_topup_changed(sender, instance, **kwargs):
+    employee_ids = EmployeeNavbarStats.objects.filter(
+        balance_department_id=instance.department_id
+    ).values_list('employee_id', flat=True)
+    refresh_navbar_stats(employee_ids, 'department_balance')
@@ -0,0 +1,395 @@
+"""
+Month payroll for many employees at once, and month-close snapshots.
+
+month_payroll computes every component of Employee.get_current_month_earnings
+with one grouped aggregate per component (GROUP BY employee_id) instead of
+about eight queries per employee, and must agree with that method exactly.
+
+close_payroll_month freezes those figures into PayrollSnapshot rows with a
+hash of the input rows. Edits to a closed month's rows mark its snapshots
+stale; they are only rewritten (as a new version) by closing again.
+"""
+import hashlib
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+
+from django.db.models.signals import post_delete, post_save
+from django.db.models import Sum
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .attendance_summary import summarized_month_attendance_for_employees
+from .models import (
+    ApplicationAssignment, AttendanceSession, BreakSession, Employee, ExtraDaysBonus, MeetingAttendance,
+    MonthlyDeduction, PayrollSnapshot, PerformanceBonus, SalaryPayment, TrainingBonus, Worksheet, WorksheetRollup,
+)
+
+
+ZERO = Decimal('0.00')
+XEROX_DEPARTMENT = 'Xerox'
+# Xerox only earns worksheet commission on each day's total above this
+XEROX_DAILY_THRESHOLD = 500
+WORKSHEET_COMMISSION_RATE = Decimal('0.05')
+
+BONUS_COMPONENTS = ('meetings_bonus', 'trainings_bonus', 'performance_bonus', 'extra_days_bonus')
+
+
+def _grouped_sum(queryset, field):
+    # order_by() drops Meta.ordering, which would otherwise join the GROUP BY
+    return {
+        row['employee_id']: row['total']
+        for row in queryset.order_by().values('employee_id').annotate(total=Sum(field))
+    }
+
+
+def _worksheet_commissions(employee_ids, year, month):
+    month_rollups = WorksheetRollup.objects.filter(employee_id__in=employee_ids, date__year=year, date__month=month)
+    xerox_ids = set(
+        Employee.objects.filter(pk__in=employee_ids, department__name=XEROX_DEPARTMENT).values_list('pk', flat=True)
+    )
+    commissions = {
+        employee_id: total * WORKSHEET_COMMISSION_RATE
+        for employee_id, total in _grouped_sum(
+            month_rollups.exclude(employee_id__in=xerox_ids), 'approved_amount'
+        ).items()
+    }
+    if xerox_ids:
+        daily_totals = defaultdict(Decimal)
+        for employee_id, day, amount in month_rollups.filter(employee_id__in=xerox_ids).values_list(
+            'employee_id', 'date', 'approved_amount'
+        ):
+            daily_totals[employee_id, day] += amount
+        for (employee_id, _), total_amount in daily_totals.items():
+            if total_amount > XEROX_DAILY_THRESHOLD:
+                commissions[employee_id] = commissions.get(employee_id, ZERO) + (
+                    (total_amount - XEROX_DAILY_THRESHOLD) * WORKSHEET_COMMISSION_RATE
+                )
+    return commissions
+
+
+def _application_commissions(employee_ids, year, month):
+    return _grouped_sum(
+        ApplicationAssignment.objects.filter(
+            employee_id__in=employee_ids,
+            application__approved=True,
+            application__date_created__year=year,
+            application__date_created__month=month,
+        ),
+        'commission_amount',
+    )
+
+
+def month_commission_due(employee_ids, year, month):
+    """
+    {employee_id: commission earned minus commission paid} for the month:
+    the worksheet and application commissions of month_payroll and one
+    grouped sum of commission payments, whatever the number of employees.
+    """
+    employee_ids = list(employee_ids)
+    applications = _application_commissions(employee_ids, year, month)
+    worksheets = _worksheet_commissions(employee_ids, year, month)
+    paid = _grouped_sum(
+        SalaryPayment.objects.filter(
+            employee_id__in=employee_ids, date__year=year, date__month=month, payment_type='commission',
+        ),
+        'amount',
+    )
+    return {
+        employee_id: (
+            (applications.get(employee_id) or ZERO) + worksheets.get(employee_id, ZERO) - (paid.get(employee_id) or ZERO)
+        )
+        for employee_id in employee_ids
+    }
+
+
+def month_payroll(employees, year, month):
+    """
+    Return {employee_id: earnings} for the month, where earnings has the
+    same keys and values as get_current_month_earnings() except
+    'monthly_deductions_list'.
+    """
+    employees = list(employees)
+    employee_ids = [employee.pk for employee in employees]
+
+    attendance = summarized_month_attendance_for_employees(employees, year, month)
+    application_commissions = _application_commissions(employee_ids, year, month)
+    worksheet_commissions = _worksheet_commissions(employee_ids, year, month)
+    bonuses = {
+        'meetings_bonus': _grouped_sum(
+            MeetingAttendance.objects.filter(
+                employee_id__in=employee_ids, attended=True, meeting__date__year=year, meeting__date__month=month
+            ),
+            'meeting__amount',
+        ),
+        'trainings_bonus': _grouped_sum(
+            TrainingBonus.objects.filter(employee_id__in=employee_ids, date__year=year, date__month=month), 'amount'
+        ),
+        'performance_bonus': _grouped_sum(
+            PerformanceBonus.objects.filter(employee_id__in=employee_ids, date__year=year, date__month=month), 'amount'
+        ),
+        'extra_days_bonus': _grouped_sum(
+            ExtraDaysBonus.objects.filter(employee_id__in=employee_ids, date__year=year, date__month=month), 'amount'
+        ),
+    }
+    deductions = _grouped_sum(
+        MonthlyDeduction.objects.filter(employee_id__in=employee_ids, year=year, month=month), 'amount'
+    )
+
+    payroll = {}
+    for employee_id in employee_ids:
+        earnings = {
+            'attendance_salary': attendance[employee_id][1],
+            'application_commissions': application_commissions.get(employee_id) or ZERO,
+            'worksheet_commissions': worksheet_commissions.get(employee_id, ZERO),
+        }
+        for name in BONUS_COMPONENTS:
+            earnings[name] = bonuses[name].get(employee_id) or ZERO
+        earnings['deduction_amount'] = deductions.get(employee_id) or ZERO
+        total_before_deduction = (
+            earnings['attendance_salary'] +
+            earnings['application_commissions'] +
+            earnings['worksheet_commissions'] +
+            earnings['meetings_bonus'] +
+            earnings['trainings_bonus'] +
+            earnings['performance_bonus'] +
+            earnings['extra_days_bonus']
+        )
+        earnings['total_earnings'] = total_before_deduction - earnings['deduction_amount']
+        payroll[employee_id] = earnings
+    return payroll
+
+
+def _month_sources(employee_ids, year, month):
+    """(label, queryset, fields) for every row the month's earnings read."""
+    return (
+        ('employee', Employee.objects.filter(pk__in=employee_ids),
+         ('pk', 'salary', 'working_start_time', 'working_end_time', 'department__name')),
+        ('session', AttendanceSession.objects.filter(
+            employee_id__in=employee_ids, login_time__year=year, login_time__month=month),
+         ('pk', 'login_time', 'logout_time', 'session_expires_at', 'session_status')),
+        ('break', BreakSession.objects.filter(
+            employee_id__in=employee_ids, start_time__year=year, start_time__month=month),
+         ('pk', 'start_time', 'end_time', 'approved', 'logout_reason')),
+        ('worksheet', Worksheet.objects.filter(employee_id__in=employee_ids, date__year=year, date__month=month),
+         ('pk', 'date', 'amount', 'approved')),
+        ('application', ApplicationAssignment.objects.filter(
+            employee_id__in=employee_ids,
+            application__date_created__year=year,
+            application__date_created__month=month),
+         ('pk', 'commission_amount', 'application__approved')),
+        ('meeting', MeetingAttendance.objects.filter(
+            employee_id__in=employee_ids, meeting__date__year=year, meeting__date__month=month),
+         ('pk', 'attended', 'meeting__amount')),
+        ('training', TrainingBonus.objects.filter(employee_id__in=employee_ids, date__year=year, date__month=month),
+         ('pk', 'amount')),
+        ('performance', PerformanceBonus.objects.filter(
+            employee_id__in=employee_ids, date__year=year, date__month=month),
+         ('pk', 'amount')),
+        ('extra_days', ExtraDaysBonus.objects.filter(employee_id__in=employee_ids, date__year=year, date__month=month),
+         ('pk', 'amount')),
+        ('deduction', MonthlyDeduction.objects.filter(employee_id__in=employee_ids, year=year, month=month),
+         ('pk', 'amount')),
+    )
+
+
+def payroll_inputs_hashes(employee_ids, year, month):
+    """{employee_id: sha256 of every input row of the month}, one query per source."""
+    employee_ids = list(employee_ids)
+    digests = {employee_id: hashlib.sha256() for employee_id in employee_ids}
+    for label, queryset, fields in _month_sources(employee_ids, year, month):
+        owner = 'pk' if label == 'employee' else 'employee_id'
+        for row in queryset.order_by('pk').values_list(owner, *fields):
+            digests[row[0]].update(repr((label,) + tuple(str(value) for value in row[1:])).encode())
+    return {employee_id: digest.hexdigest() for employee_id, digest in digests.items()}
+
+
+def _is_open_month(year, month):
+    today = timezone.localdate()
+    return (year, month) >= (today.year, today.month)
+
+
+def close_payroll_month(year, month, employees=None, closed_by=None):
+    """
+    Freeze month_payroll for a finished month. Existing snapshots whose
+    inputs are unchanged are kept as they are; the rest are (re)written
+    with the next version. Returns the number of snapshots written.
+    """
+    if _is_open_month(year, month):
+        raise ValueError(f"{year}-{month:02d} has not ended yet and cannot be closed")
+    employees = list(Employee.objects.all() if employees is None else employees)
+    employee_ids = [employee.pk for employee in employees]
+    hashes = payroll_inputs_hashes(employee_ids, year, month)
+    existing = {
+        snapshot.employee_id: snapshot
+        for snapshot in PayrollSnapshot.objects.filter(employee_id__in=employee_ids, year=year, month=month)
+    }
+    to_close = [
+        employee for employee in employees
+        if employee.pk not in existing
+        or existing[employee.pk].is_stale
+        or existing[employee.pk].inputs_hash != hashes[employee.pk]
+    ]
+    if not to_close:
+        return 0
+
+    payroll = month_payroll(to_close, year, month)
+    now = timezone.now()
+    snapshots = []
+    for employee in to_close:
+        previous = existing.get(employee.pk)
+        snapshots.append(PayrollSnapshot(
+            employee_id=employee.pk,
+            year=year,
+            month=month,
+            version=previous.version + 1 if previous else 1,
+            inputs_hash=hashes[employee.pk],
+            closed_at=now,
+            closed_by=closed_by,
+            is_stale=False,
+            stale_reason='',
+            stale_since=None,
+            **{name: payroll[employee.pk][name] for name in PayrollSnapshot.EARNINGS_FIELDS},
+        ))
+    PayrollSnapshot.objects.bulk_create(
+        snapshots,
+        update_conflicts=True,
+        unique_fields=['employee', 'year', 'month'],
+        update_fields=[
+            'version', 'inputs_hash', 'closed_at', 'closed_by', 'is_stale', 'stale_reason', 'stale_since',
+            *PayrollSnapshot.EARNINGS_FIELDS,
+        ],
+    )
+    return len(snapshots)
+
+
+def verify_payroll_month(year, month):
+    """
+    Mark stale any fresh snapshot whose inputs hash no longer matches, which
+    catches edits made through queryset.update() or raw SQL. Returns the
+    number newly marked.
+    """
+    snapshots = list(PayrollSnapshot.objects.filter(year=year, month=month, is_stale=False))
+    hashes = payroll_inputs_hashes([snapshot.employee_id for snapshot in snapshots], year, month)
+    changed = [snapshot.employee_id for snapshot in snapshots if snapshot.inputs_hash != hashes[snapshot.employee_id]]
+    return mark_payroll_stale(changed, year, month, "Inputs changed since the month was closed")
+
+
+def mark_payroll_stale(employee_ids, year, month, reason):
+    if _is_open_month(year, month):
+        return 0
+    return PayrollSnapshot.objects.filter(
+        employee_id__in=set(employee_ids), year=year, month=month, is_stale=False,
+    ).update(is_stale=True, stale_reason=reason[:255], stale_since=timezone.now())
+
+
+def get_month_earnings(employee, year, month):
+    """
+    (earnings, snapshot): the frozen breakdown when the month is closed for
+    the employee, stale or not, otherwise get_current_month_earnings().
+    """
+    snapshot = PayrollSnapshot.objects.filter(employee=employee, year=year, month=month).first()
+    if snapshot is None:
+        return employee.get_current_month_earnings(year, month), None
+    earnings = snapshot.earnings()
+    earnings['monthly_deductions_list'] = MonthlyDeduction.objects.filter(employee=employee, year=year, month=month)
+    return earnings, snapshot
+
+
+def month_earnings_for_employees(employees, year, month):
+    """
+    {employee_id: (earnings, snapshot)} for many employees: snapshots where
+    the month is closed, month_payroll for the rest.
+    """
+    employees = list(employees)
+    snapshots = {
+        snapshot.employee_id: snapshot
+        for snapshot in PayrollSnapshot.objects.filter(
+            employee_id__in=[employee.pk for employee in employees], year=year, month=month
+        )
+    }
+    live = month_payroll([employee for employee in employees if employee.pk not in snapshots], year, month)
+    return {
+        employee.pk: (snapshots[employee.pk].earnings(), snapshots[employee.pk])
+        if employee.pk in snapshots else (live[employee.pk], None)
+        for employee in employees
+    }
+
+
+def _local_month(value):
+    if isinstance(value, datetime):
+        value = timezone.localtime(value)
+    return value.year, value.month
+
+
+def _row_changed(employee_ids, when, label):
+    if when is not None:
+        year, month = _local_month(when)
+        mark_payroll_stale(employee_ids, year, month, f"{label} changed")
+
+
+def mark_rows_stale(rows, label):
+    """
+    _row_changed for (employee_id, date) rows changed by queryset.update(),
+    which sends no post_save: one mark_payroll_stale per month they fall in.
+    """
+    months = defaultdict(set)
+    for employee_id, when in rows:
+        if when is not None:
+            months[_local_month(when)].add(employee_id)
+    for (year, month), employee_ids in months.items():
+        mark_payroll_stale(employee_ids, year, month, f"{label} changed")
+
+
+@receiver(post_save, sender='management.TrainingBonus')
+@receiver(post_delete, sender='management.TrainingBonus')
+@receiver(post_save, sender='management.PerformanceBonus')
+@receiver(post_delete, sender='management.PerformanceBonus')
+@receiver(post_save, sender='management.ExtraDaysBonus')
+@receiver(post_delete, sender='management.ExtraDaysBonus')
+@receiver(post_save, sender='management.Worksheet')
+@receiver(post_delete, sender='management.Worksheet')
+def _dated_row_changed(sender, instance, **kwargs):
+    _row_changed([instance.employee_id], instance.date, sender._meta.verbose_name.capitalize())
+
+
+@receiver(post_save, sender='management.MonthlyDeduction')
+@receiver(post_delete, sender='management.MonthlyDeduction')
+def _deduction_changed(sender, instance, **kwargs):
+    mark_payroll_stale([instance.employee_id], instance.year, instance.month, "Monthly deduction changed")
+
+
+@receiver(post_save, sender='management.AttendanceSession')
+@receiver(post_delete, sender='management.AttendanceSession')
+def _attendance_session_changed(sender, instance, **kwargs):
+    _row_changed([instance.employee_id], instance.login_time, "Attendance session")
+
+
+@receiver(post_save, sender='management.BreakSession')
+@receiver(post_delete, sender='management.BreakSession')
+def _break_session_changed(sender, instance, **kwargs):
+    _row_changed([instance.employee_id], instance.start_time, "Break session")
+
+
+@receiver(post_save, sender='management.ApplicationAssignment')
+@receiver(post_delete, sender='management.ApplicationAssignment')
+def _application_assignment_changed(sender, instance, **kwargs):
+    _row_changed([instance.employee_id], instance.application.date_created, "Application commission")
+
+
+@receiver(post_save, sender='management.Application')
+def _application_changed(sender, instance, **kwargs):
+    employee_ids = ApplicationAssignment.objects.filter(application=instance).values_list('employee_id', flat=True)
+    _row_changed(employee_ids, instance.date_created, "Application")
+
+
+@receiver(post_save, sender='management.MeetingAttendance')
+@receiver(post_delete, sender='management.MeetingAttendance')
+def _meeting_attendance_changed(sender, instance, **kwargs):
+    _row_changed([instance.employee_id], instance.meeting.date, "Meeting attendance")
+
+
+@receiver(post_save, sender='management.Meeting')
+def _meeting_changed(sender, instance, **kwargs):
+    employee_ids = MeetingAttendance.objects.filter(meeting=instance).values_list('employee_id', flat=True)
+    _row_changed(employee_ids, instance.date, "Meeting")
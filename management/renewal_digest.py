@@ -0,0 +1,88 @@
+"""
+Builds the RenewalDigest shown on the admin index, so the page reads one
+precomputed row instead of scanning EmployeeUpload on every visit.
+"""
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.db.models import Count, Q
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import EmployeeUpload, RenewalDigest
+
+
+# Same "due soon" window the EmployeeUpload admin highlights in yellow
+RENEWAL_DUE_SOON_DAYS = 7
+ITEM_FIELDS = ('id', 'employee__name', 'service__name', 'description', 'mobile_number', 'renewal_date')
+
+
+def _top_n():
+    return getattr(settings, 'RENEWAL_DIGEST_TOP_N', 20)
+
+
+def _items(queryset):
+    return [
+        {
+            'id': row['id'],
+            'employee': row['employee__name'],
+            'service': row['service__name'],
+            'description': row['description'],
+            'mobile_number': row['mobile_number'],
+            'renewal_date': row['renewal_date'].isoformat(),
+        }
+        for row in queryset.order_by('renewal_date', 'id').values(*ITEM_FIELDS)[:_top_n()]
+    ]
+
+
+def build_renewal_digest(today=None):
+    """Recompute the digest for `today` and drop digests from earlier days."""
+    today = today or date.today()
+    due_soon_until = today + timedelta(days=RENEWAL_DUE_SOON_DAYS)
+    expired = EmployeeUpload.objects.filter(renewal_date__lte=today)
+    due_soon = EmployeeUpload.objects.filter(renewal_date__gt=today, renewal_date__lte=due_soon_until)
+
+    service_counts = [
+        {'service': row['service__name'], 'expired': row['expired'], 'due_soon': row['due_soon']}
+        for row in EmployeeUpload.objects.filter(renewal_date__lte=due_soon_until)
+        .values('service__name')
+        .annotate(
+            expired=Count('id', filter=Q(renewal_date__lte=today)),
+            due_soon=Count('id', filter=Q(renewal_date__gt=today)),
+        )
+        .order_by('-expired', '-due_soon', 'service__name')
+    ]
+    values = {
+        'expired_count': sum(row['expired'] for row in service_counts),
+        'due_soon_count': sum(row['due_soon'] for row in service_counts),
+        'service_counts': service_counts,
+        'expired_items': _items(expired),
+        'due_soon_items': _items(due_soon),
+        'generated_at': timezone.now(),
+    }
+    # .update()/.create() keep this derived row out of the auditlog
+    if not RenewalDigest.objects.filter(digest_date=today).update(**values):
+        RenewalDigest.objects.create(digest_date=today, **values)
+    RenewalDigest.objects.filter(digest_date__lt=today).delete()
+    return RenewalDigest.objects.get(digest_date=today)
+
+
+def get_renewal_digest(today=None):
+    """Return today's digest in one query, building it if it is missing."""
+    today = today or date.today()
+    digest = RenewalDigest.objects.filter(digest_date=today).first()
+    if digest is None:
+        digest = build_renewal_digest(today)
+    return digest
+
+
+def refresh_renewal_digest():
+    """Scheduler entry point: rebuild the digest when the day changes."""
+    build_renewal_digest()
+
+
+@receiver(post_save, sender='management.EmployeeUpload')
+@receiver(post_delete, sender='management.EmployeeUpload')
+def _employee_upload_changed(sender, **kwargs):
+    RenewalDigest.objects.filter(digest_date=date.today()).delete()
@@ -0,0 +1,286 @@
+"""
+Per-view request latency and DB query histograms. Each process buffers
+observations and its scheduler flushes them every
+REQUEST_METRICS_FLUSH_SECONDS into a SQLite file shared by all workers,
+so no request waits on that write.
+"""
+import logging
+import math
+import sqlite3
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+
+logger = logging.getLogger(__name__)
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, math.inf)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, math.inf)
+HISTOGRAMS = {
+    'duration': DURATION_BUCKETS,
+    'queries': QUERY_COUNT_BUCKETS,
+    'db_time': DURATION_BUCKETS,
+}
+UNRESOLVED_VIEW = '<unresolved>'
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def bucket_index(buckets, value):
+    for index, upper in enumerate(buckets):
+        if value <= upper:
+            return index
+    return len(buckets) - 1
+
+
+def histogram_quantile(buckets, counts, quantile):
+    """
+    Estimate a quantile from per-bucket counts, interpolating linearly inside
+    the bucket that holds the target rank (same approach as Prometheus).
+    """
+    total = sum(counts)
+    if not total:
+        return None
+    rank = quantile * total
+    cumulative = 0
+    for index, count in enumerate(counts):
+        if not count:
+            continue
+        if cumulative + count >= rank:
+            lower = buckets[index - 1] if index else 0
+            upper = buckets[index]
+            if math.isinf(upper):
+                return lower
+            return lower + (upper - lower) * ((rank - cumulative) / count)
+        cumulative += count
+    return buckets[-2]
+
+
+class QueryTimer:
+    """connection.execute_wrapper hook counting queries and their wall time."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+class MetricsStore:
+    """Histogram rows in a SQLite file, one row per (view, minute, metric, bucket)."""
+
+    def __init__(self, path):
+        self.path = str(path)
+        self._initialised = False
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        if not self._initialised:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS request_metric_buckets ('
+                ' view TEXT NOT NULL, minute INTEGER NOT NULL, metric TEXT NOT NULL,'
+                ' bucket INTEGER NOT NULL, count INTEGER NOT NULL,'
+                ' PRIMARY KEY (view, minute, metric, bucket))'
+            )
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS request_metric_totals ('
+                ' view TEXT NOT NULL, minute INTEGER NOT NULL, requests INTEGER NOT NULL,'
+                ' duration REAL NOT NULL, queries INTEGER NOT NULL, db_time REAL NOT NULL,'
+                ' PRIMARY KEY (view, minute))'
+            )
+            self._initialised = True
+        return conn
+
+    def write(self, totals, buckets, retention_minutes):
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    'INSERT INTO request_metric_totals (view, minute, requests, duration, queries, db_time)'
+                    ' VALUES (?, ?, ?, ?, ?, ?)'
+                    ' ON CONFLICT (view, minute) DO UPDATE SET'
+                    ' requests = requests + excluded.requests, duration = duration + excluded.duration,'
+                    ' queries = queries + excluded.queries, db_time = db_time + excluded.db_time',
+                    [(view, minute, *values) for (view, minute), values in totals.items()],
+                )
+                conn.executemany(
+                    'INSERT INTO request_metric_buckets (view, minute, metric, bucket, count)'
+                    ' VALUES (?, ?, ?, ?, ?)'
+                    ' ON CONFLICT (view, minute, metric, bucket) DO UPDATE SET count = count + excluded.count',
+                    [key + (count,) for key, count in buckets.items()],
+                )
+                oldest = int(time.time() // 60) - retention_minutes
+                conn.execute('DELETE FROM request_metric_totals WHERE minute < ?', (oldest,))
+                conn.execute('DELETE FROM request_metric_buckets WHERE minute < ?', (oldest,))
+        finally:
+            conn.close()
+
+    def read(self, since_minute):
+        conn = self._connect()
+        try:
+            totals = conn.execute(
+                'SELECT view, SUM(requests), SUM(duration), SUM(queries), SUM(db_time)'
+                ' FROM request_metric_totals WHERE minute >= ? GROUP BY view',
+                (since_minute,),
+            ).fetchall()
+            buckets = conn.execute(
+                'SELECT view, metric, bucket, SUM(count) FROM request_metric_buckets'
+                ' WHERE minute >= ? GROUP BY view, metric, bucket',
+                (since_minute,),
+            ).fetchall()
+        finally:
+            conn.close()
+        return totals, buckets
+
+
+class MetricsRecorder:
+    """In-process buffer of observations, flushed to the shared MetricsStore."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = {}
+        self._buckets = {}
+        self._store = None
+
+    def store(self):
+        path = str(_setting('REQUEST_METRICS_DB_PATH', settings.BASE_DIR / 'request_metrics.sqlite3'))
+        if self._store is None or self._store.path != path:
+            self._store = MetricsStore(path)
+        return self._store
+
+    def record(self, view, duration, queries, db_time):
+        minute = int(time.time() // 60)
+        with self._lock:
+            requests, total_duration, total_queries, total_db_time = self._totals.get((view, minute), (0, 0.0, 0, 0.0))
+            self._totals[(view, minute)] = (
+                requests + 1, total_duration + duration, total_queries + queries, total_db_time + db_time,
+            )
+            for metric, value in (('duration', duration), ('queries', queries), ('db_time', db_time)):
+                key = (view, minute, metric, bucket_index(HISTOGRAMS[metric], value))
+                self._buckets[key] = self._buckets.get(key, 0) + 1
+
+    def flush(self):
+        with self._lock:
+            totals, buckets = self._totals, self._buckets
+            self._totals, self._buckets = {}, {}
+        if not totals:
+            return
+        try:
+            self.store().write(totals, buckets, _setting('REQUEST_METRICS_RETENTION_MINUTES', 24 * 60))
+        except sqlite3.Error:
+            logger.exception('Could not flush request metrics')
+
+    def summary(self, window_minutes=None):
+        """
+        Return one dict per view for the last `window_minutes`, slowest p95 first:
+        request count, averages and p50/p95/p99 of duration, query count and DB time.
+        """
+        if window_minutes is None:
+            window_minutes = _setting('REQUEST_METRICS_WINDOW_MINUTES', 60)
+        self.flush()
+        since_minute = int(time.time() // 60) - window_minutes + 1
+        try:
+            totals, bucket_rows = self.store().read(since_minute)
+        except sqlite3.Error:
+            logger.exception('Could not read request metrics')
+            return []
+
+        counts = {}
+        for view, metric, bucket, count in bucket_rows:
+            histogram = counts.setdefault(view, {}).setdefault(metric, [0] * len(HISTOGRAMS[metric]))
+            if bucket < len(histogram):
+                histogram[bucket] += count
+
+        rows = []
+        for view, requests, duration, queries, db_time in totals:
+            view_counts = counts.get(view, {})
+            row = {
+                'view': view,
+                'requests': requests,
+                'duration_sum': duration,
+                'queries_sum': queries,
+                'db_time_sum': db_time,
+                'avg_duration_ms': duration / requests * 1000 if requests else 0,
+                'avg_queries': queries / requests if requests else 0,
+                'avg_db_time_ms': db_time / requests * 1000 if requests else 0,
+                'histograms': view_counts,
+            }
+            for metric, buckets in HISTOGRAMS.items():
+                metric_counts = view_counts.get(metric, [0] * len(buckets))
+                for label, quantile in (('p50', 0.5), ('p95', 0.95), ('p99', 0.99)):
+                    row[f'{metric}_{label}'] = histogram_quantile(buckets, metric_counts, quantile)
+            rows.append(row)
+        rows.sort(key=lambda r: r['duration_p95'] or 0, reverse=True)
+        return rows
+
+
+recorder = MetricsRecorder()
+
+
+def _format_le(bound):
+    return '+Inf' if math.isinf(bound) else repr(float(bound))
+
+
+def _escape_label(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus(rows):
+    """Render summary() rows in the Prometheus text exposition format."""
+    families = (
+        ('duration', 'sitari_request_duration_seconds', 'Request wall time per view', 'duration_sum'),
+        ('queries', 'sitari_request_db_queries', 'DB queries per request per view', 'queries_sum'),
+        ('db_time', 'sitari_request_db_seconds', 'DB time per request per view', 'db_time_sum'),
+    )
+    lines = []
+    for metric, name, help_text, sum_key in families:
+        buckets = HISTOGRAMS[metric]
+        lines.append(f'# HELP {name} {help_text} (rolling window)')
+        lines.append(f'# TYPE {name} histogram')
+        for row in rows:
+            label = _escape_label(row['view'])
+            cumulative = 0
+            for bound, count in zip(buckets, row['histograms'].get(metric, [0] * len(buckets))):
+                cumulative += count
+                lines.append(f'{name}_bucket{{view="{label}",le="{_format_le(bound)}"}} {cumulative}')
+            lines.append(f'{name}_sum{{view="{label}"}} {row[sum_key]}')
+            lines.append(f'{name}_count{{view="{label}"}} {row["requests"]}')
+        lines.append(f'# HELP {name}_quantile Estimated p50/p95/p99 of {name}')
+        lines.append(f'# TYPE {name}_quantile gauge')
+        for row in rows:
+            label = _escape_label(row['view'])
+            for quantile_label, quantile in (('p50', '0.5'), ('p95', '0.95'), ('p99', '0.99')):
+                value = row[f'{metric}_{quantile_label}']
+                if value is not None:
+                    lines.append(f'{name}_quantile{{view="{label}",quantile="{quantile}"}} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+class RequestMetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not _setting('REQUEST_METRICS_ENABLED', True):
+            return self.get_response(request)
+
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with connection.execute_wrapper(timer):
+            response = self.get_response(request)
+        duration = time.perf_counter() - started
+
+        match = getattr(request, 'resolver_match', None)
+        view = match.view_name if match and match.view_name else UNRESOLVED_VIEW
+        recorder.record(view, duration, timer.count, timer.seconds)
+        return response
@@ -0,0 +1,58 @@
+"""
+Database leases so each scheduled job runs in one process per interval.
+
+ManagementConfig.ready() starts the BackgroundScheduler in every server
+process (each gunicorn worker, runserver), so every job fires once per
+process. Wrapping a job in leader_only() makes each firing first try
+to take that job's SchedulerLock row with a conditional UPDATE (or the
+first INSERT); only the process that succeeds runs the job, and the lease
+isn't free again until it expires.
+"""
+import os
+import socket
+from datetime import timedelta
+from functools import wraps
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import SchedulerLock
+
+
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def acquire_scheduler_lock(name, ttl, owner=None, now=None):
+    """
+    Take the `name` lease for `ttl` if nobody holds an unexpired one.
+    Returns True for exactly one caller per lease period.
+    """
+    now = now or timezone.now()
+    values = {'owner': owner or WORKER_ID, 'acquired_at': now, 'expires_at': now + ttl}
+    if SchedulerLock.objects.filter(name=name, expires_at__lte=now).update(**values):
+        return True
+    try:
+        with transaction.atomic():
+            SchedulerLock.objects.create(name=name, **values)
+    except IntegrityError:
+        return False
+    return True
+
+
+def leader_only(name, ttl):
+    """
+    Decorate a scheduled job so it only runs in the process holding the
+    lease; the others return None. `ttl` should be a little shorter than
+    the job's interval so the next firing can take it again.
+    """
+    if not isinstance(ttl, timedelta):
+        ttl = timedelta(seconds=ttl)
+
+    def decorator(job):
+        @wraps(job)
+        def wrapper(*args, **kwargs):
+            if not acquire_scheduler_lock(name, ttl):
+                return None
+            return job(*args, **kwargs)
+        return wrapper
+    return decorator
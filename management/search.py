@@ -0,0 +1,178 @@
+"""
+Substring search over tokens, worksheet entries and employee uploads.
+
+The search boxes used to OR several `icontains` filters together, which
+SQLite can only answer with a full `LIKE '%x%'` scan. On SQLite each
+searchable table now has an FTS5 shadow index with the trigram tokenizer,
+so any substring of three or more characters is an index lookup. The
+shadow tables are external-content tables (they read the text back from
+the source table) kept in sync by AFTER INSERT/UPDATE/DELETE triggers,
+which also cover queryset.update() and bulk_create(). search_ids() returns
+matches ranked by bm25; search_q() only narrows a queryset, so the list
+views keep their own newest-first ordering.
+
+The indexes are installed after every migrate rather than by a migration:
+Django's SQLite schema editor rebuilds a table to alter it, and dropping
+the old table drops its triggers with it, so post_migrate puts back
+whatever a later migration removed and re-syncs that index.
+
+Other backends, SQLite builds without FTS5 trigram support and queries
+shorter than a trigram keep the old `icontains` filters.
+"""
+import logging
+
+from django.db import DatabaseError, connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_migrate
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+
+MIN_QUERY_LENGTH = 3  # The trigram tokenizer can't match anything shorter
+SEARCH_INDEXES = {
+    'token': ('management_token', ('token_no', 'customer_name', 'cell_no')),
+    'worksheet': ('management_worksheet', ('token_no', 'customer_name', 'customer_mobile', 'login_mobile_no')),
+    'upload': ('management_employeeupload', ('description', 'mobile_number', 'file')),
+}
+TRIGGERS = ('ai', 'ad', 'au')
+
+# Whether each database (by NAME) has every index installed; checked once per process
+_available = {}
+
+
+def _fts_table(index):
+    return f'search_{index}'
+
+
+def _install_sql(index):
+    table, columns = SEARCH_INDEXES[index]
+    fts = _fts_table(index)
+    names = ', '.join(columns)
+    new = ', '.join(f'new.{column}' for column in columns)
+    old = ', '.join(f'old.{column}' for column in columns)
+    insert = f"INSERT INTO {fts}(rowid, {names}) VALUES (new.id, {new});"
+    delete = f"INSERT INTO {fts}({fts}, rowid, {names}) VALUES ('delete', old.id, {old});"
+    return [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {fts} USING fts5("
+        f"{names}, content='{table}', content_rowid='id', tokenize='trigram')",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ai AFTER INSERT ON {table} BEGIN {insert} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_ad AFTER DELETE ON {table} BEGIN {delete} END",
+        f"CREATE TRIGGER IF NOT EXISTS {fts}_au AFTER UPDATE OF {names} ON {table} BEGIN {delete} {insert} END",
+    ]
+
+
+def _installed_names(cursor):
+    cursor.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'trigger') AND name LIKE 'search\\_%' ESCAPE '\\'")
+    return {name for (name,) in cursor.fetchall()}
+
+
+def _expected_names(index):
+    fts = _fts_table(index)
+    return {fts, *(f'{fts}_{suffix}' for suffix in TRIGGERS)}
+
+
+def _supports_trigram(cursor):
+    try:
+        cursor.execute("CREATE VIRTUAL TABLE temp.search_probe USING fts5(probe, tokenize='trigram')")
+        cursor.execute("DROP TABLE temp.search_probe")
+    except DatabaseError:
+        return False
+    return True
+
+
+def install_search_indexes(using='default'):
+    """
+    Create whichever shadow tables and triggers are missing and rebuild the
+    indexes that were missing any of them. Returns the rebuilt index names.
+    """
+    connection = connections[using]
+    _available.pop(connection.settings_dict['NAME'], None)
+    if connection.vendor != 'sqlite':
+        return []
+    rebuilt = []
+    with connection.cursor() as cursor:
+        if not _supports_trigram(cursor):
+            logger.warning('SQLite %s has no FTS5 trigram tokenizer; search falls back to LIKE scans',
+                           connection.Database.sqlite_version)
+            return []
+        installed = _installed_names(cursor)
+        for index in SEARCH_INDEXES:
+            if _expected_names(index) <= installed:
+                continue
+            for statement in _install_sql(index):
+                cursor.execute(statement)
+            rebuild_search_index(index, using)
+            rebuilt.append(index)
+    return rebuilt
+
+
+def rebuild_search_index(index, using='default'):
+    """Re-read every row of `index`'s source table into its shadow index."""
+    fts = _fts_table(index)
+    with connections[using].cursor() as cursor:
+        cursor.execute(f"INSERT INTO {fts}({fts}) VALUES ('rebuild')")
+
+
+def search_available(using='default'):
+    connection = connections[using]
+    if connection.vendor != 'sqlite':
+        return False
+    name = connection.settings_dict['NAME']
+    if name not in _available:
+        with connection.cursor() as cursor:
+            installed = _installed_names(cursor)
+        _available[name] = all(_expected_names(index) <= installed for index in SEARCH_INDEXES)
+    return _available[name]
+
+
+def _match_expression(query, columns=None):
+    # One quoted phrase: trigram-tokenized, a phrase matches as a substring
+    phrase = '"{}"'.format(query.replace('"', '""'))
+    if columns:
+        return '{%s} : %s' % (' '.join(columns), phrase)
+    return phrase
+
+
+def _usable(query, using):
+    return len(query) >= MIN_QUERY_LENGTH and search_available(using)
+
+
+def search_ids(index, query, columns=None, limit=None, using='default'):
+    """
+    Ids of `index`'s rows containing `query` (in `columns`, default all of
+    them), best (bm25) match first. None when the shadow index can't answer, so
+    the caller knows to fall back to its own filters.
+    """
+    query = (query or '').strip()
+    if not _usable(query, using):
+        return None
+    fts = _fts_table(index)
+    sql = f"SELECT rowid FROM {fts} WHERE {fts} MATCH %s ORDER BY rank"
+    params = [_match_expression(query, columns)]
+    if limit is not None:
+        sql += " LIMIT %s"
+        params.append(limit)
+    with connections[using].cursor() as cursor:
+        cursor.execute(sql, params)
+        return [pk for (pk,) in cursor.fetchall()]
+
+
+def search_q(index, query, fallback, columns=None, using='default'):
+    """
+    A Q matching `index`'s rows that contain `query`: a primary-key lookup
+    into the shadow index, or `fallback` (the equivalent icontains filters)
+    where the index can't answer.
+    """
+    query = (query or '').strip()
+    if not _usable(query, using):
+        return fallback
+    fts = _fts_table(index)
+    return Q(pk__in=RawSQL(f"SELECT rowid FROM {fts} WHERE {fts} MATCH %s", [_match_expression(query, columns)]))
+
+
+@receiver(post_migrate)
+def _install_after_migrate(sender, app_config=None, using='default', **kwargs):
+    if app_config is not None and app_config.label == 'management':
+        install_search_indexes(using)
@@ -1,41 +1,45 @@
 from django.utils import timezone
 from datetime import timedelta
+from .attendance_registry import forget_active_attendance_sessions
+from .attendance_summary import refresh_session_days
+from .heartbeats import heartbeats
 from .models import AttendanceSession
 from django.db.models import Q
 
-def close_stale_sessions():
+STALE_AFTER = timedelta(minutes=15)
+STALE_LOGOUT_REASON = "Auto-logout: Tab closed"
+
+
+def stale_sessions(cutoff):
     """
-    Closes any attendance session that is considered stale.
-    A session is stale if it is still active (no logout_time) and meets one of the following criteria:
-    1. It has received a ping, but the last_ping was more than 15 minutes ago.
-    2. It has never received a ping, and the login_time was more than 15 minutes ago.
+    Sessions still active (no logout_time) that either:
+    1. have received a ping, but the last_ping was before `cutoff`, or
+    2. never received a ping and logged in before `cutoff`.
     """
-    cutoff = timezone.now() - timedelta(minutes=15)
-
-    # Build the query to find all stale sessions
-    # This uses an OR condition to check both scenarios
-    stale_sessions = AttendanceSession.objects.filter(
+    return AttendanceSession.objects.filter(
         logout_time__isnull=True
     ).filter(
-        # Condition 1: Stale ping
-        Q(last_ping__lt=cutoff) |
-        
-        # Condition 2: No ping ever, check against login time
-        Q(last_ping__isnull=True, login_time__lt=cutoff)
+        Q(last_ping__lt=cutoff) | Q(last_ping__isnull=True, login_time__lt=cutoff)
     )
 
-    count = stale_sessions.count()
-    if count > 0:
-        print(f"Found {count} stale sessions to close.")
 
-    for session in stale_sessions:
-        session.logout_time = timezone.now()
-        
-        # Set a clear reason based on why it was closed
-        if session.last_ping is None:
-            session.logout_reason = "Auto-logout: Tab closed"
-        else:
-            session.logout_reason = "Auto-logout: Tab closed"
-            
-        session.save(update_fields=['logout_time', 'logout_reason'])
+def close_stale_sessions(now=None):
+    """
+    Closes every stale attendance session with one conditional UPDATE and
+    returns how many it closed. The UPDATE repeats the stale conditions, so
+    a session pinged after the ids were read is left open.
+    """
+    now = now or timezone.now()
+    # This process's buffered pings land first; any arriving meanwhile count as alive
+    heartbeats.flush()
+    stale = stale_sessions(now - STALE_AFTER).exclude(pk__in=list(heartbeats.pending()))
+    rows = list(stale.values_list('pk', 'employee_id'))
+    if not rows:
+        return 0
 
+    session_ids = [pk for pk, _ in rows]
+    closed = stale.filter(pk__in=session_ids).update(logout_time=now, logout_reason=STALE_LOGOUT_REASON)
+    # .update() skips post_save, so refresh what the signals would have
+    refresh_session_days(session_ids)
+    forget_active_attendance_sessions({employee_id for _, employee_id in rows})
+    return closed
@@ -0,0 +1,60 @@
+"""
+Lazy context processor values and the per-template opt-out list.
+
+Django templates call any callable they resolve, so a processor can return
+zero-argument callables and its queries only run if the template being
+rendered actually reads one of its variables. Templates listed in
+settings.CONTEXT_PROCESSOR_SKIP_TEMPLATES get no values from these
+processors at all.
+"""
+from functools import partial
+
+from django.conf import settings
+from django.template.backends.django import DjangoTemplates as BaseDjangoTemplates
+from django.template.backends.django import Template as BaseTemplate
+
+
+SKIP_REQUEST_ATTR = '_skip_lazy_context'
+
+
+class _LazyValues:
+    def __init__(self, compute, request):
+        self._compute = compute
+        self._request = request
+        self._values = None
+
+    def get(self, key):
+        if self._values is None:
+            self._values = self._compute(self._request)
+        return self._values.get(key)
+
+
+def lazy_context(request, compute, keys):
+    """
+    Return {key: callable} for `keys`. The first variable a template reads
+    runs `compute(request)` once; keys it doesn't return resolve to None.
+    """
+    if getattr(request, SKIP_REQUEST_ATTR, False):
+        return {}
+    values = _LazyValues(compute, request)
+    return {key: partial(values.get, key) for key in keys}
+
+
+class Template(BaseTemplate):
+    def render(self, context=None, request=None):
+        skip_templates = getattr(settings, 'CONTEXT_PROCESSOR_SKIP_TEMPLATES', ())
+        if request is None or self.template.origin.template_name not in skip_templates:
+            return super().render(context, request)
+        previous = getattr(request, SKIP_REQUEST_ATTR, False)
+        setattr(request, SKIP_REQUEST_ATTR, True)
+        try:
+            return super().render(context, request)
+        finally:
+            setattr(request, SKIP_REQUEST_ATTR, previous)
+
+
+class DjangoTemplates(BaseDjangoTemplates):
+    """DjangoTemplates backend that honours CONTEXT_PROCESSOR_SKIP_TEMPLATES."""
+
+    def get_template(self, template_name):
+        return Template(super().get_template(template_name).template, self)
@@ -1,11 +1,65 @@
-from datetime import date
+import random
+import re
+import tempfile
+import threading
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from time import monotonic
 from unittest.mock import patch
 
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.sessions.backends.db import SessionStore
 from django.core.cache import cache
-from django.test import TestCase
+from django.core.management import call_command
+from django.template import engines
+from django.template.loader import render_to_string
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connection, connections, models, transaction
+from django.db.models import Q
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
 
-from .models import AllowedIP, AttendanceSession, Employee
+from .apps import _serves_requests
+from .attendance_engine import month_attendance, month_attendance_for_employees
+from .attendance_engine_reference import legacy_month_attendance
+from .attendance_registry import (
+	NO_ACTIVE_SESSION, clear_active_attendance_session, get_active_attendance_session_id, get_presence,
+	set_active_attendance_session,
+)
+from .attendance_summary import get_day_attendance, refresh_break_days
+from .context_processors import employee_daily_stats_context, notifications_context
+from .context_processors_renewal import renewal_alerts_processor
+from .customers import customer_history, normalize_mobile, rebuild_customer_index
+from .employee_context import get_employee_context
+from .forms import TokenNamingForm
+from .heartbeats import heartbeats
+from .admin_otp_login import cache_admin_session_key, get_admin_session_key
+from .ip_restriction import AllowedIPIndex, RestrictIPMiddleware
+from .middleware import AdminSingleDeviceMiddleware, SingleDeviceSessionMiddleware
+from .scheduler_lock import acquire_scheduler_lock, leader_only
+from .search import install_search_indexes, search_ids, search_q
+from .stale_cleanup import close_stale_sessions, stale_sessions
+from .transactions import write_transaction
+from .request_metrics import DURATION_BUCKETS, MetricsRecorder, histogram_quantile, recorder
+from .models import (
+	AdminActiveSession, AllowedIP, Application, ApplicationAssignment, AttendanceSession, BreakSession, Customer, CustomerRecord, DailyAttendanceSummary, Department, DepartmentTopUp, Employee, EmployeeNavbarStats,
+	EmployeeNextDayAvailability, EmployeeTarget, EmployeeUpload, ExtraDaysBonus, GlobalIPSettings, Holiday, Meeting, MeetingAttendance,
+	MonthlyDeduction, PayrollSnapshot, PerformanceBonus, RenewalDigest, SalaryPayment, TrainingBonus, UploadService, Worksheet,
+	TTDGroupMember, TTDGroupSeva, TTDIndividualDarshan, Token, TokenChatMessage, TokenSequence, UserNotificationStatus, WorksheetRollup,
+	generate_token_no,
+)
+from .navbar_stats import get_navbar_stats
+from .payroll import close_payroll_month, get_month_earnings, month_commission_due, month_payroll, verify_payroll_month
+from .renewal_digest import build_renewal_digest, get_renewal_digest
+from .worksheet_rollup import forms_stock_usage, rebuild_worksheet_rollup, refresh_rollup_cells, rollup_keys_for
+from .utils import (
+	WORKING_DAY_CALENDAR_MAX_AGE, WorkingDayCalendar, auto_mark_next_day_availability, get_employee_next_day_alert_state, next_working_day,
+	previous_working_day,
+)
 
 
 class EmployeeLoginOtpTests(TestCase):
@@ -69,3 +123,1718 @@ class EmployeeLoginOtpTests(TestCase):
 		self.assertContains(response, 'Invalid OTP. Please try again.')
 		self.assertIsNone(self.client.session.get('employee_id'))
 		self.assertEqual(AttendanceSession.objects.filter(employee=self.employee).count(), 0)
+
+
+class EmployeeContextTests(TestCase):
+	def setUp(self):
+		self.employee = Employee.objects.create(
+			name='Head Employee',
+			mobile_number='9876500000',
+			salary='15000.00',
+			joining_date=date(2024, 1, 1),
+			token_naming_access=True,
+		)
+		self.department = Department.objects.create(name='Meeseva', department_head=self.employee)
+		self.employee.department = self.department
+		self.employee.save()
+
+	def _request(self, employee_id):
+		request = RequestFactory().get('/')
+		request.session = {'employee_id': employee_id}
+		return request
+
+	def test_context_loads_employee_department_and_flags_in_one_query(self):
+		request = self._request(self.employee.employee_id)
+
+		with self.assertNumQueries(1):
+			context = get_employee_context(request)
+			self.assertEqual(context.employee, self.employee)
+			self.assertEqual(context.department, self.department)
+			self.assertTrue(context.is_department_head)
+			self.assertEqual(context.headed_department_id, self.department.pk)
+			self.assertTrue(context.has_token_naming_access)
+			self.assertFalse(context.has_token_entry_access)
+
+		with self.assertNumQueries(0):
+			self.assertIs(get_employee_context(request), context)
+			self.assertEqual(context.employee.name, 'Head Employee')
+
+	def test_context_follows_session_employee_changes(self):
+		other = Employee.objects.create(
+			name='Other Employee',
+			mobile_number='9876500001',
+			salary='10000.00',
+			joining_date=date(2024, 1, 1),
+		)
+		request = self._request(self.employee.employee_id)
+		self.assertEqual(get_employee_context(request).employee, self.employee)
+
+		request.session['employee_id'] = other.employee_id
+		context = get_employee_context(request)
+		self.assertEqual(context.employee, other)
+		self.assertFalse(context.is_department_head)
+
+		request.session.pop('employee_id')
+		self.assertIsNone(get_employee_context(request))
+
+
+class AttendanceSessionRegistryTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		AllowedIP.objects.create(
+			ip_address='0.0.0.0',
+			description='GLOBAL_ALLOW_ALL',
+			is_active=True,
+		)
+		self.employee = Employee.objects.create(
+			name='Registry Employee',
+			mobile_number='9876511111',
+			salary='15000.00',
+			joining_date=date(2024, 1, 1),
+		)
+
+	def tearDown(self):
+		cache.clear()
+
+	@patch('management.views.send_otp_whatsapp', return_value=True)
+	@patch('management.views.generate_otp', return_value='123456')
+	def _login(self, client, mock_generate_otp, mock_send_otp):
+		client.post(reverse('login'), {'mobile': self.employee.mobile_number})
+		client.post(reverse('login'), {'mobile': self.employee.mobile_number, 'otp': '123456'})
+
+	def _middleware_request(self, session):
+		session.get('employee_id')
+		request = RequestFactory().get('/employee/dashboard/')
+		request.session = session
+		return request
+
+	def test_login_and_logout_update_registry(self):
+		self._login(self.client)
+		session_id = self.client.session['attendance_session_id']
+		self.assertEqual(get_active_attendance_session_id(self.employee.employee_id), session_id)
+
+		self.client.get(reverse('logout'))
+		self.assertEqual(get_active_attendance_session_id(self.employee.employee_id), NO_ACTIVE_SESSION)
+
+	def test_middleware_skips_db_when_registry_matches(self):
+		self._login(self.client)
+		session = self.client.session
+		request = self._middleware_request(session)
+
+		with self.assertNumQueries(0):
+			self.assertIsNone(SingleDeviceSessionMiddleware(lambda r: None).process_request(request))
+		self.assertFalse(session.modified)
+
+	def test_middleware_falls_back_to_db_on_registry_miss(self):
+		self._login(self.client)
+		session = self.client.session
+		cache.clear()
+		request = self._middleware_request(session)
+
+		with self.assertNumQueries(1):
+			SingleDeviceSessionMiddleware(lambda r: None).process_request(request)
+		self.assertEqual(
+			get_active_attendance_session_id(self.employee.employee_id),
+			session['attendance_session_id'],
+		)
+
+
+class AdminSessionRegistryTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.user = User.objects.create_user('admin1', password='x', is_staff=True)
+		self.session = SessionStore()
+		self.session['_auth_user_id'] = str(self.user.pk)
+		self.session.save()
+
+	def tearDown(self):
+		cache.clear()
+
+	def _process(self):
+		request = RequestFactory().get('/admin/management/employee/autocomplete/')
+		request.session = self.session
+		return AdminSingleDeviceMiddleware(lambda r: None).process_request(request)
+
+	def test_cached_session_key_avoids_db_lookup(self):
+		cache_admin_session_key(self.user.pk, self.session.session_key)
+
+		with self.assertNumQueries(0):
+			self.assertIsNone(self._process())
+
+	def test_cache_miss_falls_back_to_db_and_kicks_other_device(self):
+		AdminActiveSession.objects.create(user=self.user, session_key='other-device-key')
+
+		response = self._process()
+
+		self.assertEqual(response.status_code, 302)
+		self.assertTrue(response.url.startswith('/admin/login/'))
+		with self.assertNumQueries(0):
+			self.assertEqual(get_admin_session_key(self.user.pk), 'other-device-key')
+
+	def test_new_login_ends_the_old_session_for_every_worker(self):
+		from .admin_otp_login import _enforce_admin_single_session
+		AdminActiveSession.objects.create(user=self.user, session_key=self.session.session_key)
+		# What another worker still holds after the new login
+		cache_admin_session_key(self.user.pk, self.session.session_key)
+
+		request = RequestFactory().post('/admin/login/')
+		request.session = SessionStore()
+		_enforce_admin_single_session(self.user, request)
+
+		self.assertFalse(SessionStore().exists(self.session.session_key))
+		reloaded = SessionStore(session_key=self.session.session_key)
+		self.assertIsNone(reloaded.get('_auth_user_id'))
+		self.assertEqual(get_admin_session_key(self.user.pk), request.session.session_key)
+
+
+class AllowedIPIndexTests(TestCase):
+	def setUp(self):
+		cache.clear()
+
+	def tearDown(self):
+		cache.clear()
+
+	def test_index_matches_legacy_startswith_rules(self):
+		rules = [
+			('10.1.1.1', None),
+			('10.9.9.9', '192.168.1.'),
+			('10.9.9.8', '172.16.'),
+			('10.9.9.7', '100.6'),
+			('10.9.9.6', '203.0.113.0/24'),
+		]
+		index = AllowedIPIndex.from_rules(rules)
+
+		for ip in ('10.1.1.1', '192.168.1.77', '172.16.200.1', '100.6.0.1', '100.64.0.1', '203.0.113.9'):
+			self.assertTrue(index.contains(ip), ip)
+		for ip in ('10.1.1.2', '192.168.10.1', '172.17.0.1', '100.7.0.1', '203.0.114.1', '', None, 'garbage'):
+			self.assertFalse(index.contains(ip), ip)
+
+	def test_middleware_rebuilds_only_when_rules_change(self):
+		middleware = RestrictIPMiddleware(lambda r: None)
+		AllowedIP.objects.create(ip_address='10.0.0.5', subnet_prefix='192.168.1.', description='Office')
+
+		self.assertTrue(middleware.is_ip_allowed('192.168.1.20'))
+		with self.assertNumQueries(0):
+			self.assertTrue(middleware.is_ip_allowed('10.0.0.5'))
+			self.assertFalse(middleware.is_ip_allowed('10.0.0.6'))
+
+		AllowedIP.objects.create(ip_address='0.0.0.0', description='GLOBAL_BLOCK')
+		self.assertFalse(middleware.is_ip_allowed('10.0.0.5'))
+
+	def test_global_settings_save_keeps_other_cache_entries(self):
+		cache.set('unrelated_key', 'kept')
+		GlobalIPSettings().save()
+		self.assertEqual(cache.get('unrelated_key'), 'kept')
+
+
+class RequestMetricsTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		AllowedIP.objects.create(ip_address='0.0.0.0', description='GLOBAL_ALLOW_ALL', is_active=True)
+		self.tmpdir = tempfile.TemporaryDirectory()
+		self.settings_override = override_settings(
+			REQUEST_METRICS_DB_PATH=Path(self.tmpdir.name) / 'metrics.sqlite3',
+		)
+		self.settings_override.enable()
+		recorder.flush()
+
+	def tearDown(self):
+		self.settings_override.disable()
+		self.tmpdir.cleanup()
+		cache.clear()
+
+	def test_histogram_quantile_interpolates_within_bucket(self):
+		counts = [0] * len(DURATION_BUCKETS)
+		counts[DURATION_BUCKETS.index(0.1)] = 10
+		self.assertAlmostEqual(histogram_quantile(DURATION_BUCKETS, counts, 0.5), 0.075)
+		self.assertIsNone(histogram_quantile(DURATION_BUCKETS, [0] * len(DURATION_BUCKETS), 0.5))
+
+	@override_settings(REQUEST_METRICS_FLUSH_SECONDS=0)
+	def test_requests_only_buffer_and_leave_the_write_to_the_scheduler(self):
+		worker = MetricsRecorder()
+		worker.record('app:view', 0.02, 3, 0.004)
+		worker.record('app:view', 0.03, 4, 0.005)
+		self.assertNotIn('app:view', [row['view'] for row in MetricsRecorder().summary()])
+
+		worker.flush()
+		rows = {row['view']: row for row in MetricsRecorder().summary()}
+		self.assertEqual(rows['app:view']['requests'], 2)
+
+	def test_workers_share_metrics_through_the_store(self):
+		worker_a, worker_b = MetricsRecorder(), MetricsRecorder()
+		worker_a.record('app:view', 0.02, 3, 0.004)
+		worker_b.record('app:view', 0.2, 7, 0.05)
+		worker_a.flush()
+		worker_b.flush()
+
+		rows = {row['view']: row for row in MetricsRecorder().summary()}
+		self.assertEqual(rows['app:view']['requests'], 2)
+		self.assertEqual(rows['app:view']['queries_sum'], 10)
+
+	def test_metrics_endpoint_is_staff_only_and_reports_views(self):
+		self.client.get(reverse('login'))
+		response = self.client.get(reverse('metrics'))
+		self.assertEqual(response.status_code, 302)
+
+		User.objects.create_user('staff', password='x', is_staff=True)
+		self.client.force_login(User.objects.get(username='staff'))
+		response = self.client.get(reverse('metrics'))
+
+		self.assertEqual(response.status_code, 200)
+		body = response.content.decode()
+		self.assertIn('sitari_request_duration_seconds_bucket{view="login",le="+Inf"}', body)
+		self.assertIn('sitari_request_db_queries_count{view="login"}', body)
+
+		response = self.client.get(reverse('admin_dashboard_request_metrics'))
+		self.assertContains(response, '<code>login</code>', html=False)
+
+
+class WorkingDayCalendarTests(TestCase):
+	def setUp(self):
+		cache.clear()
+
+	def tearDown(self):
+		cache.clear()
+
+	def test_calendar_skips_sundays_and_holidays(self):
+		saturday = date(2026, 10, 17)
+		calendar = WorkingDayCalendar(saturday, [date(2026, 10, 19)])
+
+		self.assertEqual(calendar.next_working_day(saturday), date(2026, 10, 20))
+		self.assertEqual(calendar.previous_working_day(date(2026, 10, 20)), saturday)
+		self.assertEqual(calendar.next_working_day(date(2026, 10, 15)), date(2026, 10, 16))
+		self.assertIsNone(calendar.next_working_day(saturday + timedelta(days=400)))
+
+	def test_lookups_are_cached_until_a_holiday_changes(self):
+		today = date.today()
+		next_working_day(today)
+		with self.assertNumQueries(0):
+			first = next_working_day(today)
+			previous_working_day(today)
+
+		Holiday.objects.create(date=first, reason='Festival')
+		self.assertGreater(next_working_day(today), first)
+
+		Holiday.objects.filter(date=first).delete()
+		self.assertEqual(next_working_day(today), first)
+
+	def test_calendar_expires_for_holidays_saved_by_other_workers(self):
+		today = date.today()
+		first = next_working_day(today)
+		# Another worker's save bumps the version in that worker's cache only
+		Holiday.objects.bulk_create([Holiday(date=first, reason='Festival')])
+		self.assertEqual(next_working_day(today), first)
+
+		later = monotonic() + WORKING_DAY_CALENDAR_MAX_AGE + 1
+		with patch('management.utils.time.monotonic', return_value=later):
+			self.assertGreater(next_working_day(today), first)
+
+
+@override_settings(EMPLOYEE_NEXT_DAY_ALERT_START_HOUR=16, EMPLOYEE_NEXT_DAY_ALERT_END_HOUR=17)
+class NextDayAvailabilityAutoMarkTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.now = timezone.localtime(timezone.now()).replace(hour=17, minute=5, second=0, microsecond=0)
+		self.target_date = next_working_day(self.now.date())
+		self.employees = [
+			Employee.objects.create(
+				name=f'Employee {i}',
+				mobile_number=f'90000000{i:02d}',
+				salary='15000.00',
+				joining_date=date(2024, 1, 1),
+				password='secret123',
+			)
+			for i in range(3)
+		]
+		self.locked = Employee.objects.create(
+			name='Locked Employee',
+			mobile_number='9000000099',
+			salary='15000.00',
+			joining_date=date(2024, 1, 1),
+			password='secret123',
+			locked=True,
+		)
+
+	def tearDown(self):
+		cache.clear()
+
+	def test_batch_marks_only_unanswered_unlocked_employees(self):
+		EmployeeNextDayAvailability.objects.create(
+			employee=self.employees[0], target_date=self.target_date, will_come=True,
+		)
+
+		self.assertEqual(auto_mark_next_day_availability(self.now), 2)
+		auto_rows = EmployeeNextDayAvailability.objects.filter(
+			target_date=self.target_date,
+			response_source=EmployeeNextDayAvailability.RESPONSE_SOURCE_AUTO,
+		)
+		self.assertEqual(
+			set(auto_rows.values_list('employee_id', flat=True)),
+			{self.employees[1].employee_id, self.employees[2].employee_id},
+		)
+		self.assertFalse(auto_rows.filter(will_come=True).exists())
+		self.assertTrue(EmployeeNextDayAvailability.objects.get(employee=self.employees[0]).will_come)
+		self.assertFalse(EmployeeNextDayAvailability.objects.filter(employee=self.locked).exists())
+
+		# A second run finds nothing left to mark
+		self.assertEqual(auto_mark_next_day_availability(self.now), 0)
+
+	def test_batch_does_nothing_before_end_hour(self):
+		self.assertEqual(auto_mark_next_day_availability(self.now.replace(hour=16, minute=30)), 0)
+		self.assertFalse(EmployeeNextDayAvailability.objects.exists())
+
+	def test_alert_state_caches_answers_only(self):
+		employee = self.employees[0]
+		state = get_employee_next_day_alert_state(employee, self.now)
+		self.assertIsNone(state['response'])
+		self.assertFalse(state['pending'])
+		self.assertFalse(EmployeeNextDayAvailability.objects.exists())
+		# "Not answered" is always re-read, so an answer saved in another worker shows up at once
+		with self.assertNumQueries(1):
+			get_employee_next_day_alert_state(employee, self.now)
+
+		auto_mark_next_day_availability(self.now)
+		state = get_employee_next_day_alert_state(employee, self.now)
+		self.assertFalse(state['response'].will_come)
+		self.assertTrue(state['auto_marked'])
+		with self.assertNumQueries(0):
+			get_employee_next_day_alert_state(employee, self.now)
+
+	def test_batch_counts_only_rows_it_inserted(self):
+		answered_meanwhile = self.employees[1]
+		original_bulk_create = EmployeeNextDayAvailability.objects.bulk_create
+
+		def answer_first(rows, **kwargs):
+			# An employee answers between the unanswered query and the insert
+			EmployeeNextDayAvailability.objects.create(
+				employee=answered_meanwhile, target_date=self.target_date, will_come=True,
+			)
+			return original_bulk_create(rows, **kwargs)
+
+		with patch.object(EmployeeNextDayAvailability.objects, 'bulk_create', side_effect=answer_first):
+			self.assertEqual(auto_mark_next_day_availability(self.now), 2)
+		self.assertTrue(EmployeeNextDayAvailability.objects.get(employee=answered_meanwhile).will_come)
+
+	def test_manual_answer_clears_pending_state(self):
+		employee = self.employees[0]
+		during_window = self.now.replace(hour=16, minute=30)
+		self.assertTrue(get_employee_next_day_alert_state(employee, during_window)['pending'])
+
+		EmployeeNextDayAvailability.objects.create(
+			employee=employee, target_date=self.target_date, will_come=True,
+		)
+		state = get_employee_next_day_alert_state(employee, during_window)
+		self.assertFalse(state['pending'])
+		self.assertFalse(state['auto_marked'])
+
+
+class NavbarStatsTests(TestCase):
+	def setUp(self):
+		self.employee = Employee.objects.create(
+			name='Head Employee',
+			mobile_number='9876511111',
+			salary='15000.00',
+			joining_date=date(2024, 1, 1),
+		)
+		self.department = Department.objects.create(name='Meeseva', department_head=self.employee)
+		self.employee.department = self.department
+		self.employee.save()
+		self.today = timezone.localdate()
+		EmployeeTarget.objects.create(employee=self.employee, date=self.today, target_amount='1000.00', carry_forward='200.00')
+		DepartmentTopUp.objects.create(department=self.department, amount='500.00')
+
+	def _request(self):
+		request = RequestFactory().get('/')
+		request.session = {'employee_id': self.employee.employee_id}
+		get_employee_context(request).employee
+		return request
+
+	def _stats_context(self, request=None):
+		context = employee_daily_stats_context(request or self._request())
+		return {key: value() for key, value in context.items()}
+
+	def test_context_is_a_single_lookup_once_built(self):
+		self._stats_context()
+		request = self._request()
+		with self.assertNumQueries(1):
+			context = self._stats_context(request)
+		self.assertEqual(context['navbar_daily_target'], Decimal('1200.00'))
+		self.assertEqual(context['navbar_department_balance'], Decimal('500.00'))
+
+	def test_source_changes_update_the_stored_figures(self):
+		self._stats_context()
+
+		Worksheet.objects.create(employee=self.employee, date=self.today, amount='300.00', approved=True)
+		SalaryPayment.objects.create(employee=self.employee, date=self.today, amount='5.00', payment_type='commission')
+		DepartmentTopUp.objects.create(department=self.department, amount='250.00')
+		EmployeeTarget.objects.filter(employee=self.employee).delete()
+
+		stats = EmployeeNavbarStats.objects.get(employee=self.employee)
+		self.assertEqual(stats.daily_collected, Decimal('300.00'))
+		self.assertEqual(stats.worksheet_commission, Decimal('15.00'))
+		self.assertEqual(stats.commission_paid, Decimal('5.00'))
+		self.assertEqual(stats.department_balance, Decimal('750.00'))
+		self.assertIsNone(stats.daily_target)
+
+		context = self._stats_context()
+		self.assertEqual(context['navbar_daily_collected'], Decimal('300.00'))
+		self.assertEqual(context['navbar_daily_commission'], Decimal('10.00'))
+		self.assertIsNone(context['navbar_daily_balance'])
+
+	def test_stale_rows_are_recomputed(self):
+		get_navbar_stats(self.employee, self.department.pk)
+		EmployeeNavbarStats.objects.filter(employee=self.employee).update(
+			stats_date=self.today - timedelta(days=1), daily_target=None,
+		)
+		stats = get_navbar_stats(self.employee, self.department.pk)
+		self.assertEqual(stats.stats_date, self.today)
+		self.assertEqual(stats.daily_target, Decimal('1200.00'))
+
+		# No longer heading the department drops the balance
+		self.assertIsNone(get_navbar_stats(self.employee, None).department_balance)
+
+	def test_moving_an_entry_refreshes_the_old_employee_and_day(self):
+		colleague = Employee.objects.create(
+			name='Colleague', mobile_number='9876511112', salary='15000.00', joining_date=date(2024, 1, 1),
+		)
+		get_navbar_stats(self.employee, self.department.pk)
+		get_navbar_stats(colleague, None)
+		entry = Worksheet.objects.create(employee=self.employee, date=self.today, amount='300.00', approved=True)
+
+		entry.employee = colleague
+		entry.save()
+		self.assertEqual(EmployeeNavbarStats.objects.get(employee=self.employee).daily_collected, Decimal('0.00'))
+		self.assertEqual(EmployeeNavbarStats.objects.get(employee=colleague).daily_collected, Decimal('300.00'))
+
+		# Moved to another day: today's collection drops
+		entry.date = self.today - timedelta(days=1) if self.today.day > 1 else self.today + timedelta(days=1)
+		entry.save()
+		self.assertEqual(EmployeeNavbarStats.objects.get(employee=colleague).daily_collected, Decimal('0.00'))
+
+
+class LazyContextProcessorTests(TestCase):
+	def setUp(self):
+		self.employee = Employee.objects.create(
+			name='Lazy Employee',
+			mobile_number='9876522222',
+			salary='15000.00',
+			joining_date=date(2024, 1, 1),
+		)
+
+	def _request(self):
+		request = RequestFactory().get('/')
+		request.session = {'employee_id': self.employee.employee_id}
+		return request
+
+	def test_partial_and_print_renders_run_no_queries(self):
+		for skip_templates in (settings.CONTEXT_PROCESSOR_SKIP_TEMPLATES, []):
+			with self.subTest(skip_templates=skip_templates), override_settings(CONTEXT_PROCESSOR_SKIP_TEMPLATES=skip_templates):
+				with self.assertNumQueries(0):
+					render_to_string('partials/worksheet_edit_form.html', {'entry_id': 1}, request=self._request())
+					render_to_string('token_print.html', {}, request=self._request())
+
+	def test_processor_runs_once_when_a_template_reads_its_values(self):
+		template = engines['django'].from_string(
+			'{{ unread_notification_count }}/{{ is_department_head }}/{{ has_token_naming_access }}'
+		)
+		# One query for the employee, one for the unread count
+		with self.assertNumQueries(2):
+			self.assertEqual(template.render({}, self._request()), '0/False/False')
+
+	def test_skipped_templates_get_no_processor_values(self):
+		template = engines['django'].get_template('token_print.html')
+		request = self._request()
+		seen = []
+		with patch(
+			'management.template_context.BaseTemplate.render',
+			side_effect=lambda context, request: seen.append(notifications_context(request)) or '',
+		):
+			template.render({}, request)
+		self.assertEqual(seen, [{}])
+		self.assertIn('unread_notification_count', notifications_context(request))
+
+
+@override_settings(RENEWAL_DIGEST_TOP_N=2)
+class RenewalDigestTests(TestCase):
+	def setUp(self):
+		self.today = date.today()
+		self.employee = Employee.objects.create(
+			name='Upload Employee',
+			mobile_number='9876533333',
+			salary='15000.00',
+			joining_date=date(2024, 1, 1),
+		)
+		self.pan = UploadService.objects.create(name='PAN')
+		self.passport = UploadService.objects.create(name='Passport')
+		for days, service in ((-30, self.pan), (-10, self.pan), (0, self.passport), (3, self.pan), (40, self.pan)):
+			self._upload(days, service)
+
+	def _upload(self, days, service):
+		return EmployeeUpload.objects.create(
+			employee=self.employee,
+			service=service,
+			description=f'Renewal in {days} days',
+			file='employee_uploads/test.pdf',
+			renewal_date=self.today + timedelta(days=days),
+		)
+
+	def test_digest_counts_per_service_and_keeps_top_n(self):
+		digest = build_renewal_digest(self.today)
+
+		self.assertEqual(digest.expired_count, 3)
+		self.assertEqual(digest.due_soon_count, 1)
+		self.assertEqual(digest.service_counts, [
+			{'service': 'PAN', 'expired': 2, 'due_soon': 1},
+			{'service': 'Passport', 'expired': 1, 'due_soon': 0},
+		])
+		self.assertEqual(
+			[upload['renewal_date'] for upload in digest.expired_uploads()],
+			[self.today - timedelta(days=30), self.today - timedelta(days=10)],
+		)
+		self.assertEqual(len(digest.due_soon_items), 1)
+
+	def test_admin_index_reads_digest_in_one_query(self):
+		build_renewal_digest(self.today)
+		request = RequestFactory().get('/admin/')
+		with self.assertNumQueries(1):
+			context = {key: value() for key, value in renewal_alerts_processor(request).items()}
+		self.assertEqual(context['expired_count'], 3)
+		self.assertTrue(context['show_renewal_alert'])
+		self.assertEqual(renewal_alerts_processor(RequestFactory().get('/admin/management/')), {})
+
+	def test_upload_changes_drop_todays_digest(self):
+		build_renewal_digest(self.today - timedelta(days=1))
+		build_renewal_digest(self.today)
+		self.assertEqual(RenewalDigest.objects.count(), 1)
+
+		self._upload(-1, self.passport)
+		self.assertFalse(RenewalDigest.objects.exists())
+		self.assertEqual(get_renewal_digest(self.today).expired_count, 4)
+
+
+class AttendanceEngineParityTests(TestCase):
+	"""month_attendance must return exactly what the legacy per-day loop returned."""
+
+	def _at(self, year, month, day, hour, minute, second=0, microsecond=0):
+		return timezone.make_aware(datetime(year, month, day, hour, minute, second, microsecond))
+
+	def _random_month(self, rng, year, month):
+		sessions, breaks = [], []
+		for _ in range(rng.randint(0, 120)):
+			day = rng.randint(1, 28)
+			login = self._at(year, month, day, rng.randint(0, 23), rng.randint(0, 59), rng.randint(0, 59), rng.randint(0, 999999))
+			length = timedelta(minutes=rng.randint(-5, 300), microseconds=rng.randint(0, 999999))
+			kind = rng.random()
+			sessions.append(AttendanceSession(
+				login_time=login,
+				logout_time=login + length if kind < 0.6 else None,
+				session_expires_at=login + length + timedelta(minutes=15) if kind < 0.85 else None,
+				session_status='ended',
+			))
+		for _ in range(rng.randint(0, 30)):
+			start = self._at(year, month, rng.randint(1, 28), rng.randint(6, 20), rng.randint(0, 59), rng.randint(0, 59))
+			breaks.append(BreakSession(
+				start_time=start,
+				end_time=start + timedelta(minutes=rng.randint(1, 240)) if rng.random() < 0.8 else None,
+				logout_reason='Break',
+				approved=rng.random() < 0.5,
+			))
+		sessions.sort(key=lambda s: s.login_time)
+		breaks.sort(key=lambda b: b.start_time)
+		return sessions, breaks
+
+	def test_random_months_match_legacy(self):
+		rng = random.Random(2024)
+		hours = [(None, None), (time(10, 0), time(19, 30)), (time(9, 0), time(10, 30)), (time(7, 15), time(7, 15))]
+		for case in range(60):
+			year, month = rng.choice([(2024, 2), (2025, 3), (2025, 7), (2025, 12)])
+			start, end = rng.choice(hours)
+			employee = Employee(
+				name='Parity',
+				salary=rng.choice([Decimal('0'), Decimal('15000.00'), Decimal('23333.33')]),
+				working_start_time=start,
+				working_end_time=end,
+			)
+			sessions, breaks = self._random_month(rng, year, month)
+			with self.subTest(case=case):
+				self.assertEqual(
+					month_attendance(employee, year, month, sessions, breaks),
+					legacy_month_attendance(employee, year, month, sessions, breaks),
+				)
+
+	def test_edge_cases_match_legacy(self):
+		employee = Employee(name='Edge', salary=Decimal('31000.00'))
+		sessions = [
+			# Touching and overlapping refresh-split sessions
+			AttendanceSession(login_time=self._at(2025, 7, 1, 9, 0), logout_time=self._at(2025, 7, 1, 9, 15)),
+			AttendanceSession(login_time=self._at(2025, 7, 1, 9, 15), logout_time=self._at(2025, 7, 1, 9, 40)),
+			AttendanceSession(login_time=self._at(2025, 7, 1, 9, 30), logout_time=self._at(2025, 7, 1, 12, 0)),
+			# Open session with no expiry runs to the end of the working day
+			AttendanceSession(login_time=self._at(2025, 7, 2, 8, 0)),
+			# Only logins after working hours
+			AttendanceSession(login_time=self._at(2025, 7, 3, 18, 0), logout_time=self._at(2025, 7, 3, 19, 0)),
+			# Logged in before 9, logout after 5 falls back to session expiry
+			AttendanceSession(
+				login_time=self._at(2025, 7, 4, 8, 30), logout_time=self._at(2025, 7, 4, 17, 30),
+				session_expires_at=self._at(2025, 7, 4, 17, 45),
+			),
+			# Late-night local login lands on the local date, not the UTC one
+			AttendanceSession(login_time=self._at(2025, 7, 5, 0, 10), logout_time=self._at(2025, 7, 5, 10, 0)),
+		]
+		breaks = [
+			BreakSession(start_time=self._at(2025, 7, 1, 10, 0), end_time=self._at(2025, 7, 1, 13, 0), approved=True, logout_reason='Lunch'),
+			BreakSession(start_time=self._at(2025, 7, 1, 16, 30), end_time=None, approved=True, logout_reason='Open'),
+			BreakSession(start_time=self._at(2025, 7, 2, 7, 0), end_time=self._at(2025, 7, 2, 8, 0), approved=True, logout_reason='Early'),
+			BreakSession(start_time=self._at(2025, 7, 4, 12, 0), end_time=self._at(2025, 7, 4, 12, 30), approved=False, logout_reason='Pending'),
+		]
+		self.assertEqual(
+			month_attendance(employee, 2025, 7, sessions, breaks),
+			legacy_month_attendance(employee, 2025, 7, sessions, breaks),
+		)
+
+	def test_model_method_uses_engine_over_stored_rows(self):
+		employee = Employee.objects.create(
+			name='Stored', mobile_number='9876544444', salary=Decimal('20000.00'), joining_date=date(2024, 1, 1),
+		)
+		AttendanceSession.objects.create(
+			employee=employee, login_time=self._at(2025, 7, 7, 9, 5), logout_time=self._at(2025, 7, 7, 15, 0),
+			session_status='ended',
+		)
+		AttendanceSession.objects.create(
+			employee=employee, login_time=self._at(2025, 7, 8, 9, 0), logout_time=self._at(2025, 7, 8, 9, 30),
+			session_status='expired',
+		)
+		BreakSession.objects.create(
+			employee=employee, start_time=self._at(2025, 7, 7, 15, 0), end_time=self._at(2025, 7, 7, 16, 0),
+			approved=True, logout_reason='Errand',
+		)
+		sessions = list(AttendanceSession.objects.filter(session_status__in=['active', 'refreshed', 'ended']))
+		breaks = list(BreakSession.objects.all())
+
+		records, total, base = employee.get_daily_attendance_summary(2025, 7)
+		self.assertEqual((records, total, base), legacy_month_attendance(employee, 2025, 7, sessions, breaks))
+		self.assertEqual(records[6]['total_duration'], '6h 55m')
+		self.assertEqual(records[7]['daily_wage'], Decimal('0.00'))
+
+
+class BatchAttendanceTests(TestCase):
+	def _at(self, day, hour, minute=0):
+		return timezone.make_aware(datetime(2025, 7, day, hour, minute))
+
+	def setUp(self):
+		self.employees = []
+		for i in range(4):
+			employee = Employee.objects.create(
+				name=f'Batch {i}',
+				mobile_number=f'98765000{i:02d}',
+				salary=Decimal('12000.00') + i * 1000,
+				joining_date=date(2024, 1, 1),
+				working_start_time=time(9 + i % 2, 0),
+			)
+			self.employees.append(employee)
+			for day in range(1, 6 + i):
+				AttendanceSession.objects.create(
+					employee=employee, login_time=self._at(day, 9, 10 * i), logout_time=self._at(day, 12 + i, 0),
+					session_status='ended',
+				)
+				AttendanceSession.objects.create(
+					employee=employee, login_time=self._at(day, 13, 0), logout_time=self._at(day, 16, 30),
+					session_status='refreshed',
+				)
+			BreakSession.objects.create(
+				employee=employee, start_time=self._at(2, 12, 0), end_time=self._at(2, 13, 0),
+				approved=bool(i % 2), logout_reason='Lunch',
+			)
+		# Outside the month / with an excluded status: must not be picked up
+		AttendanceSession.objects.create(
+			employee=self.employees[0], login_time=self._at(1, 9) - timedelta(days=3),
+			logout_time=self._at(1, 17) - timedelta(days=3), session_status='ended',
+		)
+		AttendanceSession.objects.create(
+			employee=self.employees[1], login_time=self._at(20, 9), logout_time=self._at(20, 17),
+			session_status='expired',
+		)
+
+	def test_batch_uses_two_queries_and_matches_per_employee_summaries(self):
+		with self.assertNumQueries(2):
+			results = month_attendance_for_employees(self.employees, 2025, 7)
+
+		self.assertEqual(set(results), {employee.pk for employee in self.employees})
+		for employee in self.employees:
+			with self.subTest(employee=employee.name):
+				self.assertEqual(results[employee.pk], employee.get_daily_attendance_summary(2025, 7))
+		self.assertGreater(results[self.employees[3].pk][1], results[self.employees[0].pk][1])
+
+	def test_employee_without_rows_gets_an_empty_month(self):
+		idle = Employee.objects.create(
+			name='Idle', mobile_number='9876599999', salary=Decimal('9000.00'), joining_date=date(2024, 1, 1),
+		)
+		records, total, base = month_attendance_for_employees([idle], 2025, 7)[idle.pk]
+		self.assertEqual(len(records), 31)
+		self.assertEqual(total, Decimal('0.00'))
+		self.assertEqual(base, round(Decimal('9000.00') / 31, 2))
+
+
+class DailyAttendanceSummaryTests(TestCase):
+	def _at(self, day, hour, minute=0):
+		return timezone.make_aware(datetime(2025, 7, day, hour, minute))
+
+	def setUp(self):
+		self.employee = Employee.objects.create(
+			name='Summary', mobile_number='9876511111', salary=Decimal('15500.00'), joining_date=date(2024, 1, 1),
+		)
+		for day in (1, 2, 3):
+			AttendanceSession.objects.create(
+				employee=self.employee, login_time=self._at(day, 9, 5), logout_time=self._at(day, 12, 40),
+				session_status='refreshed',
+			)
+			AttendanceSession.objects.create(
+				employee=self.employee, login_time=self._at(day, 12, 35), logout_time=self._at(day, 16, 50),
+				session_status='ended',
+			)
+		self.lunch = BreakSession.objects.create(
+			employee=self.employee, start_time=self._at(2, 13, 0), end_time=self._at(2, 14, 0),
+			approved=False, logout_reason='Lunch',
+		)
+
+	def _legacy(self):
+		sessions = list(AttendanceSession.objects.filter(
+			employee=self.employee, session_status__in=['active', 'refreshed', 'ended'],
+		).order_by('login_time'))
+		breaks = list(BreakSession.objects.filter(employee=self.employee).order_by('start_time'))
+		return legacy_month_attendance(self.employee, 2025, 7, sessions, breaks)
+
+	def test_closed_sessions_write_rows_and_open_days_are_left_live(self):
+		self.assertEqual(
+			set(DailyAttendanceSummary.objects.values_list('date', flat=True)),
+			{date(2025, 7, 1), date(2025, 7, 2), date(2025, 7, 3)},
+		)
+		session = AttendanceSession.objects.create(
+			employee=self.employee, login_time=self._at(3, 17, 30), session_status='active',
+		)
+		self.assertFalse(DailyAttendanceSummary.objects.filter(date=date(2025, 7, 3)).exists())
+		self.assertEqual(self.employee.get_daily_attendance_summary(2025, 7), self._legacy())
+
+		session.logout_time = self._at(3, 18, 0)
+		session.save()
+		row = DailyAttendanceSummary.objects.get(date=date(2025, 7, 3))
+		self.assertEqual(row.last_logout, self._at(3, 16, 50))
+		self.assertEqual(self.employee.get_daily_attendance_summary(2025, 7), self._legacy())
+
+	def test_backfilled_month_reads_in_one_query_with_legacy_parity(self):
+		call_command('backfill_attendance_summaries', start='2025-07-01', end='2025-07-31', chunk_days=10, stdout=StringIO())
+		self.assertEqual(DailyAttendanceSummary.objects.filter(employee=self.employee).count(), 31)
+
+		with self.assertNumQueries(1):
+			result = self.employee.get_daily_attendance_summary(2025, 7)
+		self.assertEqual(result, self._legacy())
+
+	def test_bulk_break_approval_refreshes_the_stored_day(self):
+		before = DailyAttendanceSummary.objects.get(date=date(2025, 7, 2))
+		BreakSession.objects.filter(pk=self.lunch.pk).update(approved=True)
+		refresh_break_days([self.lunch.pk])
+
+		after = DailyAttendanceSummary.objects.get(date=date(2025, 7, 2))
+		self.assertTrue(after.break_sessions[0]['approved'])
+		self.assertGreater(after.approved_break_seconds, before.approved_break_seconds)
+		self.assertEqual(self.employee.get_daily_attendance_summary(2025, 7), self._legacy())
+
+	def test_rows_from_an_old_salary_are_not_trusted(self):
+		self.employee.salary = Decimal('31000.00')
+		self.employee.save()
+		self.assertEqual(self.employee.get_daily_attendance_summary(2025, 7), self._legacy())
+
+	def test_single_day_matches_the_month_record(self):
+		records, _, base = self._legacy()
+		DailyAttendanceSummary.objects.filter(date=date(2025, 7, 3)).delete()
+		for day in (date(2025, 7, 1), date(2025, 7, 2), date(2025, 7, 3), date(2025, 7, 4)):
+			with self.subTest(day=day):
+				stored = DailyAttendanceSummary.objects.filter(employee=self.employee, date=day).exists()
+				with self.assertNumQueries(1 if stored else 3):
+					record, max_daily_wage = get_day_attendance(self.employee, day)
+				self.assertEqual(record, records[day.day - 1])
+				self.assertEqual(max_daily_wage, base)
+
+
+class MonthPayrollTests(TestCase):
+	def setUp(self):
+		self.today = timezone.localdate()
+		xerox = Department.objects.create(name='Xerox')
+		meeseva = Department.objects.create(name='Meeseva')
+		meeting = Meeting.objects.create(date=self.today, topic='Weekly', amount=Decimal('150.00'))
+		application = Application.objects.create(customer_name='C', customer_mobile_number='9000000000', total_commission=Decimal('300.00'), approved=True)
+		pending = Application.objects.create(customer_name='D', customer_mobile_number='9000000001', total_commission=Decimal('80.00'))
+		self.employees = []
+		for i, department in enumerate([xerox, meeseva, None, xerox]):
+			employee = Employee.objects.create(
+				name=f'Payroll {i}', mobile_number=f'98766000{i:02d}', salary=Decimal('14000.00') + i * 750,
+				joining_date=date(2024, 1, 1), department=department,
+			)
+			self.employees.append(employee)
+			login = timezone.make_aware(datetime.combine(self.today.replace(day=1), time(9, 15)))
+			AttendanceSession.objects.create(
+				employee=employee, login_time=login, logout_time=login + timedelta(hours=5 + i), session_status='ended',
+			)
+			for day, amount in ((1, '420.50'), (1, '310.25'), (2, '499.99'), (2, '80.10')):
+				Worksheet.objects.create(
+					employee=employee, date=self.today.replace(day=day), amount=Decimal(amount) + i, approved=True,
+				)
+			Worksheet.objects.create(employee=employee, date=self.today.replace(day=1), amount=Decimal('999.00'))
+			if i != 2:
+				ApplicationAssignment.objects.create(application=application, employee=employee, commission_amount=Decimal('33.33') * (i + 1))
+				ApplicationAssignment.objects.create(application=pending, employee=employee, commission_amount=Decimal('40.00'))
+				MeetingAttendance.objects.create(meeting=meeting, employee=employee, attended=bool(i % 2))
+				TrainingBonus.objects.create(employee=employee, date=self.today, reason='T', amount=Decimal('25.50'))
+				PerformanceBonus.objects.create(employee=employee, date=self.today, reason='P', amount=Decimal('100.00') * i)
+				ExtraDaysBonus.objects.create(employee=employee, date=self.today, reason='E', amount=Decimal('12.75'))
+				MonthlyDeduction.objects.create(employee=employee, year=self.today.year, month=self.today.month, amount=Decimal('60.40'))
+
+	def test_matches_per_employee_earnings_with_a_fixed_query_count(self):
+		employees = list(Employee.objects.filter(pk__in=[e.pk for e in self.employees]))
+		with self.assertNumQueries(12):
+			payroll = month_payroll(employees, self.today.year, self.today.month)
+
+		for employee in employees:
+			with self.subTest(employee=employee.name):
+				expected = employee.get_current_month_earnings(self.today.year, self.today.month)
+				expected.pop('monthly_deductions_list')
+				self.assertEqual(payroll[employee.pk], expected)
+		self.assertEqual(payroll[self.employees[2].pk]['application_commissions'], Decimal('0.00'))
+		self.assertGreater(payroll[self.employees[0].pk]['worksheet_commissions'], Decimal('0'))
+
+	def _expected_due(self, employee, year, month):
+		paid = sum(
+			employee.salary_payments.filter(date__year=year, date__month=month, payment_type='commission')
+			.values_list('amount', flat=True),
+			Decimal('0.00'),
+		)
+		return employee.get_worksheet_commission(year, month) + employee.get_application_commission(year, month) - paid
+
+	def test_commission_due_for_the_whole_page_is_a_fixed_query_count(self):
+		SalaryPayment.objects.create(
+			employee=self.employees[0], date=self.today, amount=Decimal('20.00'), payment_type='commission',
+		)
+		SalaryPayment.objects.create(employee=self.employees[0], date=self.today, amount=Decimal('900.00'))
+		employee_ids = [employee.pk for employee in self.employees]
+		with self.assertNumQueries(5):
+			dues = month_commission_due(employee_ids, self.today.year, self.today.month)
+		for employee in Employee.objects.filter(pk__in=employee_ids):
+			with self.subTest(employee=employee.name):
+				self.assertEqual(dues[employee.pk], self._expected_due(employee, self.today.year, self.today.month))
+
+		cache.clear()
+		AllowedIP.objects.create(ip_address='0.0.0.0', description='GLOBAL_ALLOW_ALL', is_active=True)
+		self.client.force_login(User.objects.create_superuser('payrolladmin', 'payrolladmin@example.com', 'pass'))
+		response = self.client.get(reverse('admin:management_employee_changelist'), {'employee_status': 'inactive'})
+		now = timezone.now()
+		listed = {employee.pk: employee._commission_due for employee in response.context['cl'].result_list}
+		self.assertEqual(listed, month_commission_due(employee_ids, now.year, now.month))
+
+
+class PayrollSnapshotTests(TestCase):
+	def setUp(self):
+		self.employee = Employee.objects.create(
+			name='Closed', mobile_number='9876577777', salary=Decimal('18600.00'), joining_date=date(2024, 1, 1),
+		)
+		login = timezone.make_aware(datetime(2025, 7, 3, 9, 0))
+		AttendanceSession.objects.create(
+			employee=self.employee, login_time=login, logout_time=login + timedelta(hours=6), session_status='ended',
+		)
+		Worksheet.objects.create(employee=self.employee, date=date(2025, 7, 3), amount=Decimal('812.30'), approved=True)
+		self.bonus = TrainingBonus.objects.create(employee=self.employee, date=date(2025, 7, 9), reason='T', amount=Decimal('40.00'))
+
+	def _live(self):
+		earnings = self.employee.get_current_month_earnings(2025, 7)
+		earnings.pop('monthly_deductions_list')
+		return earnings
+
+	def test_closing_freezes_the_breakdown_and_reclosing_unchanged_inputs_is_a_no_op(self):
+		self.assertEqual(close_payroll_month(2025, 7), 1)
+		snapshot = PayrollSnapshot.objects.get(employee=self.employee, year=2025, month=7)
+		self.assertEqual(snapshot.earnings(), self._live())
+		self.assertEqual(len(snapshot.inputs_hash), 64)
+
+		with self.assertNumQueries(2):
+			earnings, frozen = get_month_earnings(self.employee, 2025, 7)
+			list(earnings.pop('monthly_deductions_list'))
+		self.assertEqual(frozen.pk, snapshot.pk)
+		self.assertEqual(earnings, self._live())
+		self.assertEqual(close_payroll_month(2025, 7), 0)
+
+	def test_edits_mark_the_snapshot_stale_and_reclosing_bumps_the_version(self):
+		close_payroll_month(2025, 7)
+		frozen_total = PayrollSnapshot.objects.get(employee=self.employee).total_earnings
+
+		self.bonus.amount = Decimal('90.00')
+		self.bonus.save()
+		snapshot = PayrollSnapshot.objects.get(employee=self.employee)
+		self.assertTrue(snapshot.is_stale)
+		self.assertEqual(snapshot.total_earnings, frozen_total)
+		self.assertEqual(get_month_earnings(self.employee, 2025, 7)[0]['total_earnings'], frozen_total)
+
+		self.assertEqual(close_payroll_month(2025, 7), 1)
+		snapshot.refresh_from_db()
+		self.assertFalse(snapshot.is_stale)
+		self.assertEqual(snapshot.version, 2)
+		self.assertEqual(snapshot.total_earnings, frozen_total + Decimal('50.00'))
+
+	def test_verify_catches_updates_that_skip_signals(self):
+		close_payroll_month(2025, 7)
+		Worksheet.objects.filter(employee=self.employee).update(amount=Decimal('900.00'))
+		self.assertFalse(PayrollSnapshot.objects.get(employee=self.employee).is_stale)
+		self.assertEqual(verify_payroll_month(2025, 7), 1)
+		self.assertTrue(PayrollSnapshot.objects.get(employee=self.employee).is_stale)
+
+	def test_admin_approve_actions_mark_the_snapshot_stale(self):
+		from django.contrib.admin.sites import site
+		entry = Worksheet.objects.create(employee=self.employee, date=date(2025, 7, 8), amount=Decimal('20.00'))
+		pause = BreakSession.objects.create(
+			employee=self.employee, start_time=timezone.make_aware(datetime(2025, 7, 3, 12, 0)),
+			end_time=timezone.make_aware(datetime(2025, 7, 3, 12, 30)),
+		)
+		request = RequestFactory().post('/')
+		for model, action, rows in (
+			(Worksheet, 'approve_worksheets', Worksheet.objects.filter(pk=entry.pk)),
+			(BreakSession, 'approve_selected_breaks', BreakSession.objects.filter(pk=pause.pk)),
+		):
+			with self.subTest(action=action):
+				close_payroll_month(2025, 7)
+				model_admin = site._registry[model]
+				with patch.object(model_admin, 'message_user'):
+					getattr(model_admin, action)(request, rows)
+				self.assertTrue(PayrollSnapshot.objects.get(employee=self.employee).is_stale)
+
+	def test_the_current_month_cannot_be_closed(self):
+		today = timezone.localdate()
+		with self.assertRaises(ValueError):
+			close_payroll_month(today.year, today.month)
+
+
+class SchedulerLeaderTests(TestCase):
+	def test_scheduler_runs_only_in_server_processes(self):
+		for argv, expected in (
+			(['gunicorn', 'project.wsgi'], True),
+			(['/srv/venv/bin/uvicorn', 'project.asgi:application'], True),
+			(['/srv/venv/lib/python3.12/site-packages/gunicorn/__main__.py', 'project.wsgi'], True),
+			(['manage.py', 'runserver'], True),
+			(['manage.py', 'test', 'management'], False),
+			(['manage.py', 'migrate'], False),
+			(['/usr/bin/django-admin', 'shell'], False),
+			(['/srv/venv/bin/pytest'], False),
+			(['/srv/venv/bin/celery', '-A', 'project', 'worker'], False),
+			(['scripts/import_tokens.py'], False),
+			([], False),
+		):
+			with self.subTest(argv=argv), patch('sys.argv', argv), patch.dict('os.environ', clear=False) as env:
+				env.pop('SITARI_RUN_SCHEDULER', None)
+				self.assertEqual(_serves_requests(), expected)
+
+	def test_scheduler_flag_overrides_the_detection(self):
+		for flag, argv, expected in (
+			('1', ['/srv/venv/bin/celery', '-A', 'project', 'worker'], True),
+			('0', ['gunicorn', 'project.wsgi'], False),
+			('0', ['manage.py', 'runserver'], False),
+		):
+			with self.subTest(flag=flag, argv=argv), patch('sys.argv', argv), \
+					patch.dict('os.environ', {'SITARI_RUN_SCHEDULER': flag}):
+				self.assertEqual(_serves_requests(), expected)
+
+	def test_one_of_several_workers_takes_each_interval(self):
+		now = timezone.now()
+		ttl = timedelta(seconds=50)
+		for offset, expected_runs in ((0, 1), (30, 0), (60, 1), (61, 0), (125, 1)):
+			at = now + timedelta(seconds=offset)
+			won = [acquire_scheduler_lock('job', ttl, owner=f'worker-{i}', now=at) for i in range(5)]
+			self.assertEqual(won.count(True), expected_runs, offset)
+
+	def test_leader_only_runs_the_job_once_across_workers(self):
+		runs = []
+		job = leader_only('counted_job', timedelta(seconds=50))(lambda: runs.append(1) or 'ran')
+		results = []
+		for worker in range(4):
+			with patch('management.scheduler_lock.WORKER_ID', f'gunicorn-{worker}'):
+				results.append(job())
+		self.assertEqual(runs, [1])
+		self.assertEqual(results.count('ran'), 1)
+		self.assertEqual(results.count(None), 3)
+
+	def test_stale_sessions_close_in_one_leader_run(self):
+		employee = Employee.objects.create(
+			name='Stale', mobile_number='9876588888', salary=Decimal('12000.00'), joining_date=date(2024, 1, 1),
+		)
+		now = timezone.now()
+		pinged_long_ago = AttendanceSession.objects.create(
+			employee=employee, login_time=now - timedelta(hours=2), last_ping=now - timedelta(minutes=20),
+		)
+		never_pinged = AttendanceSession.objects.create(employee=employee, login_time=now - timedelta(minutes=40))
+		fresh = AttendanceSession.objects.create(
+			employee=employee, login_time=now - timedelta(hours=1), last_ping=now - timedelta(minutes=2),
+		)
+
+		workers = [leader_only('close_stale_sessions', timedelta(seconds=50))(close_stale_sessions) for _ in range(3)]
+		results = []
+		for worker, job in enumerate(workers):
+			with patch('management.scheduler_lock.WORKER_ID', f'gunicorn-{worker}'):
+				results.append(job())
+		self.assertEqual(results, [2, None, None])
+
+		for session in (pinged_long_ago, never_pinged, fresh):
+			session.refresh_from_db()
+		self.assertEqual(pinged_long_ago.logout_reason, 'Auto-logout: Tab closed')
+		self.assertIsNotNone(never_pinged.logout_time)
+		self.assertIsNone(fresh.logout_time)
+		self.assertEqual(close_stale_sessions(), 0)
+
+
+class HeartbeatBufferTests(TestCase):
+	def setUp(self):
+		heartbeats.flush()
+		cache.clear()
+		self.employees = []
+		self.sessions = []
+		login = timezone.now() - timedelta(hours=1)
+		for i in range(3):
+			employee = Employee.objects.create(
+				name=f'Tab {i}', mobile_number=f'98767000{i:02d}', salary=Decimal('12000.00'), joining_date=date(2024, 1, 1),
+			)
+			self.employees.append(employee)
+			self.sessions.append(AttendanceSession.objects.create(
+				employee=employee, login_time=login, last_ping=login, session_expires_at=login + timedelta(minutes=60),
+			))
+
+	def tearDown(self):
+		heartbeats.flush()
+
+	def _post(self, view, employee):
+		from . import views
+		request = RequestFactory().post('/')
+		request.session = {'employee_id': employee.employee_id}
+		return getattr(views, view)(request)
+
+	def test_pings_and_refreshes_are_buffered_then_written_in_one_update(self):
+		for employee in self.employees:
+			self._post('attendance_ping', employee)
+		for employee in self.employees:
+			with self.assertNumQueries(0):
+				self._post('attendance_ping', employee)
+				response = self._post('refresh_session', employee)
+			self.assertEqual(response.status_code, 200)
+		self.assertEqual(set(heartbeats.pending()), {session.pk for session in self.sessions})
+
+		self.sessions[2].logout_time = timezone.now()
+		self.sessions[2].save()
+		with self.assertNumQueries(1):
+			self.assertEqual(heartbeats.flush(), 2)
+
+		for session in self.sessions:
+			session.refresh_from_db()
+		for session in self.sessions[:2]:
+			self.assertGreater(session.last_ping, session.login_time)
+			self.assertEqual(session.session_status, 'refreshed')
+			self.assertGreater(session.session_expires_at, session.last_ping)
+		self.assertEqual(self.sessions[2].last_ping, self.sessions[2].login_time)
+		self.assertEqual(self.sessions[2].session_status, 'active')
+
+	@override_settings(HEARTBEAT_FLUSH_SECONDS=0)
+	def test_buffer_flushes_itself_when_due(self):
+		self._post('attendance_ping', self.employees[0])
+		self.assertEqual(heartbeats.pending(), {})
+		self.sessions[0].refresh_from_db()
+		self.assertGreater(self.sessions[0].last_ping, self.sessions[0].login_time)
+
+	def test_stale_cleanup_reads_buffered_pings(self):
+		long_ago = timezone.now() - timedelta(minutes=30)
+		AttendanceSession.objects.filter(pk__in=[s.pk for s in self.sessions]).update(last_ping=long_ago)
+		self._post('attendance_ping', self.employees[0])
+
+		self.assertEqual(close_stale_sessions(), 2)
+		self.sessions[0].refresh_from_db()
+		self.assertIsNone(self.sessions[0].logout_time)
+		self.assertGreater(self.sessions[0].last_ping, long_ago)
+
+	def test_close_stale_sessions_command_uses_the_shared_cleanup(self):
+		long_ago = timezone.now() - timedelta(minutes=30)
+		AttendanceSession.objects.filter(pk__in=[s.pk for s in self.sessions]).update(last_ping=long_ago)
+		self._post('attendance_ping', self.employees[0])
+
+		out = StringIO()
+		call_command('close_stale_sessions', stdout=out)
+		self.assertIn('Closed 2 stale session(s)', out.getvalue())
+		self.sessions[0].refresh_from_db()
+		self.assertIsNone(self.sessions[0].logout_time)
+		self.sessions[1].refresh_from_db()
+		self.assertEqual(self.sessions[1].logout_reason, 'Auto-logout: Tab closed')
+
+
+class PresenceRegistryTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.employees = [
+			Employee.objects.create(
+				name=f'Presence {i}', mobile_number=f'98768000{i:02d}', salary=Decimal('12000.00'), joining_date=date(2024, 1, 1),
+			)
+			for i in range(5)
+		]
+		self.login = timezone.now() - timedelta(hours=2)
+		for employee in self.employees[:3]:
+			AttendanceSession.objects.create(employee=employee, login_time=self.login)
+		AttendanceSession.objects.create(
+			employee=self.employees[3], login_time=self.login, logout_time=self.login + timedelta(hours=1),
+		)
+
+	def test_str_and_is_active_read_presence_in_bulk(self):
+		cache.clear()
+		with self.assertNumQueries(1):
+			labels = [str(employee) for employee in self.employees]
+		with self.assertNumQueries(0):
+			labels_again = [str(employee) for employee in self.employees]
+			active = [employee.is_active() for employee in self.employees]
+		self.assertEqual(labels, labels_again)
+		self.assertEqual(active, [True, True, True, False, False])
+		self.assertIn('Active', labels[0])
+		self.assertNotIn('Active', labels[3])
+		self.assertEqual(get_presence()[self.employees[0].employee_id], self.login)
+
+	def test_login_logout_and_stale_close_keep_presence_current(self):
+		get_presence()
+		newcomer = self.employees[4]
+		session = AttendanceSession.objects.create(employee=newcomer, login_time=timezone.now())
+		set_active_attendance_session(newcomer.employee_id, session.pk)
+		with self.assertNumQueries(0):
+			self.assertTrue(newcomer.is_active())
+
+		clear_active_attendance_session(self.employees[0].employee_id)
+		with self.assertNumQueries(0):
+			self.assertFalse(self.employees[0].is_active())
+
+		AttendanceSession.objects.filter(employee=self.employees[1]).update(last_ping=timezone.now() - timedelta(hours=1))
+		AttendanceSession.objects.filter(employee=self.employees[0]).update(logout_time=timezone.now())
+		self.assertEqual(close_stale_sessions(), 2)
+		self.assertFalse(self.employees[1].is_active())
+		self.assertTrue(newcomer.is_active())
+
+	def test_closing_one_of_two_open_sessions_keeps_the_employee_online(self):
+		employee = self.employees[0]
+		second = AttendanceSession.objects.create(employee=employee, login_time=self.login + timedelta(hours=1))
+		get_presence()
+
+		first = AttendanceSession.objects.get(employee=employee, login_time=self.login)
+		first.logout_time = timezone.now()
+		first.save()
+		with self.assertNumQueries(0):
+			self.assertTrue(employee.is_active())
+		self.assertEqual(get_presence()[employee.employee_id], second.login_time)
+
+		second.logout_time = timezone.now()
+		second.save()
+		with self.assertNumQueries(0):
+			self.assertFalse(employee.is_active())
+
+
+class EmployeeLoginPathTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.employee = Employee.objects.create(
+			name='Storm', mobile_number='9876900001', salary=Decimal('12000.00'), joining_date=date(2024, 1, 1),
+		)
+		earlier = timezone.now() - timedelta(hours=3)
+		self.old_sessions = [
+			AttendanceSession.objects.create(employee=self.employee, login_time=earlier + timedelta(minutes=i))
+			for i in range(3)
+		]
+		self.old_break = BreakSession.objects.create(employee=self.employee, start_time=earlier + timedelta(hours=1))
+		self.newer_break = BreakSession.objects.create(employee=self.employee, start_time=earlier + timedelta(hours=2))
+
+	def _login(self):
+		from django.contrib.auth.models import AnonymousUser
+		from .views import _complete_employee_login
+		request = RequestFactory().post('/')
+		request.session = {}
+		request.user = AnonymousUser()
+		_complete_employee_login(request, self.employee)
+		return request
+
+	def test_login_closes_sessions_and_last_break_set_based(self):
+		from auditlog.models import LogEntry
+		entries_before = LogEntry.objects.count()
+		request = self._login()
+
+		new_session = AttendanceSession.objects.get(employee=self.employee, logout_time__isnull=True)
+		self.assertEqual(request.session['attendance_session_id'], new_session.pk)
+		self.assertEqual(get_active_attendance_session_id(self.employee.employee_id), new_session.pk)
+		for session in self.old_sessions:
+			session.refresh_from_db()
+			self.assertTrue(session.session_closed)
+			self.assertEqual(session.session_status, 'ended')
+			self.assertEqual(session.logout_time, new_session.login_time)
+		self.newer_break.refresh_from_db()
+		self.old_break.refresh_from_db()
+		self.assertEqual(self.newer_break.end_time, new_session.login_time)
+		self.assertTrue(self.newer_break.ended_by_login)
+		self.assertIsNone(self.old_break.end_time)
+
+		# Only the login entry, written in the login transaction; the non-staff session insert writes none
+		self.assertEqual(LogEntry.objects.count(), entries_before + 1)
+		entry = LogEntry.objects.latest('pk')
+		self.assertEqual(entry.changes, {'message': 'User login via OTP'})
+		self.assertEqual(entry.object_id, self.employee.pk)
+
+	def test_login_query_count_does_not_grow_with_open_sessions(self):
+		self._login()
+		BreakSession.objects.filter(employee=self.employee).update(end_time=timezone.now())
+		with CaptureQueriesContext(connection) as one_open:
+			self._login()
+		AttendanceSession.objects.bulk_create([
+			AttendanceSession(employee=self.employee, login_time=timezone.now() - timedelta(minutes=i))
+			for i in range(1, 11)
+		])
+		with CaptureQueriesContext(connection) as eleven_open:
+			self._login()
+		self.assertEqual(AttendanceSession.objects.filter(employee=self.employee, logout_time__isnull=True).count(), 1)
+		self.assertEqual(len(eleven_open), len(one_open))
+
+
+class WorksheetRollupTests(TestCase):
+	def setUp(self):
+		cache.clear()
+		self.employee = Employee.objects.create(
+			name='Rollup', mobile_number='9876910001', salary=Decimal('12000.00'), joining_date=date(2024, 1, 1),
+		)
+		self.day = timezone.localdate() - timedelta(days=1)
+
+	def _entry(self, **fields):
+		values = {
+			'employee': self.employee, 'date': self.day, 'department_name': 'Forms', 'service': 'Caste',
+			'amount': Decimal('100.00'), 'payment': Decimal('90.00'), 'stocks_used': 1,
+		}
+		values.update(fields)
+		return Worksheet.objects.create(**values)
+
+	def _cells(self):
+		return sorted(WorksheetRollup.objects.values_list(
+			'employee_id', 'department_name', 'service', 'date', 'amount', 'payment', 'approved_amount',
+			'stocks_used', 'entry_count',
+		))
+
+	def test_cells_follow_inserts_updates_and_deletes(self):
+		first = self._entry(approved=True)
+		self._entry(amount=Decimal('50.00'), stocks_used=3)
+		no_service = self._entry(service=None, department_name='Xerox', amount=Decimal('20.00'))
+		self._entry(service='', department_name='Xerox', amount=Decimal('5.00'))
+
+		cell = WorksheetRollup.objects.get(service='Caste')
+		self.assertEqual((cell.amount, cell.payment, cell.approved_amount), (Decimal('150.00'), Decimal('180.00'), Decimal('100.00')))
+		self.assertEqual((cell.stocks_used, cell.entry_count), (4, 2))
+		self.assertEqual(WorksheetRollup.objects.get(department_name='Xerox').amount, Decimal('25.00'))
+		self.assertEqual(forms_stock_usage(self.day), {'Caste': (4, Decimal('150.00'))})
+
+		# Moving an entry to another day refreshes both cells
+		first.date = self.day - timedelta(days=1)
+		first.save()
+		self.assertEqual(WorksheetRollup.objects.get(service='Caste', date=self.day).amount, Decimal('50.00'))
+		self.assertEqual(WorksheetRollup.objects.get(service='Caste', date=first.date).approved_amount, Decimal('100.00'))
+
+		no_service.delete()
+		self.assertEqual(WorksheetRollup.objects.get(department_name='Xerox').entry_count, 1)
+
+		maintained = self._cells()
+		self.assertEqual(rebuild_worksheet_rollup(), len(maintained))
+		self.assertEqual(self._cells(), maintained)
+
+	def test_bulk_approval_and_commission_read_the_rollup(self):
+		self._entry(amount=Decimal('200.00'))
+		self._entry(amount=Decimal('300.00'), service='Income')
+		self.assertEqual(self.employee.get_worksheet_commission(self.day.year, self.day.month), Decimal('0'))
+
+		queryset = Worksheet.objects.filter(employee=self.employee, approved=False)
+		cells = rollup_keys_for(queryset)
+		queryset.update(approved=True)
+		refresh_rollup_cells(cells)
+		with self.assertNumQueries(1):
+			commission = self.employee.get_worksheet_commission(self.day.year, self.day.month)
+		self.assertEqual(commission, Decimal('25.0000'))
+
+	def test_rebuild_command_restores_dropped_rows(self):
+		self._entry()
+		self._entry(date=self.day - timedelta(days=3), service='Income')
+		expected = self._cells()
+		WorksheetRollup.objects.all().delete()
+
+		out = StringIO()
+		call_command('rebuild_worksheet_rollup', '--start', (self.day - timedelta(days=3)).isoformat(), stdout=out)
+		self.assertIn('Wrote 2 worksheet rollup rows', out.getvalue())
+		self.assertEqual(self._cells(), expected)
+
+
+class HotQueryPlanTests(TestCase):
+	"""EXPLAIN QUERY PLAN for the hot filters: each must search an index, never scan a whole table."""
+
+	# "SCAN t USING INDEX open_idx" walks a partial index (open sessions only) and is fine
+	FULL_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)$')
+
+	def _plan(self, queryset):
+		sql, params = queryset.query.sql_with_params()
+		with connection.cursor() as cursor:
+			cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+			return [row[-1] for row in cursor.fetchall()]
+
+	def assertUsesIndex(self, queryset, index=None):
+		plan = self._plan(queryset)
+		scans = [detail for detail in plan if self.FULL_SCAN.match(detail)]
+		self.assertEqual(scans, [], f'full table scan in {plan}')
+		if index:
+			self.assertTrue(any(index in detail for detail in plan), f'{index} unused in {plan}')
+
+	def test_hot_queries_use_indexes(self):
+		today = timezone.localdate()
+		now = timezone.now()
+		month_start = today.replace(day=1)
+		cases = [
+			(Worksheet.objects.filter(employee_id=1, date=today), 'worksheet_employee_date_idx'),
+			(Worksheet.objects.filter(employee_id=1, date__gte=month_start, date__lte=today), 'worksheet_employee_date_idx'),
+			(Worksheet.objects.filter(department_name='Forms', date=today), 'worksheet_department_date_idx'),
+			(Worksheet.objects.filter(token_no='251018001').order_by('-created_at')[:1], 'worksheet_token_no_idx'),
+			(AttendanceSession.objects.filter(
+				employee_id=1, logout_time__isnull=True, session_closed=False,
+			).order_by('-login_time'), 'attendance_open_idx'),
+			(AttendanceSession.objects.filter(
+				employee_id=1, login_time__gte=now - timedelta(days=31), login_time__lt=now,
+			), 'attendance_employee_login_idx'),
+			(stale_sessions(now - timedelta(minutes=15)), 'attendance_open_idx'),
+			(AttendanceSession.objects.filter(logout_time__isnull=True).order_by().values('employee_id')
+				.annotate(since=models.Min('login_time')), 'attendance_open_idx'),
+			(BreakSession.objects.filter(employee_id=1, end_time__isnull=True).order_by('-start_time'), 'break_employee_start_idx'),
+			(BreakSession.objects.filter(
+				employee_id=1, start_time__gte=now - timedelta(days=31), start_time__lt=now,
+			), 'break_employee_start_idx'),
+			(TokenChatMessage.objects.filter(token_id__in=[1, 2, 3]).exclude(sender=TokenChatMessage.SENDER_ADMIN),
+				'tokenchat_token_sender_idx'),
+			(TokenChatMessage.objects.filter(token_id=1).order_by('created_at'), None),
+			(UserNotificationStatus.objects.filter(employee_id=1, is_read=False), 'notification_unread_idx'),
+			(EmployeeTarget.objects.filter(date=today), 'employeetarget_date_idx'),
+			(EmployeeTarget.objects.filter(date__gte=month_start, date__lte=today), 'employeetarget_date_idx'),
+			(EmployeeUpload.objects.filter(renewal_date__lte=today + timedelta(days=30)), 'renewal_date'),
+			(WorksheetRollup.objects.filter(date__gte=month_start, date__lte=today), None),
+		]
+		for queryset, index in cases:
+			with self.subTest(sql=str(queryset.query)):
+				self.assertUsesIndex(queryset, index)
+
+	def test_search_filters_use_indexes(self):
+		cases = [
+			Token.objects.filter(search_q('token', '98765', Q(cell_no__icontains='98765'))),
+			Worksheet.objects.filter(employee_id=1).filter(search_q(
+				'worksheet', '98765', Q(customer_mobile__icontains='98765'), columns=('customer_mobile', 'login_mobile_no'),
+			)),
+			EmployeeUpload.objects.filter(search_q('upload', 'ravi', Q(description__icontains='ravi'))),
+		]
+		for queryset in cases:
+			with self.subTest(sql=str(queryset.query)):
+				self.assertUsesIndex(queryset)
+
+
+class SearchIndexTests(TestCase):
+	def setUp(self):
+		self.employee = Employee.objects.create(
+			name='Search', mobile_number='9876920001', salary=Decimal('12000.00'), joining_date=date(2024, 1, 1),
+		)
+
+	def _token(self, token_no, customer_name, cell_no):
+		return Token.objects.create(token_no=token_no, customer_name=customer_name, cell_no=cell_no)
+
+	def _tokens(self, query):
+		fallback = Q(token_no__icontains=query) | Q(customer_name__icontains=query) | Q(cell_no__icontains=query)
+		return set(Token.objects.filter(search_q('token', query, fallback)).values_list('token_no', flat=True))
+
+	def test_substring_matches_follow_inserts_updates_and_deletes(self):
+		first = self._token('251018001', 'Lakshmi Devi', '9848022338')
+		self._token('251018002', 'Ravi Kumar', '9000011111')
+
+		self.assertEqual(self._tokens('akshm'), {'251018001'})
+		self.assertEqual(self._tokens('RAVI'), {'251018002'})
+		self.assertEqual(self._tokens('2510180'), {'251018001', '251018002'})
+
+		first.customer_name = 'Padma'
+		first.save()
+		self.assertEqual(self._tokens('akshm'), set())
+		self.assertEqual(self._tokens('padma'), {'251018001'})
+
+		# queryset.update() sends no signals; the triggers still see it
+		Token.objects.filter(pk=first.pk).update(cell_no='7331122334')
+		self.assertEqual(self._tokens('9848022'), set())
+		self.assertEqual(self._tokens('31122'), {'251018001'})
+
+		first.delete()
+		self.assertEqual(self._tokens('padma'), set())
+
+	def test_search_ids_ranks_and_falls_back_for_short_queries(self):
+		self._token('251018003', 'Sai Ram', '9440000001')
+		better = self._token('251018004', 'Sai Ram Sai Ram', '9440000002')
+
+		ids = search_ids('token', 'sai ram')
+		self.assertEqual(ids[0], better.pk)
+		self.assertEqual(len(ids), 2)
+		self.assertEqual(search_ids('token', 'sai ram', limit=1), [better.pk])
+
+		self.assertIsNone(search_ids('token', 'sa'))
+		fallback = Q(customer_name__icontains='sa')
+		self.assertIs(search_q('token', 'sa', fallback), fallback)
+
+	def test_column_filter_and_quotes(self):
+		mobile = Worksheet.objects.create(
+			employee=self.employee, department_name='Forms', customer_name='R "9848" Rao', customer_mobile='9848012345',
+		)
+		Worksheet.objects.create(employee=self.employee, department_name='Forms', customer_name='Client 9848012345')
+		columns = ('customer_mobile', 'login_mobile_no')
+
+		self.assertEqual(search_ids('worksheet', '9848012', columns=columns), [mobile.pk])
+		self.assertEqual(len(search_ids('worksheet', '9848012')), 2)
+		self.assertEqual(search_ids('worksheet', '"9848"'), [mobile.pk])
+
+	def test_install_restores_dropped_triggers_and_resyncs(self):
+		token = self._token('251018005', 'Before', '9440000003')
+		with connection.cursor() as cursor:
+			# What a table rebuild in a later migration does to the triggers
+			cursor.execute('DROP TRIGGER search_token_au')
+		Token.objects.filter(pk=token.pk).update(customer_name='After')
+
+		self.assertEqual(install_search_indexes(), ['token'])
+		self.assertEqual(search_ids('token', 'after'), [token.pk])
+		self.assertEqual(search_ids('token', 'before'), [])
+		self.assertEqual(install_search_indexes(), [])
+
+	def test_upload_search_view_matches_names_and_text(self):
+		service = UploadService.objects.create(name='Passport')
+		by_text = EmployeeUpload.objects.create(
+			employee=self.employee, service=None, description='Ration card renewal', file='employee_uploads/a.pdf',
+		)
+		by_service = EmployeeUpload.objects.create(
+			employee=self.employee, service=service, description='Other', file='employee_uploads/b.pdf',
+		)
+		cache.clear()
+		AllowedIP.objects.create(ip_address='0.0.0.0', description='GLOBAL_ALLOW_ALL', is_active=True)
+		admin = User.objects.create_superuser('searchadmin', 'searchadmin@example.com', 'pass')
+		self.client.force_login(admin)
+
+		response = self.client.get(reverse('admin_dashboard_employee_uploads'), {'q': 'ration'})
+		self.assertEqual([upload.pk for upload in response.context['employee_upload_records']], [by_text.pk])
+		response = self.client.get(reverse('admin_dashboard_employee_uploads'), {'q': 'passp'})
+		self.assertEqual([upload.pk for upload in response.context['employee_upload_records']], [by_service.pk])
+
+
+class CustomerIndexTests(TestCase):
+	def setUp(self):
+		self.employee = Employee.objects.create(
+			name='Counter', mobile_number='9876930001', salary=Decimal('12000.00'), joining_date=date(2024, 1, 1),
+		)
+
+	def _customer(self, mobile):
+		return Customer.objects.get(mobile=mobile)
+
+	def test_normalize_mobile(self):
+		self.assertEqual(normalize_mobile('+91 98480-22338'), '9848022338')
+		self.assertEqual(normalize_mobile('09848022338'), '9848022338')
+		self.assertEqual(normalize_mobile('9848022338'), '9848022338')
+		self.assertIsNone(normalize_mobile('12345'))
+		self.assertIsNone(normalize_mobile('449848022338'))
+		self.assertIsNone(normalize_mobile(None))
+
+	def test_records_in_any_format_link_to_one_customer(self):
+		Token.objects.create(token_no='251018101', customer_name='Lakshmi', cell_no='98480 22338')
+		entry = Worksheet.objects.create(
+			employee=self.employee, department_name='Forms', customer_name='Lakshmi Devi',
+			customer_mobile='+919848022338', login_mobile_no='9848022338',
+		)
+		Application.objects.create(
+			customer_name='Lakshmi D', customer_mobile_number='09848022338', total_commission=Decimal('50.00'),
+		)
+		group = TTDGroupSeva.objects.create(planned_date=date(2026, 11, 1), num_members=1)
+		TTDGroupMember.objects.create(group=group, name='Lakshmi', mobile_number='9848022338', aadhar_number='123412341234')
+
+		customer = self._customer('9848022338')
+		# The worksheet's customer and login mobiles are the same number: one link, not two
+		self.assertEqual(
+			(customer.token_count, customer.worksheet_count, customer.application_count, customer.ttd_count, customer.upload_count),
+			(1, 1, 1, 1, 0),
+		)
+		self.assertEqual(customer.name, 'Lakshmi')
+		self.assertLessEqual(customer.first_seen, customer.last_seen)
+
+		# Moving the entry to another number moves its link
+		entry.customer_mobile = '7000000001'
+		entry.login_mobile_no = ''
+		entry.save()
+		self.assertEqual(self._customer('9848022338').worksheet_count, 0)
+		self.assertEqual(self._customer('7000000001').worksheet_count, 1)
+		self.assertEqual(self._customer('7000000001').name, 'Lakshmi Devi')
+
+		entry.delete()
+		self.assertFalse(Customer.objects.filter(mobile='7000000001').exists())
+		group.delete()
+		self.assertEqual(self._customer('9848022338').ttd_count, 0)
+
+	def test_history_is_one_lookup_per_source(self):
+		for number in range(3):
+			Token.objects.create(token_no=f'25101820{number}', customer_name='Ravi', cell_no='9000011111')
+		Worksheet.objects.create(employee=self.employee, department_name='Forms', customer_mobile='9000011111')
+		EmployeeUpload.objects.create(employee=self.employee, description='Ration card', file='a.pdf', mobile_number='9000011111')
+		Token.objects.create(token_no='251018299', customer_name='Other', cell_no='9000022222')
+
+		with self.assertNumQueries(5):
+			customer, history = customer_history('+91 90000 11111')
+		self.assertEqual(customer.token_count, 3)
+		self.assertEqual([token.token_no for token in history['token']], ['251018202', '251018201', '251018200'])
+		self.assertEqual(len(history['worksheet']), 1)
+		self.assertEqual(len(history['upload']), 1)
+		self.assertEqual(customer_history('12345'), (None, {}))
+
+	def test_rebuild_matches_incremental_index(self):
+		Token.objects.create(token_no='251018301', customer_name='Sai', cell_no='9440000001')
+		Worksheet.objects.create(employee=self.employee, department_name='Forms', customer_name='Sai Ram', customer_mobile='9440000001')
+		TTDIndividualDarshan.objects.create(
+			name='Sai', mobile_number='9440000002', aadhar_number='123412341234', planned_date=date(2026, 11, 2), slot_time='06:00',
+		)
+		fields = ('mobile', 'name', 'token_count', 'worksheet_count', 'upload_count', 'application_count', 'ttd_count')
+		incremental = sorted(Customer.objects.values_list(*fields))
+		links = sorted(CustomerRecord.objects.values_list('customer__mobile', 'source', 'object_id'))
+
+		self.assertEqual(rebuild_customer_index(), 2)
+		self.assertEqual(sorted(Customer.objects.values_list(*fields)), incremental)
+		self.assertEqual(sorted(CustomerRecord.objects.values_list('customer__mobile', 'source', 'object_id')), links)
+
+	def test_history_lookup_view(self):
+		cache.clear()
+		AllowedIP.objects.create(ip_address='0.0.0.0', description='GLOBAL_ALLOW_ALL', is_active=True)
+		Token.objects.create(token_no='251018401', customer_name='Padma', cell_no='9550000001')
+		self.assertEqual(self.client.get(reverse('customer_history_lookup'), {'mobile': '9550000001'}).status_code, 403)
+
+		session = self.client.session
+		session['employee_id'] = self.employee.employee_id
+		session.save()
+		response = self.client.get(reverse('customer_history_lookup'), {'mobile': '95500 00001'})
+		self.assertEqual(response.status_code, 200)
+		payload = response.json()
+		self.assertEqual(payload['customer']['name'], 'Padma')
+		self.assertEqual([token['token_no'] for token in payload['history']['token']], ['251018401'])
+		self.assertEqual(self.client.get(reverse('customer_history_lookup'), {'mobile': '9550000002'}).status_code, 404)
+
+
+def _file_database(test, alias):
+	"""
+	Registers a scratch file-backed SQLite database under `alias` for the
+	duration of `test`. The test database is shared-cache in-memory SQLite,
+	which fails a second writer with "table is locked" instead of making it
+	wait, and runs inside the test case's own transaction; a file database
+	behaves as production does on both counts.
+	"""
+	directory = tempfile.TemporaryDirectory()
+	connections.settings[alias] = {
+		**connections.settings[DEFAULT_DB_ALIAS], 'NAME': str(Path(directory.name) / f'{alias}.sqlite3'),
+	}
+
+	def drop():
+		connections[alias].close()
+		del connections[alias]
+		del connections.settings[alias]
+		directory.cleanup()
+
+	test.addCleanup(drop)
+	test.enterContext(patch.object(type(test), 'databases', test.databases | {alias}))
+	return alias
+
+
+class TokenSequenceTests(TestCase):
+	def test_sequence_continues_after_tokens_issued_before_it(self):
+		prefix = timezone.localdate().strftime('%y%m%d')
+		Token.objects.create(token_no=f'{prefix}041', customer_name='Earlier', cell_no='9000000001')
+
+		self.assertEqual(generate_token_no(), f'{prefix}042')
+		self.assertEqual(Token.objects.create(customer_name='Next', cell_no='9000000002').token_no, f'{prefix}043')
+		self.assertEqual(TokenSequence.objects.get(date=timezone.localdate()).last_value, 43)
+
+	def test_building_tokens_draws_no_number(self):
+		TokenNamingForm()
+		TokenNamingForm(data={'customer_name': ''}).is_valid()
+		Token(customer_name='Unsaved', cell_no='9000000003')
+		self.assertFalse(TokenSequence.objects.exists())
+
+	def test_failed_insert_gives_its_number_back(self):
+		prefix = timezone.localdate().strftime('%y%m%d')
+		with patch('django.db.models.Model.save', side_effect=DatabaseError('insert failed')):
+			with self.assertRaises(DatabaseError):
+				Token(customer_name='Lost', cell_no='9000000004').save()
+		self.assertFalse(TokenSequence.objects.exists())
+		self.assertEqual(Token.objects.create(customer_name='Kept', cell_no='9000000005').token_no, f'{prefix}001')
+
+	def test_allocation_is_one_write(self):
+		generate_token_no()
+		with CaptureQueriesContext(connection) as queries:
+			generate_token_no()
+		statements = [query['sql'] for query in queries if not query['sql'].startswith(('SAVEPOINT', 'RELEASE SAVEPOINT'))]
+		self.assertEqual(len(statements), 1)
+		self.assertTrue(statements[0].startswith('INSERT INTO'))
+
+	def test_daily_limit_rolls_back(self):
+		TokenSequence.objects.create(date=timezone.localdate(), last_value=999)
+		with self.assertRaises(ValueError):
+			generate_token_no()
+		self.assertEqual(TokenSequence.objects.get(date=timezone.localdate()).last_value, 999)
+
+	def _token_database(self):
+		alias = _file_database(self, 'token_sequence_race')
+		with connections[alias].schema_editor() as editor:
+			editor.create_model(Token)
+			editor.create_model(TokenSequence)
+		return alias
+
+	def test_concurrent_counters_get_unique_gapless_numbers(self):
+		alias = self._token_database()
+		# Three days' worth, since a day tops out at 999 tokens
+		days = [date(2026, 10, 16), date(2026, 10, 17), date(2026, 10, 18)]
+		threads_per_day, per_thread = 4, 240
+		issued = []
+		errors = []
+		lock = threading.Lock()
+		start = threading.Barrier(len(days) * threads_per_day)
+		current = threading.local()
+
+		def counter(day):
+			current.day = day
+			try:
+				start.wait()
+				numbers = [generate_token_no(alias) for _ in range(per_thread)]
+				with lock:
+					issued.extend(numbers)
+			except Exception as exc:
+				errors.append(exc)
+			finally:
+				connections[alias].close()
+
+		workers = [threading.Thread(target=counter, args=(day,)) for day in days for _ in range(threads_per_day)]
+		with patch('management.models.timezone.localdate', side_effect=lambda: current.day):
+			for worker in workers:
+				worker.start()
+			for worker in workers:
+				worker.join()
+
+		self.assertEqual(errors, [])
+		expected = [
+			f"{day.strftime('%y%m%d')}{sequence:03d}" for day in days for sequence in range(1, threads_per_day * per_thread + 1)
+		]
+		self.assertEqual(sorted(issued), expected)
+
+
+class WriteTransactionTests(TestCase):
+	def test_only_write_transactions_begin_immediate(self):
+		# Outside the test case's own transaction, so the BEGINs actually run
+		alias = _file_database(self, 'write_transaction')
+		other = connections[alias]
+		with CaptureQueriesContext(other) as queries:
+			with write_transaction(alias):
+				with write_transaction(alias):
+					other.cursor().execute('SELECT 1')
+			with transaction.atomic(using=alias):
+				other.cursor().execute('SELECT 1')
+		begins = [query['sql'] for query in queries if query['sql'].startswith('BEGIN')]
+		self.assertEqual(begins, ['BEGIN IMMEDIATE', 'BEGIN'])
+		self.assertIsNone(other.transaction_mode)
@@ -0,0 +1,39 @@
+"""
+write_transaction(): atomic() for blocks that read before they write.
+
+SQLite opens a transaction with a shared (read) lock and upgrades it at
+the first write. If another connection already holds the write lock,
+SQLite fails the upgrade with "database is locked" straight away instead
+of waiting on the busy timeout, since waiting could deadlock. A block
+that starts with BEGIN IMMEDIATE takes the write lock first and queues
+behind other writers instead.
+
+Only the read-then-write blocks use it: IMMEDIATE for every atomic()
+would also make read-only ones (the admin change form, for one) take
+the write lock.
+"""
+from contextlib import contextmanager
+
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+
+
+@contextmanager
+def write_transaction(using=DEFAULT_DB_ALIAS):
+    """atomic() that takes SQLite's write lock at BEGIN; plain atomic() elsewhere or when nested."""
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or connection.in_atomic_block:
+        # Nested blocks run inside the outer transaction's lock
+        with transaction.atomic(using=using):
+            yield
+        return
+
+    connection.ensure_connection()
+    mode = connection.transaction_mode
+    connection.transaction_mode = 'IMMEDIATE'
+    try:
+        with transaction.atomic(using=using):
+            # BEGIN IMMEDIATE has run; later blocks on this connection keep the configured mode
+            connection.transaction_mode = mode
+            yield
+    finally:
+        connection.transaction_mode = mode
@@ -22,6 +22,7 @@ urlpatterns = [
     path('employee/token-search/', views.employee_token_search, name='employee_token_search'),
     path('employee/token-search/update/', views.employee_token_update, name='employee_token_update'),
     path('employee/token-search/upload-image/', views.employee_token_search_upload_image, name='employee_token_search_upload_image'),
+    path('api/customer-history/', views.customer_history_lookup, name='customer_history_lookup'),
     path('employee/attendance/', views.attendance_view, name='attendance'),
     path('employee/sitari-chat/', views.employee_sitari_chat, name='employee_sitari_chat'),
     path('employee/sitari-chat/assignment-check/', views.employee_chat_assignment_check, name='employee_chat_assignment_check'),
@@ -59,6 +60,7 @@ urlpatterns = [
     path('api/geofence_check/', views.geofence_check, name='geofence_check'),
     path('api/chatbot/reply/', views.public_chatbot_reply, name='public_chatbot_reply'),
     path('api/assistant/chat-log/', views.assistant_chat_log, name='assistant_chat_log'),
+    path('metrics/', views.metrics_view, name='metrics'),
 
 
     # Department Head: Top Up Page (renamed)
@@ -82,6 +84,7 @@ urlpatterns = [
     path('admin-dashboard/break-sessions/', views.admin_dashboard_break_sessions, name='admin_dashboard_break_sessions'),
     path('admin-dashboard/log-entries/', views.admin_dashboard_log_entries, name='admin_dashboard_log_entries'),
     path('admin-dashboard/users/', views.admin_dashboard_users, name='admin_dashboard_users'),
+    path('admin-dashboard/request-metrics/', views.admin_dashboard_request_metrics, name='admin_dashboard_request_metrics'),
     path('admin-dashboard/access-areas/', views.admin_dashboard_access_areas, name='admin_dashboard_access_areas'),
     path('admin-dashboard/allowed-ips/', views.admin_dashboard_allowed_ips, name='admin_dashboard_allowed_ips'),
     path('admin-dashboard/employee-uploads/', views.admin_dashboard_employee_uploads, name='admin_dashboard_employee_uploads'),
@@ -1,8 +1,12 @@
 import random
 import requests
+import time
 from datetime import timedelta
 
 from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils import timezone
 
 def generate_otp():
@@ -39,23 +43,226 @@ def format_hour_label(hour):
     return f"{hour_12}:00 {am_pm}"
 
 
+WORKING_DAY_CALENDAR_VERSION_KEY = 'working_day_calendar_version'
+WORKING_DAY_CALENDAR_PAST_DAYS = 31
+WORKING_DAY_CALENDAR_FUTURE_DAYS = 366
+# The version lives in the (per-process) default cache, so also rebuild
+# after this many seconds to pick up holidays saved by other workers.
+WORKING_DAY_CALENDAR_MAX_AGE = 300
+# Longest run of non-working days the calendar looks across at its edges
+WORKING_DAY_MAX_GAP = 14
+
+
+def _is_working_day(day, holiday_dates):
+    return day.weekday() != 6 and day not in holiday_dates  # 6 = Sunday
+
+
+class WorkingDayCalendar:
+    """
+    Next/previous working day for every date in a rolling window around
+    `today`, precomputed from Sundays and admin-declared holidays so each
+    lookup is a dict access.
+    """
+
+    def __init__(self, today, holiday_dates):
+        self.today = today
+        self.start = today - timedelta(days=WORKING_DAY_CALENDAR_PAST_DAYS)
+        self.end = today + timedelta(days=WORKING_DAY_CALENDAR_FUTURE_DAYS)
+        self.holiday_dates = frozenset(holiday_dates)
+
+        first = self.start - timedelta(days=WORKING_DAY_MAX_GAP)
+        last = self.end + timedelta(days=WORKING_DAY_MAX_GAP)
+        days = [first + timedelta(days=offset) for offset in range((last - first).days + 1)]
+        working = [_is_working_day(day, self.holiday_dates) for day in days]
+
+        self._next = {}
+        upcoming = None
+        for day, is_working in zip(reversed(days), reversed(working)):
+            if upcoming is not None:
+                self._next[day] = upcoming
+            if is_working:
+                upcoming = day
+
+        self._previous = {}
+        latest = None
+        for day, is_working in zip(days, working):
+            if latest is not None:
+                self._previous[day] = latest
+            if is_working:
+                latest = day
+
+    def covers(self, day):
+        return self.start <= day <= self.end
+
+    def next_working_day(self, day):
+        return self._next.get(day) if self.covers(day) else None
+
+    def previous_working_day(self, day):
+        return self._previous.get(day) if self.covers(day) else None
+
+
+_working_day_calendar = None
+
+
+def _calendar_version():
+    return cache.get_or_set(WORKING_DAY_CALENDAR_VERSION_KEY, time.time_ns, None)
+
+
+def invalidate_working_day_calendar():
+    """Force the next lookup to rebuild the calendar (called on Holiday changes)."""
+    global _working_day_calendar
+    cache.set(WORKING_DAY_CALENDAR_VERSION_KEY, time.time_ns(), None)
+    _working_day_calendar = None
+
+
+def get_working_day_calendar():
+    """Return this process's calendar, rebuilding it on a new day, a Holiday change or once it is too old."""
+    global _working_day_calendar
+    from .models import Holiday
+
+    today = timezone.localdate()
+    version = _calendar_version()
+    current = _working_day_calendar
+    if (current is None or current[0] != version or current[2].today != today
+            or time.monotonic() - current[1] > WORKING_DAY_CALENDAR_MAX_AGE):
+        start = today - timedelta(days=WORKING_DAY_CALENDAR_PAST_DAYS + WORKING_DAY_MAX_GAP)
+        end = today + timedelta(days=WORKING_DAY_CALENDAR_FUTURE_DAYS + WORKING_DAY_MAX_GAP)
+        holiday_dates = Holiday.objects.filter(date__gte=start, date__lte=end).values_list('date', flat=True)
+        current = (version, time.monotonic(), WorkingDayCalendar(today, holiday_dates))
+        _working_day_calendar = current
+    return current[2]
+
+
 def next_working_day(date):
     """Return the next working day after `date`, skipping Sundays and admin-declared holidays."""
+    candidate = get_working_day_calendar().next_working_day(date)
+    if candidate is not None:
+        return candidate
     from .models import Holiday
-    # Fetch holidays in a 14-day window to avoid repeated DB hits in the loop
+    # Outside the calendar window: fetch holidays in a 14-day window to avoid repeated DB hits in the loop
     holiday_dates = set(
-        Holiday.objects.filter(date__gt=date, date__lte=date + timedelta(days=14))
+        Holiday.objects.filter(date__gt=date, date__lte=date + timedelta(days=WORKING_DAY_MAX_GAP))
         .values_list('date', flat=True)
     )
     candidate = date + timedelta(days=1)
-    while candidate.weekday() == 6 or candidate in holiday_dates:  # 6 = Sunday
+    while not _is_working_day(candidate, holiday_dates):
         candidate += timedelta(days=1)
     return candidate
 
 
-def get_employee_next_day_alert_state(employee, now_local=None):
+def previous_working_day(date):
+    """Return the last working day before `date`, skipping Sundays and admin-declared holidays."""
+    candidate = get_working_day_calendar().previous_working_day(date)
+    if candidate is not None:
+        return candidate
+    from .models import Holiday
+    holiday_dates = set(
+        Holiday.objects.filter(date__lt=date, date__gte=date - timedelta(days=WORKING_DAY_MAX_GAP))
+        .values_list('date', flat=True)
+    )
+    candidate = date - timedelta(days=1)
+    while not _is_working_day(candidate, holiday_dates):
+        candidate -= timedelta(days=1)
+    return candidate
+
+
+@receiver(post_save, sender='management.Holiday')
+@receiver(post_delete, sender='management.Holiday')
+def _holiday_changed(sender, **kwargs):
+    invalidate_working_day_calendar()
+
+
+NEXT_DAY_RESPONSE_CACHE_KEY = 'next_day_response_{employee_id}_{target_date}'
+NEXT_DAY_RESPONSE_CACHE_TIMEOUT = 600
+
+
+def _next_day_response_key(employee_id, target_date):
+    return NEXT_DAY_RESPONSE_CACHE_KEY.format(employee_id=employee_id, target_date=target_date.isoformat())
+
+
+def get_next_day_response(employee, target_date):
+    """
+    Return the employee's EmployeeNextDayAvailability row for `target_date`
+    (or None). Only answers are cached: the cache is per process, so a
+    cached "not answered" would outlive an answer saved in another worker
+    and keep the middleware blocking the employee.
+    """
     from .models import EmployeeNextDayAvailability
 
+    key = _next_day_response_key(employee.employee_id, target_date)
+    response = cache.get(key)
+    if response is None:
+        response = EmployeeNextDayAvailability.objects.filter(
+            employee=employee,
+            target_date=target_date,
+        ).first()
+        if response is not None:
+            cache.set(key, response, NEXT_DAY_RESPONSE_CACHE_TIMEOUT)
+    return response
+
+
+def forget_next_day_responses(employee_ids, target_date):
+    cache.delete_many([_next_day_response_key(employee_id, target_date) for employee_id in set(employee_ids)])
+
+
+@receiver(post_save, sender='management.EmployeeNextDayAvailability')
+@receiver(post_delete, sender='management.EmployeeNextDayAvailability')
+def _next_day_response_changed(sender, instance, **kwargs):
+    forget_next_day_responses([instance.employee_id], instance.target_date)
+
+
+def auto_mark_next_day_availability(now_local=None):
+    """
+    Mark "No" for every unlocked employee who hasn't answered the next-day
+    alert by EMPLOYEE_NEXT_DAY_ALERT_END_HOUR. Runs from the scheduler once
+    the window closes; rows are inserted in one statement and rows answered
+    concurrently are left alone. Returns the number of employees marked.
+    """
+    from .models import Employee, EmployeeNextDayAvailability
+
+    end_hour = getattr(settings, 'EMPLOYEE_NEXT_DAY_ALERT_END_HOUR', 17)
+    if now_local is None:
+        now_local = timezone.localtime(timezone.now())
+    if now_local < now_local.replace(hour=end_hour, minute=0, second=0, microsecond=0):
+        return 0
+
+    target_date = next_working_day(now_local.date())
+    employee_ids = list(
+        Employee.objects.filter(locked=False)
+        .exclude(next_day_availability_records__target_date=target_date)
+        .values_list('employee_id', flat=True)
+    )
+    if not employee_ids:
+        return 0
+
+    responded_at = timezone.now()
+    EmployeeNextDayAvailability.objects.bulk_create(
+        [
+            EmployeeNextDayAvailability(
+                employee_id=employee_id,
+                target_date=target_date,
+                will_come=False,
+                response_source=EmployeeNextDayAvailability.RESPONSE_SOURCE_AUTO,
+                responded_at=responded_at,
+            )
+            for employee_id in employee_ids
+        ],
+        ignore_conflicts=True,
+    )
+    # Rows answered meanwhile were skipped by ignore_conflicts; only this
+    # run's inserts carry its responded_at
+    return EmployeeNextDayAvailability.objects.filter(
+        target_date=target_date,
+        response_source=EmployeeNextDayAvailability.RESPONSE_SOURCE_AUTO,
+        responded_at=responded_at,
+    ).count()
+
+
+def get_employee_next_day_alert_state(employee, now_local=None):
+    """
+    Read-only alert state for `employee`. Missing answers are filled in by
+    auto_mark_next_day_availability, never by this function.
+    """
     start_hour = getattr(settings, 'EMPLOYEE_NEXT_DAY_ALERT_START_HOUR', 16)
     end_hour = getattr(settings, 'EMPLOYEE_NEXT_DAY_ALERT_END_HOUR', 17)
 
@@ -76,21 +283,10 @@ def get_employee_next_day_alert_state(employee, now_local=None):
     start_at = now_local.replace(hour=start_hour, minute=0, second=0, microsecond=0)
     end_at = now_local.replace(hour=end_hour, minute=0, second=0, microsecond=0)
 
-    response = EmployeeNextDayAvailability.objects.filter(
-        employee=employee,
-        target_date=target_date,
-    ).first()
-    auto_marked = False
-
-    if now_local >= end_at and response is None:
-        response = EmployeeNextDayAvailability.objects.create(
-            employee=employee,
-            target_date=target_date,
-            will_come=False,
-            response_source=EmployeeNextDayAvailability.RESPONSE_SOURCE_AUTO,
-            responded_at=timezone.now(),
-        )
-        auto_marked = True
+    response = get_next_day_response(employee, target_date)
+    auto_marked = bool(
+        response and response.response_source == response.RESPONSE_SOURCE_AUTO
+    )
 
     pending = start_at <= now_local < end_at and response is None
 
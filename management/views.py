@@ -2,8 +2,12 @@ from django.contrib.auth.decorators import login_required
 from django.contrib.admin.views.decorators import staff_member_required
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
+from django.db import transaction
 from django.db.models import Sum, Prefetch
-from .models import Department, DepartmentTopUp, DepartmentStock, Employee, ServiceType, Worksheet, Token
+from .models import Department, DepartmentTopUp, DepartmentStock, Employee, ServiceType, Worksheet, WorksheetRollup, Token
+from .worksheet_rollup import forms_stock_usage
+from .search import search_q
+from .transactions import write_transaction
 # --- Department Head: Top Up Page ---
 @login_required
 def department_topup_view(request):
@@ -55,19 +59,14 @@ def department_topup_view(request):
         stock_date = timezone.localdate()
     if is_forms_dept:
         dept_service_types = ServiceType.objects.filter(departments=department).order_by('name')
+        day_usage = forms_stock_usage(stock_date)
         for st in dept_service_types:
             stock_obj, _ = DepartmentStock.objects.get_or_create(
                 department=department,
                 service_type=st,
                 defaults={'quantity': 0},
             )
-            day_qs = Worksheet.objects.filter(
-                department_name='Forms',
-                service=st.name,
-                date=stock_date,
-            )
-            used_count = day_qs.aggregate(total=Sum('stocks_used'))['total'] or 0
-            total_amount = day_qs.aggregate(total=Sum('amount'))['total'] or 0
+            used_count, total_amount = day_usage.get(st.name, (0, 0))
             remaining = max(0, stock_obj.quantity - used_count)
             price = stock_obj.price
             from decimal import Decimal
@@ -188,10 +187,11 @@ def admin_leave_management(request):
 # --- Admin Dashboard ---
 def _build_admin_dashboard_context():
     employees = Employee.objects.select_related('department').filter(locked=False).order_by('name')
+    presence = get_presence()
     employee_data = [
         {
             'employee': emp,
-            'is_active': emp.is_active(),
+            'is_active': emp.employee_id in presence,
         }
         for emp in employees
     ]
@@ -283,11 +283,13 @@ def admin_dashboard(request):
     if selected_employee_id.isdigit():
         tokens_qs = tokens_qs.filter(operator_name_id=int(selected_employee_id))
     if query:
-        tokens_qs = tokens_qs.filter(
+        tokens_qs = tokens_qs.filter(search_q(
+            'token',
+            query,
             Q(token_no__icontains=query)
             | Q(customer_name__icontains=query)
-            | Q(cell_no__icontains=query)
-        )
+            | Q(cell_no__icontains=query),
+        ))
 
     selected_chat_token = None
     if selected_token_no:
@@ -471,6 +473,65 @@ def admin_token_search(request):
     return JsonResponse(_build_token_search_payload(token, '%d-%m-%Y %H:%M'))
 
 
+def _customer_record_payload(source, record):
+    datetime_format = '%d-%m-%Y %H:%M'
+    if source == 'token':
+        return {'id': record.pk, 'token_no': record.token_no, 'name': record.customer_name,
+                'date': timezone.localtime(record.created_at).strftime(datetime_format)}
+    if source == 'worksheet':
+        return {'id': record.pk, 'token_no': record.token_no or '', 'name': record.customer_name or '',
+                'department': record.department_name, 'service': record.service or '',
+                'amount': str(record.amount), 'date': record.date.strftime('%d-%m-%Y') if record.date else '-'}
+    if source == 'upload':
+        return {'id': record.pk, 'description': record.description, 'renewal_date':
+                record.renewal_date.strftime('%d-%m-%Y') if record.renewal_date else '-',
+                'date': timezone.localtime(record.uploaded_at).strftime(datetime_format)}
+    if source == 'application':
+        return {'id': record.pk, 'name': record.customer_name, 'approved': record.approved,
+                'date': timezone.localtime(record.date_created).strftime(datetime_format)}
+    if source == 'ttd_member':
+        return {'id': record.pk, 'name': record.name, 'group_id': record.group_id,
+                'date': record.group.planned_date.strftime('%d-%m-%Y')}
+    return {'id': record.pk, 'name': record.name, 'slot_time': record.slot_time,
+            'date': record.planned_date.strftime('%d-%m-%Y')}
+
+
+def customer_history_lookup(request):
+    from django.http import JsonResponse
+    from .customers import customer_history
+
+    # Counter staff (employee sessions) and admins both look customers up
+    if not (request.session.get('employee_id') or (request.user.is_authenticated and request.user.is_staff)):
+        return JsonResponse({'error': 'Unauthorized'}, status=403)
+
+    mobile = (request.GET.get('mobile') or '').strip()
+    if not mobile:
+        return JsonResponse({'error': 'Mobile number is required.'}, status=400)
+
+    customer, history = customer_history(mobile)
+    if not customer:
+        return JsonResponse({'error': 'Customer not found.'}, status=404)
+
+    datetime_format = '%d-%m-%Y %H:%M'
+    return JsonResponse({
+        'customer': {
+            'mobile': customer.mobile,
+            'name': customer.name,
+            'first_seen': timezone.localtime(customer.first_seen).strftime(datetime_format),
+            'last_seen': timezone.localtime(customer.last_seen).strftime(datetime_format),
+            'token_count': customer.token_count,
+            'worksheet_count': customer.worksheet_count,
+            'upload_count': customer.upload_count,
+            'application_count': customer.application_count,
+            'ttd_count': customer.ttd_count,
+        },
+        'history': {
+            source: [_customer_record_payload(source, record) for record in records]
+            for source, records in history.items()
+        },
+    })
+
+
 def admin_token_update(request):
     import json
     from django.http import JsonResponse
@@ -1364,10 +1425,9 @@ def admin_employee_edit(request, employee_id):
             payment_type='commission',
         ).aggregate(total=Sum('amount'))['total'] or Decimal('0.00')
 
-        earnings = emp.get_current_month_earnings(now.year, now.month)
         commission_earned = (
-            (earnings.get('application_commissions') or Decimal('0.00')) +
-            (earnings.get('worksheet_commissions') or Decimal('0.00'))
+            emp.get_application_commission(now.year, now.month) +
+            emp.get_worksheet_commission(now.year, now.month)
         )
         commission_due = commission_earned - month_commission_paid
         month_salary_payments = list(
@@ -1810,6 +1870,21 @@ def geofence_check(request):
     logger.warning("User is out of all access areas.")
     return JsonResponse({'allowed': False, 'reason': 'You are out of the access area.'})
 from django.views.decorators.csrf import csrf_exempt
+
+
+def _open_attendance_session_id(employee_id):
+    """The employee's open AttendanceSession id from the registry, else the DB."""
+    session_id = get_active_attendance_session_id(employee_id)
+    if session_id is None:
+        session_id = AttendanceSession.objects.filter(
+            employee_id=employee_id,
+            logout_time__isnull=True,
+            session_closed=False
+        ).order_by('-login_time').values_list('pk', flat=True).first()
+        set_active_attendance_session(employee_id, session_id)
+    return session_id or None
+
+
 # --- Session Refresh Endpoint ---
 @csrf_exempt
 def refresh_session(request):
@@ -1818,17 +1893,12 @@ def refresh_session(request):
         if not employee_id:
             return JsonResponse({'status': 'not-logged-in'}, status=401)
         now = timezone.now()
-        session = AttendanceSession.objects.filter(
-            employee_id=employee_id,
-            logout_time__isnull=True,
-            session_closed=False
-        ).order_by('-login_time').first()
-        if session:
-            session.session_expires_at = now + timedelta(minutes=60)
-            session.refreshed_at = now
-            session.session_status = "refreshed"
-            session.save(update_fields=["session_expires_at", "refreshed_at", "session_status"])
-            return JsonResponse({'status': 'refreshed', 'expires_at': session.session_expires_at})
+        session_id = _open_attendance_session_id(employee_id)
+        if session_id:
+            expires_at = now + timedelta(minutes=60)
+            # Buffered; flushed with other tabs' heartbeats in one UPDATE
+            record_refresh(session_id, now, expires_at)
+            return JsonResponse({'status': 'refreshed', 'expires_at': expires_at})
         return JsonResponse({'status': 'no-active-session'}, status=404)
     return JsonResponse({'status': 'invalid-method'}, status=405)
 from django.shortcuts import render, redirect
@@ -1843,6 +1913,13 @@ from .models import Invoice
 from django.http import JsonResponse
 from .forms import InvoiceForm, ParticularFormSet,WorksheetEntryEditForm
 from .utils import generate_otp, send_otp_whatsapp, get_employee_next_day_alert_state, next_working_day
+from .employee_context import get_request_employee
+from .attendance_registry import (
+    clear_active_attendance_session, get_active_attendance_session_id, get_presence, mark_employee_online,
+    set_active_attendance_session,
+)
+from .attendance_summary import refresh_break_days, refresh_session_days
+from .heartbeats import record_ping, record_refresh
 from .models import Employee,AttendanceSession, BreakSession, Application, ApplicationAssignment, ChatMessage, Commission,Worksheet
 from django.views.decorators.csrf import csrf_exempt
 from decimal import Decimal
@@ -1949,55 +2026,86 @@ def _clear_employee_login_otp(request):
     request.session.pop('employee_login_otp_employee', None)
 
 
-def _complete_employee_login(request, employee):
+def _record_employee_audit_entry(request, employee, message):
     from auditlog.models import LogEntry
     from django.contrib.contenttypes.models import ContentType
 
-    request.session['employee_id'] = employee.employee_id
-    now = timezone.now()
-
-    open_attendance_sessions = AttendanceSession.objects.filter(
-        employee=employee,
-        logout_time__isnull=True,
-        session_closed=False
-    )
-    for old_session in open_attendance_sessions:
-        old_session.logout_time = now
-        old_session.logout_reason = "New Login Override (Logged in from another device)"
-        old_session.session_closed = True
-        old_session.session_status = "ended"
-        old_session.save(update_fields=["logout_time", "logout_reason", "session_closed", "session_status"])
-
+    # Created directly, so auditlog_signals doesn't discard it for non-staff requests
     LogEntry.objects.create(
         actor=request.user if request.user.is_authenticated else None,
-        action=4,
+        action=4,  # Custom action code for login/logout events
         content_type=ContentType.objects.get_for_model(Employee),
         object_id=employee.pk,
         object_repr=str(employee),
         remote_addr=getattr(request, 'auditlog_ip', None),
-        changes={'message': 'User login via OTP'},
+        changes={'message': message},
     )
 
-    last_break = BreakSession.objects.filter(
-        employee=employee,
-        end_time__isnull=True
-    ).order_by('-start_time').first()
-    if last_break:
-        last_break.end_time = now
-        last_break.ended_by_login = True
-        last_break.save()
-
-    new_session = AttendanceSession.objects.create(
-        employee=employee,
-        login_time=now,
-        logout_time=None,
-        logout_reason="",
-        session_closed=False,
-        session_expires_at=now + timedelta(minutes=60),
-        refreshed_at=now,
-        session_status="active"
-    )
+
+def _audit_discarded(request):
+    """auditlog_signals deletes model-change entries from non-staff requests, so skip writing them."""
+    user = getattr(request, 'user', None)
+    return not (user and user.is_authenticated and (user.is_staff or user.is_superuser))
+
+
+def _complete_employee_login(request, employee):
+    from auditlog.context import disable_auditlog
+
+    request.session['employee_id'] = employee.employee_id
+    now = timezone.now()
+
+    # One short write transaction: close every open session, end the last
+    # open break, open the new session and log the login. Set-based, so no
+    # per-row saves.
+    with write_transaction():
+        closing = list(AttendanceSession.objects.filter(
+            employee=employee,
+            logout_time__isnull=True,
+            session_closed=False
+        ).values_list('pk', 'login_time'))
+        closed_ids = [pk for pk, _ in closing]
+        if closed_ids:
+            AttendanceSession.objects.filter(pk__in=closed_ids).update(
+                logout_time=now,
+                logout_reason="New Login Override (Logged in from another device)",
+                session_closed=True,
+                session_status="ended",
+            )
+
+        last_break = BreakSession.objects.filter(
+            employee=employee,
+            end_time__isnull=True
+        ).order_by('-start_time').values_list('pk', 'start_time').first()
+        if last_break:
+            BreakSession.objects.filter(pk=last_break[0]).update(end_time=now, ended_by_login=True)
+
+        new_session = AttendanceSession(
+            employee=employee,
+            login_time=now,
+            logout_time=None,
+            logout_reason="",
+            session_closed=False,
+            session_expires_at=now + timedelta(minutes=60),
+            refreshed_at=now,
+            session_status="active"
+        )
+        if _audit_discarded(request):
+            with disable_auditlog():
+                new_session.save()
+        else:
+            new_session.save()
+        _record_employee_audit_entry(request, employee, 'User login via OTP')
+
+    # .update() skips post_save, so refresh what the signals would have.
+    # Today's row was already dropped by the new open session's save.
+    today = timezone.localdate(now)
+    earlier_session_ids = [pk for pk, login_time in closing if timezone.localdate(login_time) != today]
+    if earlier_session_ids:
+        refresh_session_days(earlier_session_ids)
+    if last_break and timezone.localdate(last_break[1]) != today:
+        refresh_break_days([last_break[0]])
     request.session['attendance_session_id'] = new_session.id
+    set_active_attendance_session(employee.employee_id, new_session.id)
 
 
 def employee_login(request):
@@ -2100,8 +2208,6 @@ def change_password_verify(request):
 
 @csrf_exempt
 def logout_view(request):
-    from auditlog.models import LogEntry
-    from django.contrib.contenttypes.models import ContentType
     employee_id = request.session.get('employee_id')
     logout_reason = ""
     if request.method == 'POST':
@@ -2124,28 +2230,21 @@ def logout_view(request):
                 active_session.logout_time = now
                 active_session.logout_reason = reason
                 active_session.session_closed = True
-                active_session.save()
-
-                # --- Audit log: logout event (changes as dict for admin compatibility) ---
-                LogEntry.objects.create(
-                    actor=request.user if request.user.is_authenticated else None,
-                    action=4,  # Custom action code for logout event
-                    content_type=ContentType.objects.get_for_model(Employee),
-                    object_id=employee.pk,
-                    object_repr=str(employee),
-                    remote_addr=getattr(request, 'auditlog_ip', None),
-                    changes={'message': f'User logout: {reason}'},
-                )
-                
-                # Start a BreakSession (ends at next login)
-                BreakSession.objects.create(
-                    employee=employee,
-                    start_time=now,
-                    end_time=None,
-                    logout_reason=reason if "idle" not in reason.lower() else "Inactive - Auto Logout",
-                    approved=False,
-                    ended_by_login=False
-                )
+                # Close the session, log the logout and start the break together
+                with transaction.atomic():
+                    active_session.save()
+                    _record_employee_audit_entry(request, employee, f'User logout: {reason}')
+
+                    # Start a BreakSession (ends at next login)
+                    BreakSession.objects.create(
+                        employee=employee,
+                        start_time=now,
+                        end_time=None,
+                        logout_reason=reason if "idle" not in reason.lower() else "Inactive - Auto Logout",
+                        approved=False,
+                        ended_by_login=False
+                    )
+                clear_active_attendance_session(employee.employee_id)
         except Employee.DoesNotExist:
             pass
 
@@ -2197,9 +2296,8 @@ def employee_dashboard(request):
     if not employee_id:
         return redirect('login')
 
-    try:
-        employee = Employee.objects.get(employee_id=employee_id)
-    except Employee.DoesNotExist:
+    employee = get_logged_in_employee(request)
+    if employee is None:
         request.session.flush()
         return redirect('login')
 
@@ -2316,9 +2414,8 @@ def attendance_view(request):
     if not employee_id:
         return redirect('login')
 
-    try:
-        employee = Employee.objects.get(employee_id=employee_id)
-    except Employee.DoesNotExist:
+    employee = get_logged_in_employee(request)
+    if employee is None:
         request.session.flush()
         return redirect('login')
 
@@ -2337,13 +2434,12 @@ def attendance_view(request):
     except Exception as e:
         messages.error(request, f"Could not calculate attendance summary: {e}")
 
-    # 3. Find today's calculated wage from the summary
+    # 3. Today's card only needs today's sessions, whichever month is shown
     todays_calculated_wage = Decimal('0.00')
-    if month == today.month and year == today.year:
-        for record in daily_summary:
-            if record['date'].day == today.day:
-                todays_calculated_wage = record['daily_wage']
-                break
+    try:
+        todays_calculated_wage = employee.get_day_attendance(today.date())[0]['daily_wage']
+    except Exception as e:
+        messages.error(request, f"Could not calculate today's wage: {e}")
     
     # ### END OF THE CRITICAL FIX ###
     
@@ -2408,13 +2504,11 @@ def attendance_ping(request):
     if request.method == "POST":
         employee_id = request.session.get('employee_id')
         if employee_id:
-            from .models import AttendanceSession
-            session = AttendanceSession.objects.filter(
-                employee_id=employee_id, logout_time__isnull=True
-            ).order_by('-login_time').first()
-            if session:
-                session.last_ping = timezone.now()
-                session.save(update_fields=['last_ping'])
+            session_id = _open_attendance_session_id(employee_id)
+            if session_id:
+                now = timezone.now()
+                record_ping(session_id, now)
+                mark_employee_online(employee_id, now)
             return JsonResponse({'status': 'pong'})
     return JsonResponse({'status': 'notpong'}, status=400)
 
@@ -2423,14 +2517,8 @@ def attendance_ping(request):
 # --- Helper Functions ---
 
 def get_logged_in_employee(request):
-    """Retrieves the logged-in employee from the session."""
-    employee_id = request.session.get('employee_id')
-    if not employee_id:
-        return None
-    try:
-        return Employee.objects.get(employee_id=employee_id)
-    except Employee.DoesNotExist:
-        return None
+    """Retrieves the logged-in employee from the request's employee context."""
+    return get_request_employee(request)
 
 def require_employee(view_func):
     """Decorator to ensure an employee is logged in before accessing a view."""
@@ -3103,38 +3191,22 @@ def worksheet_view(request, employee):
         elif end_date_str:
             all_entries = all_entries.filter(date__lte=end_date_str)
         if mobile_filter:
-            all_entries = all_entries.filter(Q(customer_mobile__icontains=mobile_filter) | Q(login_mobile_no__icontains=mobile_filter))
-    
-    # ### START OF THE DEBUGGING FIX ###
+            all_entries = all_entries.filter(search_q(
+                'worksheet',
+                mobile_filter,
+                Q(customer_mobile__icontains=mobile_filter) | Q(login_mobile_no__icontains=mobile_filter),
+                columns=('customer_mobile', 'login_mobile_no'),
+            ))
     
     todays_attendance_wage = Decimal('0.00')
     max_daily_wage = Decimal('0.00')
 
-    print("--- Starting Salary Calculation Debug ---")
-    print(f"Employee: {employee.name}, Salary in DB: {employee.salary}")
-
     try:
-        daily_summary, _, calculated_max_wage = employee.get_daily_attendance_summary(today.year, today.month)
-        
-        max_daily_wage = calculated_max_wage
-        print(f"Calculated Max Daily Wage from model: {max_daily_wage}")
-
-        for record in daily_summary:
-            if record['date'] == today:
-                todays_attendance_wage = record['daily_wage']
-                break
-        
-        print(f"Found Today's Calculated Wage: {todays_attendance_wage}")
-
+        # Only today's sessions and breaks, not the whole month
+        todays_record, max_daily_wage = employee.get_day_attendance(today)
+        todays_attendance_wage = todays_record['daily_wage']
     except Exception as e:
-        # THIS IS THE CRITICAL CHANGE: We now show the error on the screen.
-        error_message = f"An error occurred during salary calculation: {e}"
-        print(error_message) # Also print to console
-        messages.error(request, error_message)
-        
-    print("--- Ending Salary Calculation Debug ---")
-    
-    # ### END OF THE DEBUGGING FIX ###
+        messages.error(request, f"An error occurred during salary calculation: {e}")
 
     # All attendance and break sessions for today (not just active), with duration_str for template
     raw_sessions = AttendanceSession.objects.filter(employee=employee, login_time__date=today).order_by('login_time')
@@ -3194,7 +3266,7 @@ def _build_worksheet_management_context(now_local):
             'total_amount': row['total_amount'] or 0,
             'total_payment': row['total_payment'] or 0,
         }
-        for row in Worksheet.objects.filter(date=today)
+        for row in WorksheetRollup.objects.filter(date=today)
         .values('employee_id')
         .annotate(
             total_amount=models.Sum('amount'),
@@ -3207,13 +3279,13 @@ def _build_worksheet_management_context(now_local):
 
     weekly_totals_map = {
         row['employee_id']: row['total_amount'] or Decimal('0.00')
-        for row in Worksheet.objects.filter(date__gte=week_start, date__lte=today)
+        for row in WorksheetRollup.objects.filter(date__gte=week_start, date__lte=today)
         .values('employee_id')
         .annotate(total_amount=models.Sum('amount'))
     }
     monthly_totals_map = {
         row['employee_id']: row['total_amount'] or Decimal('0.00')
-        for row in Worksheet.objects.filter(date__gte=month_start, date__lte=today)
+        for row in WorksheetRollup.objects.filter(date__gte=month_start, date__lte=today)
         .values('employee_id')
         .annotate(total_amount=models.Sum('amount'))
     }
@@ -3615,7 +3687,7 @@ def admin_dashboard_targets(request):
     }
     yesterday_collections = {
         row['employee_id']: row['total_amount'] or Decimal('0.00')
-        for row in Worksheet.objects.filter(date=yesterday).exclude(employee__worksheet_hidden=True)
+        for row in WorksheetRollup.objects.filter(date=yesterday).exclude(employee__worksheet_hidden=True)
         .values('employee_id')
         .annotate(total_amount=models.Sum('amount'))
     }
@@ -3644,7 +3716,7 @@ def admin_dashboard_targets(request):
 
     today_actuals_map = {
         row['employee_id']: row['total_amount'] or Decimal('0.00')
-        for row in Worksheet.objects.filter(date=today).exclude(employee__worksheet_hidden=True)
+        for row in WorksheetRollup.objects.filter(date=today).exclude(employee__worksheet_hidden=True)
         .values('employee_id')
         .annotate(total_amount=models.Sum('amount'))
     }
@@ -4364,6 +4436,7 @@ def admin_dashboard_break_sessions(request):
                 messages.error(request, 'Please select at least one break session.')
             else:
                 updated_count = BreakSession.objects.filter(pk__in=valid_ids).update(approved=True)
+                refresh_break_days(valid_ids)
                 messages.success(request, f'{updated_count} break session(s) approved successfully.')
             return redirect('admin_dashboard_break_sessions')
 
@@ -4468,6 +4541,30 @@ def admin_dashboard_log_entries(request):
     return render(request, 'admin_dashboard.html', base_context)
 
 
+@staff_member_required
+def metrics_view(request):
+    from .request_metrics import recorder, render_prometheus
+    return HttpResponse(
+        render_prometheus(recorder.summary()),
+        content_type='text/plain; version=0.0.4; charset=utf-8',
+    )
+
+
+@staff_member_required
+def admin_dashboard_request_metrics(request):
+    from .request_metrics import recorder
+
+    window_minutes = request.GET.get('window', '60')
+    window_minutes = int(window_minutes) if window_minutes.isdigit() and int(window_minutes) > 0 else 60
+
+    base_context = _build_admin_dashboard_context()
+    base_context.update({
+        'request_metrics_rows': recorder.summary(window_minutes)[:100],
+        'request_metrics_window': window_minutes,
+    })
+    return render(request, 'admin_dashboard.html', base_context)
+
+
 @staff_member_required
 def admin_dashboard_users(request):
     from django.contrib.auth.models import User
@@ -4687,7 +4784,6 @@ def admin_dashboard_access_areas(request):
 
 @staff_member_required
 def admin_dashboard_allowed_ips(request):
-    from django.core.cache import cache
     from .models import AllowedIP
 
     if request.method == 'POST':
@@ -4699,7 +4795,6 @@ def admin_dashboard_allowed_ips(request):
                 description='GLOBAL_ALLOW_ALL',
                 defaults={'ip_address': '0.0.0.0/0', 'is_active': True},
             )
-            cache.clear()
             messages.success(request, 'IP restrictions are globally disabled. All IPs are now allowed.')
             return redirect('admin_dashboard_allowed_ips')
 
@@ -4709,13 +4804,11 @@ def admin_dashboard_allowed_ips(request):
                 description='GLOBAL_BLOCK',
                 defaults={'ip_address': '0.0.0.0/0', 'is_active': True},
             )
-            cache.clear()
             messages.error(request, 'IP restrictions are globally enabled. ALL IPs are blocked.')
             return redirect('admin_dashboard_allowed_ips')
 
         if action == 'enforce_ip_list':
             AllowedIP.objects.filter(description__in=['GLOBAL_ALLOW_ALL', 'GLOBAL_BLOCK']).delete()
-            cache.clear()
             messages.warning(request, 'Global overrides removed. Access now follows configured IP list.')
             return redirect('admin_dashboard_allowed_ips')
 
@@ -4734,7 +4827,6 @@ def admin_dashboard_allowed_ips(request):
                     description=description,
                     is_active=is_active,
                 )
-                cache.clear()
                 messages.success(request, 'Allowed IP entry added successfully.')
             return redirect('admin_dashboard_allowed_ips')
 
@@ -4756,7 +4848,6 @@ def admin_dashboard_allowed_ips(request):
                 ip_obj.description = description
                 ip_obj.is_active = is_active
                 ip_obj.save(update_fields=['ip_address', 'subnet_prefix', 'description', 'is_active'])
-                cache.clear()
                 messages.success(request, 'Allowed IP entry updated successfully.')
             return redirect('admin_dashboard_allowed_ips')
 
@@ -4764,7 +4855,6 @@ def admin_dashboard_allowed_ips(request):
             ip_id = (request.POST.get('ip_id') or '').strip()
             deleted_count, _ = AllowedIP.objects.filter(pk=ip_id).delete()
             if deleted_count:
-                cache.clear()
                 messages.success(request, 'Allowed IP entry deleted successfully.')
             else:
                 messages.error(request, 'Allowed IP entry not found.')
@@ -4887,12 +4977,17 @@ def admin_dashboard_employee_uploads(request):
     uploads_qs = EmployeeUpload.objects.select_related('employee', 'service').order_by('-uploaded_at')
 
     if query:
+        # Names are matched in their own small tables so the OR stays on upload columns
         uploads_qs = uploads_qs.filter(
-            Q(employee__name__icontains=query)
-            | Q(service__name__icontains=query)
-            | Q(description__icontains=query)
-            | Q(mobile_number__icontains=query)
-            | Q(file__icontains=query)
+            Q(employee__in=Employee.objects.filter(name__icontains=query))
+            | Q(service__in=UploadService.objects.filter(name__icontains=query))
+            | search_q(
+                'upload',
+                query,
+                Q(description__icontains=query)
+                | Q(mobile_number__icontains=query)
+                | Q(file__icontains=query),
+            )
         )
 
     if selected_service_id.isdigit():
@@ -5117,19 +5212,14 @@ def admin_dashboard_stocks_management(request):
     forms_stock_totals = None
     if forms_department:
         forms_services = ServiceType.objects.filter(departments=forms_department).order_by('name')
+        day_usage = forms_stock_usage(stock_date)
         for service_type in forms_services:
             stock_obj, _ = DepartmentStock.objects.get_or_create(
                 department=forms_department,
                 service_type=service_type,
                 defaults={'quantity': 0, 'price': service_type.amount},
             )
-            day_qs = Worksheet.objects.filter(
-                department_name='Forms',
-                service=service_type.name,
-                date=stock_date,
-            )
-            used_count = day_qs.aggregate(total=Sum('stocks_used'))['total'] or 0
-            total_amount = day_qs.aggregate(total=Sum('amount'))['total'] or 0
+            used_count, total_amount = day_usage.get(service_type.name, (0, 0))
             remaining = max(0, stock_obj.quantity - used_count)
             total_cost = Decimal(str(stock_obj.quantity)) * stock_obj.price
 
@@ -5482,11 +5572,13 @@ def admin_dashboard_sitari_chat(request):
     if selected_employee_id.isdigit():
         tokens_qs = tokens_qs.filter(operator_name_id=int(selected_employee_id))
     if query:
-        tokens_qs = tokens_qs.filter(
+        tokens_qs = tokens_qs.filter(search_q(
+            'token',
+            query,
             Q(token_no__icontains=query)
             | Q(customer_name__icontains=query)
-            | Q(cell_no__icontains=query)
-        )
+            | Q(cell_no__icontains=query),
+        ))
 
     selected_chat_token = None
     if selected_token_no:
@@ -5603,11 +5695,13 @@ def employee_sitari_chat(request, employee):
     selected_token_no = (request.GET.get('token') or '').strip()
 
     if query:
-        assigned_tokens_qs = assigned_tokens_qs.filter(
+        assigned_tokens_qs = assigned_tokens_qs.filter(search_q(
+            'token',
+            query,
             Q(token_no__icontains=query)
             | Q(customer_name__icontains=query)
-            | Q(cell_no__icontains=query)
-        )
+            | Q(cell_no__icontains=query),
+        ))
 
     selected_chat_token = None
     if selected_token_no:
@@ -6174,7 +6268,7 @@ def admin_employee_commission_print(request, employee_id, period):
     else:
         return HttpResponseBadRequest("Invalid period. Use 'weekly' or 'monthly'.")
 
-    totals = Worksheet.objects.filter(
+    totals = WorksheetRollup.objects.filter(
         employee=employee,
         date__gte=start_date,
         date__lte=end_date,
@@ -6265,7 +6359,7 @@ def admin_employee_targets(request):
     # Yesterday's collections
     yesterday_collections = {
         row['employee_id']: row['total_amount'] or Decimal('0.00')
-        for row in Worksheet.objects.filter(date=yesterday)
+        for row in WorksheetRollup.objects.filter(date=yesterday)
         .values('employee_id')
         .annotate(total_amount=models.Sum('amount'))
     }
@@ -6298,7 +6392,7 @@ def admin_employee_targets(request):
     # Today's collections
     today_actuals_map = {
         row['employee_id']: row['total_amount'] or Decimal('0.00')
-        for row in Worksheet.objects.filter(date=today)
+        for row in WorksheetRollup.objects.filter(date=today)
         .values('employee_id')
         .annotate(total_amount=models.Sum('amount'))
     }
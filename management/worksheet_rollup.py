@@ -0,0 +1,152 @@
+"""
+WorksheetRollup maintenance: one row per (employee, department_name,
+service, date) holding the sums the reports read.
+
+Worksheet.save()/delete() run inside a transaction, and the receivers
+below re-aggregate the touched cells from the entries in that same
+transaction, so a cell always equals the sum of its entries. An edit that
+moves an entry to another employee, department, service or day refreshes
+both the old and the new cell. queryset.update() paths refresh their
+cells themselves (see rollup_keys_for); rebuild_worksheet_rollup()
+recomputes a date range from scratch.
+"""
+from datetime import datetime
+
+from django.db import transaction
+from django.db.models import Count, Q, Sum
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Worksheet, WorksheetRollup
+from .transactions import write_transaction
+
+
+KEY_FIELDS = ('employee_id', 'department_name', 'service', 'date')
+TOTALS = {
+    'amount': Sum('amount'),
+    'payment': Sum('payment'),
+    'approved_amount': Sum('amount', filter=Q(approved=True)),
+    'stocks_used': Sum('stocks_used'),
+    'entry_count': Count('pk'),
+}
+
+
+def _as_date(value):
+    # Worksheet.date defaults to timezone.now, so it holds a datetime until reloaded
+    if isinstance(value, datetime):
+        return timezone.localtime(value).date()
+    return value
+
+
+def _aliased(aggregates):
+    # Aliases can't reuse the names of the fields being summed
+    return {f'sum_{name}': aggregate for name, aggregate in aggregates.items()}
+
+
+def _unaliased(row):
+    return {name: row[f'sum_{name}'] or 0 for name in TOTALS}
+
+
+def _key(employee_id, department_name, service, day):
+    return (employee_id, department_name, service or '', _as_date(day))
+
+
+def rollup_key(entry):
+    return _key(entry.employee_id, entry.department_name, entry.service, entry.date)
+
+
+def _cell_entries(key):
+    employee_id, department_name, service, day = key
+    entries = Worksheet.objects.filter(employee_id=employee_id, department_name=department_name, date=day)
+    if service:
+        return entries.filter(service=service)
+    return entries.filter(Q(service__isnull=True) | Q(service=''))
+
+
+def refresh_rollup_cells(keys):
+    """Re-aggregate each (employee_id, department_name, service, date) cell from its entries."""
+    with write_transaction():
+        for key in set(keys):
+            cell = dict(zip(KEY_FIELDS, key))
+            values = _unaliased(_cell_entries(key).aggregate(**_aliased(TOTALS)))
+            if not values['entry_count']:
+                WorksheetRollup.objects.filter(**cell).delete()
+                continue
+            if not WorksheetRollup.objects.filter(**cell).update(**values):
+                WorksheetRollup.objects.create(**cell, **values)
+
+
+def rollup_keys_for(queryset):
+    """
+    The cells holding the entries in `queryset`. Read them before a
+    queryset.update() (which sends no signals) and pass them to
+    refresh_rollup_cells() afterwards.
+    """
+    return [_key(*row) for row in queryset.order_by().values_list(*KEY_FIELDS).distinct()]
+
+
+def rollup_totals(**filters):
+    """Sum the rollup rows matching `filters`; every total is 0 when none match."""
+    return _unaliased(WorksheetRollup.objects.filter(**filters).aggregate(
+        **_aliased({name: Sum(name) for name in TOTALS})
+    ))
+
+
+def forms_stock_usage(day, department_name='Forms'):
+    """{service: (stocks used, amount)} for one department's day, for the stock tables."""
+    return {
+        row['service']: (row['used'] or 0, row['total_amount'] or 0)
+        for row in WorksheetRollup.objects.filter(department_name=department_name, date=day)
+        .values('service')
+        .annotate(used=Sum('stocks_used'), total_amount=Sum('amount'))
+    }
+
+
+def rebuild_worksheet_rollup(start=None, end=None, batch_size=1000):
+    """Recompute every rollup row between `start` and `end` (inclusive, both optional)."""
+    entries = Worksheet.objects.order_by()
+    rollups = WorksheetRollup.objects.all()
+    if start:
+        entries, rollups = entries.filter(date__gte=start), rollups.filter(date__gte=start)
+    if end:
+        entries, rollups = entries.filter(date__lte=end), rollups.filter(date__lte=end)
+
+    cells = {}
+    for row in entries.values(*KEY_FIELDS).annotate(**_aliased(TOTALS)).iterator():
+        key = _key(*(row[field] for field in KEY_FIELDS))
+        # NULL and '' services group apart in SQL but share a cell
+        cell = cells.setdefault(key, dict.fromkeys(TOTALS, 0))
+        for name, value in _unaliased(row).items():
+            cell[name] += value
+
+    with transaction.atomic():
+        rollups.delete()
+        WorksheetRollup.objects.bulk_create(
+            (WorksheetRollup(**dict(zip(KEY_FIELDS, key)), **values) for key, values in cells.items()),
+            batch_size=batch_size,
+        )
+    return len(cells)
+
+
+@receiver(pre_save, sender='management.Worksheet')
+def _worksheet_saving(sender, instance, raw=False, **kwargs):
+    instance._rollup_previous_key = None
+    if instance.pk and not raw:
+        previous = Worksheet.objects.filter(pk=instance.pk).values_list(*KEY_FIELDS).first()
+        if previous:
+            instance._rollup_previous_key = _key(*previous)
+
+
+@receiver(post_save, sender='management.Worksheet')
+def _worksheet_saved(sender, instance, **kwargs):
+    keys = [rollup_key(instance)]
+    previous = getattr(instance, '_rollup_previous_key', None)
+    if previous:
+        keys.append(previous)
+    refresh_rollup_cells(keys)
+
+
+@receiver(post_delete, sender='management.Worksheet')
+def _worksheet_deleted(sender, instance, **kwargs):
+    refresh_rollup_cells([rollup_key(instance)])
@@ -37,6 +37,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'management.request_metrics.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
@@ -56,7 +57,9 @@ ROOT_URLCONF = 'project.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates plus the CONTEXT_PROCESSOR_SKIP_TEMPLATES opt-out
+        'BACKEND': 'management.template_context.DjangoTemplates',
+        'NAME': 'django',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -73,6 +76,12 @@ TEMPLATES = [
     },
 ]
 
+# Rendered without the custom context processors' values (partials and print pages)
+CONTEXT_PROCESSOR_SKIP_TEMPLATES = [
+    'partials/worksheet_edit_form.html',
+    'token_print.html',
+]
+
 WSGI_APPLICATION = 'project.wsgi.application'
 
 # Database configuration (SQLite here; can be replaced by PostgreSQL or others)
@@ -98,6 +107,22 @@ WORKSHEET_ENTRY_CUTOFF_HOUR = 17
 EMPLOYEE_NEXT_DAY_ALERT_START_HOUR = 16
 EMPLOYEE_NEXT_DAY_ALERT_END_HOUR = 17
 
+# Per-view request latency / query metrics (see management/request_metrics.py).
+# The SQLite file is shared by every worker process on the host; each
+# process's scheduler flushes its buffer into it every FLUSH_SECONDS.
+REQUEST_METRICS_ENABLED = True
+REQUEST_METRICS_DB_PATH = BASE_DIR / 'request_metrics.sqlite3'
+REQUEST_METRICS_FLUSH_SECONDS = 10
+REQUEST_METRICS_WINDOW_MINUTES = 60
+REQUEST_METRICS_RETENTION_MINUTES = 24 * 60
+
+# attendance_ping/refresh_session writes are buffered per process and
+# flushed as one batched UPDATE this often (see management/heartbeats.py)
+HEARTBEAT_FLUSH_SECONDS = 30
+
+# Uploads listed per section of the admin index renewal alert
+RENEWAL_DIGEST_TOP_N = 20
+
 USE_I18N = True
 
 USE_TZ = True